@@ -0,0 +1 @@
+"""Benchmarks of polkadotetl, run against synthetic blocks from `benchmarks.synthetic`."""
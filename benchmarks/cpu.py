@@ -0,0 +1,218 @@
+"""Microbenchmarks of the CPU-bound paths of polkadotetl.
+
+Runs `enrich_block`, the columnar `enrich_blocks`, `bigquery.process`,
+`bigquery_row`, the `enrich` command, `convert_to_bigquery_schema` and the
+combined `convert_and_enrich` over synthetic blocks of each workload, and
+records the throughput and the peak traced memory of each.
+
+    python -m benchmarks.cpu --output baseline.json
+    python -m benchmarks.cpu --baseline baseline.json
+
+With `--baseline`, the run is compared against an earlier run and exits with
+1 when any benchmark is slower or uses more memory than the tolerance allows.
+Throughput is only comparable between runs on the same machine.
+"""
+import copy
+import json
+import os
+import tempfile
+import time
+import tracemalloc
+import warnings
+from pathlib import Path
+from typing import Callable, Dict, List, Optional
+
+import typer
+
+from polkadotetl.logger import logger
+from polkadotetl.warnings import NoTransactionsWarning
+from benchmarks.synthetic import generate_blocks, write_blocks
+
+app = typer.Typer()
+
+START_BLOCK = 10_000_000
+
+# synthetic block parameters of each workload
+WORKLOADS = {
+    "transfer": dict(mix="transfer", extrinsics=20, events_per_extrinsic=3),
+    "era_payout": dict(mix="era_payout", extrinsics=10, events_per_extrinsic=64),
+    "para_inherent": dict(mix="para_inherent", extrinsics=4, para_inherent_size=100),
+}
+
+
+def bench_enrich_block(blocks: List[dict], directory: Path):
+    from polkadotetl.enrich import enrich_block
+
+    for block in blocks:
+        enrich_block(block)
+
+
+def bench_enrich_blocks(blocks: List[dict], directory: Path):
+    from polkadotetl.enrich.columnar import enrich_blocks
+
+    enrich_blocks(blocks)
+
+
+def bench_process(blocks: List[dict], directory: Path):
+    from polkadotetl.cli.datasources.bigquery import process
+
+    for block in blocks:
+        process(block)
+
+
+def bench_bigquery_row(blocks: List[dict], directory: Path):
+    from polkadotetl.cli.datasources.bigquery import bigquery_row
+
+    for block in blocks:
+        bigquery_row(block)
+
+
+def bench_enrich_command(blocks: List[dict], directory: Path):
+    from polkadotetl.cli import app
+
+    # parse the options like the CLI does, so the benchmark doesn't depend on
+    # every parameter of the command, but skip the app callback that resets the logger
+    command = typer.main.get_command(app).get_command(None, "enrich")
+    command.main(
+        [
+            str(directory / "blocks"),
+            str(directory / "enriched.json"),
+            "--quiet",
+            "--overwrite",
+            "--batch-size",
+            "1000",
+        ],
+        standalone_mode=False,
+    )
+
+
+def bench_convert_to_bigquery_schema(blocks: List[dict], directory: Path):
+    from polkadotetl.cli.datasources.bigquery import convert_to_bigquery_schema
+
+    convert_to_bigquery_schema(directory / "blocks", directory / "bigquery")
+
+
+def bench_convert_and_enrich(blocks: List[dict], directory: Path):
+    from polkadotetl.cli.datasources.bigquery import convert_and_enrich
+
+    convert_and_enrich(
+        directory / "blocks", directory / "combined", directory / "combined.json", quiet=True
+    )
+
+
+# the benchmarks, and whether they mutate the blocks they are given
+BENCHMARKS: Dict[str, Callable[[List[dict], Path], None]] = {
+    "enrich_block": bench_enrich_block,
+    "enrich_blocks": bench_enrich_blocks,
+    "bigquery.process": bench_process,
+    "bigquery_row": bench_bigquery_row,
+    "enrich": bench_enrich_command,
+    "convert_to_bigquery_schema": bench_convert_to_bigquery_schema,
+    "convert_and_enrich": bench_convert_and_enrich,
+}
+MUTATING_BENCHMARKS = {"bigquery.process"}
+
+
+def measure(benchmark, blocks: List[dict], directory: Path, repeat: int) -> dict:
+    """Returns the best throughput of `repeat` runs and the peak memory of one more run."""
+    mutating = benchmark in MUTATING_BENCHMARKS
+    timings = []
+    for _ in range(repeat):
+        run_blocks = copy.deepcopy(blocks) if mutating else blocks
+        start = time.perf_counter()
+        BENCHMARKS[benchmark](run_blocks, directory)
+        timings.append(time.perf_counter() - start)
+    run_blocks = copy.deepcopy(blocks) if mutating else blocks
+    tracemalloc.start()
+    try:
+        BENCHMARKS[benchmark](run_blocks, directory)
+        _, peak_memory = tracemalloc.get_traced_memory()
+    finally:
+        tracemalloc.stop()
+    return dict(
+        blocks_per_second=round(len(blocks) / min(timings), 1),
+        peak_memory_bytes=peak_memory,
+    )
+
+
+def run(blocks: int, repeat: int, workloads: List[str], benchmarks: List[str]) -> dict:
+    """Runs the benchmarks and returns their results by `workload/benchmark`."""
+    results = {}
+    warnings.filterwarnings("ignore", category=NoTransactionsWarning)
+    for workload in workloads:
+        parameters = WORKLOADS[workload]
+        workload_blocks = list(generate_blocks(START_BLOCK, blocks, **parameters))
+        with tempfile.TemporaryDirectory() as directory:
+            directory = Path(directory)
+            write_blocks(directory / "blocks", START_BLOCK, blocks, **parameters)
+            for benchmark in benchmarks:
+                result = measure(benchmark, workload_blocks, directory, repeat)
+                results[f"{workload}/{benchmark}"] = result
+                logger.info(
+                    f"{workload}/{benchmark}: {result['blocks_per_second']:,} blocks/s, "
+                    f"peak memory {result['peak_memory_bytes'] / 2 ** 20:,.1f} MiB"
+                )
+    return results
+
+
+def compare(results: dict, baseline: dict, tolerance: float) -> List[str]:
+    """Returns the regressions of `results` against `baseline`."""
+    regressions = []
+    for name, result in results.items():
+        if name not in baseline:
+            continue
+        expected = baseline[name]
+        if result["blocks_per_second"] < expected["blocks_per_second"] * (1 - tolerance):
+            regressions.append(
+                f"{name} throughput dropped from {expected['blocks_per_second']:,} "
+                f"to {result['blocks_per_second']:,} blocks/s"
+            )
+        if result["peak_memory_bytes"] > expected["peak_memory_bytes"] * (1 + tolerance):
+            regressions.append(
+                f"{name} peak memory grew from {expected['peak_memory_bytes']:,} "
+                f"to {result['peak_memory_bytes']:,} bytes"
+            )
+    return regressions
+
+
+@app.command()
+def main(
+    blocks: int = typer.Option(200, help="Number of synthetic blocks per workload."),
+    repeat: int = typer.Option(3, help="Number of timed runs of each benchmark."),
+    workload: Optional[List[str]] = typer.Option(
+        None, help=f"Only run these workloads, out of {', '.join(WORKLOADS)}."
+    ),
+    benchmark: Optional[List[str]] = typer.Option(
+        None, help=f"Only run these benchmarks, out of {', '.join(BENCHMARKS)}."
+    ),
+    output: Optional[Path] = typer.Option(None, help="Write the results to this json file."),
+    baseline: Optional[Path] = typer.Option(
+        None, exists=True, dir_okay=False, help="Compare the results against this earlier output."
+    ),
+    tolerance: float = typer.Option(
+        0.2, help="Allowed relative drop in throughput and growth in peak memory."
+    ),
+):
+    """Benchmarks the CPU-bound paths over synthetic blocks."""
+    workloads = workload or list(WORKLOADS)
+    benchmarks = benchmark or list(BENCHMARKS)
+    unknown = set(workloads) - set(WORKLOADS) | set(benchmarks) - set(BENCHMARKS)
+    if unknown:
+        logger.error(f"Unknown workloads or benchmarks: {', '.join(sorted(unknown))}")
+        raise typer.Exit(1)
+    results = run(blocks, repeat, workloads, benchmarks)
+    if output is not None:
+        with open(output, "w") as file_buffer:
+            json.dump(results, file_buffer, indent=2)
+    if baseline is not None:
+        with open(baseline) as file_buffer:
+            regressions = compare(results, json.load(file_buffer), tolerance)
+        for regression in regressions:
+            logger.error(regression)
+        if regressions:
+            raise typer.Exit(1)
+        logger.info(f"No regressions against `{baseline}`.")
+
+
+if __name__ == "__main__":
+    app()
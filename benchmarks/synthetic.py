@@ -0,0 +1,186 @@
+"""Deterministic generator of synthetic sidecar block responses.
+
+The blocks have the shape of `/blocks/{n}` responses from the sidecar, so they
+can be fed to `enrich_block`, `bigquery.process` and the CLI commands in tests
+and benchmarks without a sidecar. The same arguments always generate the same
+blocks.
+"""
+import hashlib
+import json
+import os
+import random
+from typing import Iterator, Optional
+
+from polkadotetl.constants import POLKADOT_TREASURY
+
+GENESIS_TIMESTAMP_IN_MS = 1_590_000_000_000
+BLOCK_TIME_IN_MS = 6_000
+VALIDATORS = 32
+ACCOUNTS = 2_000
+
+# event mix: the signed extrinsics of a block, as (weight, pallet, method)
+MIXES = {
+    "transfer": [
+        (80, "balances", "transferKeepAlive"),
+        (15, "balances", "transferAllowDeath"),
+        (5, "utility", "batchAll"),
+    ],
+    "era_payout": [
+        (70, "staking", "payoutStakers"),
+        (30, "balances", "transferKeepAlive"),
+    ],
+    "para_inherent": [
+        (50, "balances", "transferKeepAlive"),
+        (50, "system", "remark"),
+    ],
+}
+
+
+def address(rng: random.Random, pool: int = ACCOUNTS) -> str:
+    """Returns a deterministic, address-like string from a pool of accounts."""
+    return "1" + hashlib.sha256(str(rng.randrange(pool)).encode()).hexdigest()[:46]
+
+
+def block_hash(rng: random.Random) -> str:
+    return "0x" + "%064x" % rng.getrandbits(256)
+
+
+def event(pallet: str, method: str, *data) -> dict:
+    return {
+        "method": {"pallet": pallet, "method": method},
+        "data": list(data),
+        "docs": "",
+    }
+
+
+def extrinsic(rng, pallet, method, args, signer, events, success=True) -> dict:
+    return {
+        "method": {"pallet": pallet, "method": method},
+        "signature": None
+        if signer is None
+        else {"signature": block_hash(rng), "signer": {"id": signer}},
+        "nonce": None if signer is None else str(rng.randrange(10_000)),
+        "args": args,
+        "tip": None if signer is None else "0",
+        "hash": block_hash(rng),
+        "info": {} if signer is None else {"weight": str(rng.randrange(10 ** 9)), "class": "Normal", "partialFee": "150000000"},
+        "era": {"immortalEra": "0x00"} if signer is None else {"mortalEra": ["64", str(rng.randrange(64))]},
+        "events": events,
+        "success": success,
+        "paysFee": signer is not None,
+    }
+
+
+def signed_extrinsic(rng: random.Random, pallet: str, method: str, author: str, events_per_extrinsic: int) -> dict:
+    signer = address(rng)
+    fee = rng.randrange(10 ** 8, 10 ** 9)
+    success = rng.random() > 0.05
+    events = [event("balances", "Withdraw", signer, str(fee))]
+    args = {}
+    if pallet == "balances":
+        receiver = address(rng)
+        amount = str(rng.randrange(10 ** 9, 10 ** 14))
+        args = {"dest": {"id": receiver}, "value": amount}
+        if success:
+            events.append(event("balances", "Transfer", signer, receiver, amount))
+    elif pallet == "utility":
+        calls = []
+        for _ in range(max(events_per_extrinsic, 1)):
+            receiver = address(rng)
+            amount = str(rng.randrange(10 ** 9, 10 ** 12))
+            calls.append({"method": {"pallet": "balances", "method": "transferKeepAlive"}, "args": {"dest": {"id": receiver}, "value": amount}})
+            events.append(event("balances", "Transfer", signer, receiver, amount))
+            events.append(event("utility", "ItemCompleted"))
+        args = {"calls": calls}
+        events.append(event("utility", "BatchCompleted"))
+    elif pallet == "staking":
+        validator = address(rng, VALIDATORS)
+        args = {"validator_stash": validator, "era": str(rng.randrange(1_000))}
+        for _ in range(max(events_per_extrinsic, 1)):
+            destination = rng.choice(["Staked", "Stash", {"Account": address(rng)}])
+            events.append(event("staking", "Rewarded", address(rng), destination, str(rng.randrange(10 ** 8, 10 ** 11))))
+            events.append(event("balances", "Deposit", address(rng), str(rng.randrange(10 ** 8, 10 ** 11))))
+    else:
+        args = {"remark": "0x" + "00" * rng.randrange(8, 64)}
+    events.append(event("balances", "Deposit", author, str(fee // 5)))
+    events.append(event("treasury", "Deposit", str(fee - fee // 5)))
+    events.append(event("transactionPayment", "TransactionFeePaid", signer, str(fee), "0"))
+    events.append(
+        event("system", "ExtrinsicSuccess", {"weight": {"refTime": str(rng.randrange(10 ** 9))}, "class": "Normal", "paysFee": "Yes"})
+        if success
+        else event("system", "ExtrinsicFailed", {"module": {"index": "5", "error": "0x02000000"}}, {})
+    )
+    return extrinsic(rng, pallet, method, args, signer, events, success)
+
+
+def para_inherent(rng: random.Random, size: int) -> dict:
+    """Returns a `paraInherent.enter` extrinsic with roughly `size` backed candidates."""
+    candidates = [
+        {
+            "candidate": {
+                "descriptor": {"paraId": str(2000 + index), "relayParent": block_hash(rng), "povHash": block_hash(rng), "signature": "0x" + "%0128x" % rng.getrandbits(512)},
+                "commitments": {"upwardMessages": [], "horizontalMessages": [], "newValidationCode": None, "headData": "0x" + "%0256x" % rng.getrandbits(1024), "processedDownwardMessages": "0", "hrmpWatermark": str(rng.randrange(10 ** 7))},
+            },
+            "validityVotes": [{"explicit": "0x" + "%0128x" % rng.getrandbits(512)} for _ in range(5)],
+            "validatorIndices": "0x" + "ff" * 8,
+        }
+        for index in range(size)
+    ]
+    args = {"data": {"bitfields": [{"payload": "0x" + "ff" * 16, "validatorIndex": str(index), "signature": block_hash(rng)} for index in range(size)], "backedCandidates": candidates, "disputes": [], "parentHeader": {"parentHash": block_hash(rng), "number": str(rng.randrange(10 ** 7))}}}
+    events = [event("paraInclusion", "CandidateIncluded", {"descriptor": {"paraId": str(2000 + index)}}, "0x00", "0", "0") for index in range(size)]
+    events.append(event("system", "ExtrinsicSuccess", {"weight": {"refTime": "0"}, "class": "Mandatory", "paysFee": "Yes"}))
+    return extrinsic(rng, "paraInherent", "enter", args, None, events)
+
+
+def generate_block(
+    block_number: int,
+    extrinsics: int = 10,
+    events_per_extrinsic: int = 3,
+    mix: str = "transfer",
+    para_inherent_size: Optional[int] = None,
+    seed: int = 0,
+) -> dict:
+    """Generates the sidecar response of one block.
+
+    `extrinsics` is the number of signed extrinsics, `events_per_extrinsic`
+    is the number of transfers of a batch or rewards of a payout, `mix` is one
+    of `MIXES`, and `para_inherent_size` is the number of backed candidates in
+    the `paraInherent.enter` extrinsic (which defaults to 5, or 50 for the
+    `para_inherent` mix)."""
+    rng = random.Random(f"{seed}:{block_number}")
+    author = address(rng, VALIDATORS)
+    if para_inherent_size is None:
+        para_inherent_size = 50 if mix == "para_inherent" else 5
+    weights, pallet_methods = zip(*[(weight, (pallet, method)) for weight, pallet, method in MIXES[mix]])
+    timestamp = extrinsic(rng, "timestamp", "set", {"now": str(GENESIS_TIMESTAMP_IN_MS + block_number * BLOCK_TIME_IN_MS)}, None, [event("system", "ExtrinsicSuccess", {"weight": {"refTime": "0"}, "class": "Mandatory", "paysFee": "Yes"})])
+    block_extrinsics = [timestamp, para_inherent(rng, para_inherent_size)]
+    for _ in range(extrinsics):
+        pallet, method = rng.choices(pallet_methods, weights)[0]
+        block_extrinsics.append(signed_extrinsic(rng, pallet, method, author, events_per_extrinsic))
+    return {
+        "number": str(block_number),
+        "hash": block_hash(rng),
+        "parentHash": block_hash(rng),
+        "stateRoot": block_hash(rng),
+        "extrinsicsRoot": block_hash(rng),
+        "authorId": author,
+        "logs": [{"type": "PreRuntime", "index": "6", "value": ["0x42414245", block_hash(rng)]}],
+        "onInitialize": {"events": []},
+        "extrinsics": block_extrinsics,
+        "onFinalize": {"events": [event("balances", "Deposit", POLKADOT_TREASURY, str(rng.randrange(10 ** 10)))] if mix == "era_payout" else []},
+        "finalized": True,
+    }
+
+
+def generate_blocks(start_block: int, count: int, **kwargs) -> Iterator[dict]:
+    """Generates the responses of `count` consecutive blocks. See `generate_block` for the arguments."""
+    for block_number in range(start_block, start_block + count):
+        yield generate_block(block_number, **kwargs)
+
+
+def write_blocks(directory, start_block: int, count: int, **kwargs):
+    """Writes generated blocks to a directory, like `export-blocks` does."""
+    os.makedirs(directory, exist_ok=True)
+    for block in generate_blocks(start_block, count, **kwargs):
+        with open(os.path.join(directory, f"{block['number']}.json"), "w") as file_buffer:
+            file_buffer.write(json.dumps(block))
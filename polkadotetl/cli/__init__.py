@@ -1,25 +1,33 @@
 """polkadotetl CLI built using Typer"""
 from datetime import datetime
 from pathlib import Path
-import glob
+from typing import List
+from itertools import islice
 import json
 import logging
-import os
 import sys
 import warnings
 
 import typer
-from polkadotetl.constants import SIDECAR_RETRIES
+from polkadotetl.constants import SIDECAR_RETRIES, SIDECAR_RETRY_DELAY_IN_SECONDS
 from polkadotetl.warnings import NoTransactionsWarning
 from polkadotetl.logger import logger
 from polkadotetl.exceptions import InvalidInput
 from polkadotetl.constants import SIDECAR_RETRIES
+from polkadotetl.core.layout import Layout
+from polkadotetl.core.sources import iter_blocks
+from polkadotetl.export.internals import Partition
 from polkadotetl.cli.datasources.bigquery import convert_to_bigquery_schema
 
 
 app = typer.Typer()
 
 
+def split_list(value: str) -> List[str]:
+    """Splits a comma-separated option into its items."""
+    return [item.strip() for item in value.split(",") if item.strip()]
+
+
 @app.callback(invoke_without_command=False)
 def main(
     ctx: typer.Context,
@@ -39,6 +47,7 @@ def main(
 
 @app.command()
 def export_blocks(
+    ctx: typer.Context,
     output_directory: Path = typer.Argument(
         ...,
         exists=True,
@@ -50,7 +59,7 @@ def export_blocks(
     sidecar_url: str = typer.Argument(
         ...,
         envvar="POLKADOT_SIDECAR_URL",
-        help="Fully qualified URL to the polkadot sidecar. Provide the API key within the query parameters as well, if required.",
+        help="Fully qualified URL to the polkadot sidecar, or to the JSON-RPC of a node as `ws://`, `wss://`, `rpc+http://` or `rpc+https://`. Provide the API key within the query parameters as well, if required.",
     ),
     start_block: int = typer.Option(None, help="Start Block"),
     end_block: int = typer.Option(None, help="End Block"),
@@ -59,13 +68,117 @@ def export_blocks(
     retries: int = typer.Option(
         SIDECAR_RETRIES, help="Number of retries for the requests"
     ),
+    partition_by: Partition = typer.Option(
+        None,
+        case_sensitive=False,
+        help="Split the timestamp range into day or hour partitions and export every partition into its own folder.",
+    ),
+    max_workers: int = typer.Option(
+        4, help="Number of partitions to export in parallel"
+    ),
+    batch_size: int = typer.Option(
+        1,
+        help="Fetch up to this many blocks per request with the sidecar's range query. The batch size adapts to failures.",
+    ),
+    layout: Layout = typer.Option(
+        Layout.FLAT,
+        case_sensitive=False,
+        help="Write block files into one flat folder, or shard them into nested folders of up to a thousand blocks.",
+    ),
+    transfers_only: bool = typer.Option(
+        False,
+        "--transfers-only",
+        help="Only keep what the `enrich` command uses: the enriched events, the extrinsics that have them and the timestamp extrinsic, without paraInherent args, docs or fees.",
+    ),
+    events: str = typer.Option(
+        None,
+        help="Comma-separated allowlist of the events to keep, as `pallet` or `pallet.method`, such as `balances,staking.Rewarded`.",
+    ),
+    extrinsic_pallets: str = typer.Option(
+        None,
+        help="Comma-separated allowlist of the pallets of the extrinsics to keep. The timestamp extrinsic is always kept.",
+    ),
+    drop_empty_extrinsics: bool = typer.Option(
+        False, help="Drop the extrinsics that have no events left after filtering."
+    ),
+    drop_para_inherent_args: bool = typer.Option(
+        False, help="Drop the args of paraInherent extrinsics, which are most of the size of a block."
+    ),
+    skip_docs_and_fees: bool = typer.Option(
+        False, help="Request blocks from the sidecar without event and extrinsic docs and fee estimates."
+    ),
+    passthrough: bool = typer.Option(
+        False,
+        help="Write block responses as they are received, without decoding them. Can't be combined with a projection or a batch size.",
+    ),
+    compress: bool = typer.Option(
+        False, help="Write gzip compressed block files, named `<block number>.json.gz`."
+    ),
+    concurrency: int = typer.Option(
+        1, min=1, help="Number of threads fetching blocks of a range, or of every partition."
+    ),
+    retry_max_delay: int = typer.Option(
+        SIDECAR_RETRY_DELAY_IN_SECONDS, min=1, help="Maximum seconds to wait between retries of a request."
+    ),
+    profile: Path = typer.Option(
+        None,
+        exists=True,
+        file_okay=True,
+        dir_okay=False,
+        resolve_path=True,
+        help="Use the concurrency, batch size, retries and retry delay of a profile saved by `bench-sidecar`. Options given explicitly take precedence.",
+    ),
 ):
     """Exports blocks from the polkadot sidecar API into a newline-separated jsons file"""
     from polkadotetl.export import export_blocks
+    from polkadotetl.export.projection import Projection
+
+    if transfers_only:
+        projection = Projection.transfers()
+    elif (
+        events is not None
+        or extrinsic_pallets is not None
+        or drop_empty_extrinsics
+        or drop_para_inherent_args
+        or skip_docs_and_fees
+    ):
+        projection = Projection(
+            events=None if events is None else split_list(events),
+            extrinsic_pallets=None
+            if extrinsic_pallets is None
+            else split_list(extrinsic_pallets),
+            drop_empty_extrinsics=drop_empty_extrinsics,
+            drop_para_inherent_args=drop_para_inherent_args,
+            skip_docs_and_fees=skip_docs_and_fees,
+        )
+    else:
+        projection = None
+    if profile is not None:
+        from polkadotetl.export.bench import SidecarProfile
+
+        try:
+            sidecar_profile = SidecarProfile.load(profile)
+        except InvalidInput as e:
+            raise typer.Exit(1) from e
+        settings = dict(
+            concurrency=concurrency,
+            batch_size=batch_size,
+            retries=retries,
+            retry_max_delay=retry_max_delay,
+        )
+        for name in settings:
+            # options given explicitly take precedence over the profile
+            if ctx.get_parameter_source(name).name == "DEFAULT":
+                settings[name] = getattr(sidecar_profile, name)
+        logger.info(f"Using the settings of profile `{profile}`: {settings}")
+        concurrency = settings["concurrency"]
+        batch_size = settings["batch_size"]
+        retries = settings["retries"]
+        retry_max_delay = settings["retry_max_delay"]
 
     logger.debug(f"{start_block=}, {end_block=}, {start_timestamp=}, {end_timestamp=}")
     try:
-        export_blocks(
+        incomplete_partitions = export_blocks(
             output_directory,
             sidecar_url,
             start_block,
@@ -73,22 +186,161 @@ def export_blocks(
             start_timestamp,
             end_timestamp,
             retries,
+            partition_by,
+            max_workers,
+            batch_size,
+            layout,
+            projection,
+            passthrough,
+            compress,
+            concurrency,
+            retry_max_delay,
         )
     except InvalidInput as e:
         logger.error("Invalid input provided to CLI.")
         raise typer.Exit(1) from e
+    if incomplete_partitions:
+        logger.error(
+            "Partitions {} are incomplete. Rerun the export to retry them.".format(
+                ", ".join(incomplete_partitions)
+            )
+        )
+        raise typer.Exit(1)
 
 
 @app.command()
-def convert_raw_blocks_to_bigquery_schema(
-    input_dir: Path = typer.Argument(
+def bench_sidecar(
+    sidecar_url: str = typer.Argument(
         ...,
-        exists=False,
-        file_okay=False,
-        dir_okay=True,
+        envvar="POLKADOT_SIDECAR_URL",
+        help="Fully qualified URL to the polkadot sidecar, or to the JSON-RPC of a node as `ws://`, `wss://`, `rpc+http://` or `rpc+https://`. Provide the API key within the query parameters as well, if required.",
+    ),
+    start_block: int = typer.Option(..., help="Sample block ranges from this block onwards"),
+    end_block: int = typer.Option(..., help="Sample block ranges up to this block"),
+    concurrency: List[int] = typer.Option(
+        [1, 2, 4, 8, 16], help="Concurrency levels to try, in increasing order. Repeat the option for every level."
+    ),
+    batch_size: List[int] = typer.Option(
+        [1, 10, 50], help="Batch sizes to try. Repeat the option for every batch size."
+    ),
+    requests_per_trial: int = typer.Option(32, min=1, help="Number of requests for every concurrency level and batch size."),
+    max_error_rate: float = typer.Option(
+        0.01, min=0.0, max=1.0, help="Stop raising the concurrency once this fraction of requests fails."
+    ),
+    report_file: Path = typer.Option(
+        None,
+        file_okay=True,
+        dir_okay=False,
+        writable=True,
+        resolve_path=True,
+        help="Write the measurements of every trial as a json to this file.",
+    ),
+    save_profile: Path = typer.Option(
+        None,
+        file_okay=True,
+        dir_okay=False,
+        writable=True,
+        resolve_path=True,
+        help="Save the recommended settings to this file, for `export-blocks --profile`.",
+    ),
+):
+    """Benchmarks a sidecar at increasing concurrency and batch sizes, and recommends the settings `export-blocks` should
+    use with it."""
+    from rich.console import Console
+    from rich.table import Table
+    from polkadotetl.export.bench import PERCENTILES, bench_sidecar, recommend
+
+    try:
+        results = bench_sidecar(
+            sidecar_url,
+            start_block,
+            end_block,
+            concurrency,
+            batch_size,
+            requests_per_trial,
+            max_error_rate,
+        )
+        sidecar_profile = recommend(sidecar_url, results, max_error_rate)
+    except InvalidInput as e:
+        logger.error("Invalid input provided to CLI.")
+        raise typer.Exit(1) from e
+    table = Table("Concurrency", "Batch size", "Blocks/s", *[f"p{p} (s)" for p in PERCENTILES], "Error rate")
+    for result in results:
+        table.add_row(
+            str(result.concurrency),
+            str(result.batch_size),
+            f"{result.blocks_per_second:,.1f}",
+            *[
+                "-" if result.percentile(p) is None else f"{result.percentile(p):.3f}"
+                for p in PERCENTILES
+            ],
+            f"{result.error_rate:.1%}",
+        )
+    Console().print(table)
+    logger.info(
+        "Recommended: --concurrency {concurrency} --batch-size {batch_size} --retries {retries} --retry-max-delay {retry_max_delay}".format(
+            **sidecar_profile.to_dict()
+        )
+    )
+    if report_file is not None:
+        with open(report_file, "w") as report_file_buffer:
+            json.dump([result.to_dict() for result in results], report_file_buffer, indent=2)
+    if save_profile is not None:
+        sidecar_profile.save(save_profile)
+        logger.info(f"Saved the recommended settings to `{save_profile}`.")
+
+
+@app.command()
+def get_block_ranges(
+    sidecar_url: str = typer.Argument(
+        ...,
+        envvar="POLKADOT_SIDECAR_URL",
+        help="Fully qualified URL to the polkadot sidecar, or to the JSON-RPC of a node as `ws://`, `wss://`, `rpc+http://` or `rpc+https://`. Provide the API key within the query parameters as well, if required.",
+    ),
+    start_date: datetime = typer.Option(..., formats=["%Y-%m-%d"], help="First day (UTC)"),
+    end_date: datetime = typer.Option(..., formats=["%Y-%m-%d"], help="Last day (UTC)"),
+    output_file: Path = typer.Option(
+        None,
+        file_okay=True,
+        dir_okay=False,
         writable=True,
         resolve_path=True,
-        help="Directory where raw export from polkadot sidecar can be found.",
+        help="Write the block ranges to this file instead of the standard output.",
+    ),
+    retries: int = typer.Option(
+        SIDECAR_RETRIES, help="Number of retries for the requests"
+    ),
+    parallel_probes: int = typer.Option(
+        1, help="Number of blocks to probe concurrently while searching"
+    ),
+):
+    """Resolves the start and end blocks of every day in a date range and writes them as a json mapping each date to its start and end block."""
+    from polkadotetl.export.internals import get_block_ranges_for_dates
+
+    try:
+        block_ranges = get_block_ranges_for_dates(
+            sidecar_url, start_date.date(), end_date.date(), retries, parallel_probes
+        )
+    except InvalidInput as e:
+        logger.error("Invalid input provided to CLI.")
+        raise typer.Exit(1) from e
+    block_ranges_json = json.dumps(
+        {day.isoformat(): list(block_range) for day, block_range in block_ranges.items()},
+        indent=2,
+    )
+    if output_file is None:
+        typer.echo(block_ranges_json)
+    else:
+        with open(output_file, "w") as file_buffer:
+            file_buffer.write(block_ranges_json)
+        logger.info(f"Wrote block ranges of {len(block_ranges):,} days to `{output_file}`.")
+
+
+@app.command()
+def convert_raw_blocks_to_bigquery_schema(
+    input_dir: str = typer.Argument(
+        ...,
+        help="Where the raw export from polkadot sidecar can be found: a directory, an NDJSON file (plain, gzip or zstd), a tar archive, or `-` for NDJSON on the standard input.",
     ),    
     output_dir: Path = typer.Argument(
         ...,
@@ -102,21 +354,35 @@ def convert_raw_blocks_to_bigquery_schema(
     raise_error: bool = typer.Argument(
         False,
         help="Stop transformation if an unexpected error is seen"
-    )
+    ),
+    start_block: int = typer.Option(None, help="Only convert blocks from this block onwards"),
+    end_block: int = typer.Option(None, help="Only convert blocks up to this block"),
+    normalized: bool = typer.Option(
+        False,
+        help="Write separate blocks, extrinsics and events tables instead of one nested row per block. Their schemas are the `schema_<table>.json` files.",
+    ),
 ):
-    convert_to_bigquery_schema(input_dir=input_dir, output_dir=output_dir, raise_error=raise_error)
+    from polkadotetl.cli.datasources.bigquery import convert_to_normalized_tables
+
+    convert = convert_to_normalized_tables if normalized else convert_to_bigquery_schema
+    try:
+        convert(
+            input_dir=input_dir,
+            output_dir=output_dir,
+            raise_error=raise_error,
+            start_block=start_block,
+            end_block=end_block,
+        )
+    except InvalidInput as e:
+        logger.error("Invalid input provided to CLI.")
+        raise typer.Exit(1) from e
 
 
 @app.command()
 def enrich(
-    block_response_path: Path = typer.Argument(
+    block_response_path: str = typer.Argument(
         ...,
-        exists=True,
-        file_okay=False,
-        dir_okay=True,
-        resolve_path=True,
-        readable=True,
-        help="Process all jsons in this directory. Note that you should only keep response jsons in this directory, or you will face errors.",
+        help="Process all block responses from here: a directory (including its sub-directories), an NDJSON file (plain, gzip or zstd), a tar archive, or `-` for NDJSON on the standard input. Note that a directory should only hold response jsons, or you will face errors.",
     ),
     output_file: Path = typer.Argument(
         ...,
@@ -134,35 +400,241 @@ def enrich(
         "-w/-N",
         help="Overwrite the output file if it exists.",
     ),
+    batch_size: int = typer.Option(
+        1000, help="Number of blocks to enrich together."
+    ),
+    start_block: int = typer.Option(None, help="Only enrich blocks from this block onwards"),
+    end_block: int = typer.Option(None, help="Only enrich blocks up to this block"),
+    index: Path = typer.Option(
+        None,
+        file_okay=True,
+        dir_okay=False,
+        writable=True,
+        resolve_path=True,
+        help="Also index the addresses of the transactions into this SQLite file, for the `lookup` command. An existing index is updated.",
+    ),
+    index_hashes: bool = typer.Option(
+        False, help="Also index transaction hashes. Needs --index."
+    ),
 ):
-    """Enriches all Polkadot block response files from a folder and writes the results into a single, new-line-separated
+    """Enriches all Polkadot block responses from a folder or archive and writes the results into a single, new-line-separated
     file of jsons. This can be directly uploaded to BigQuery."""
-    from polkadotetl.enrich import enrich_block
+    from contextlib import nullcontext
+
+    from polkadotetl.enrich.columnar import enrich_blocks
+    from polkadotetl.enrich.index import AddressIndex
 
     if quiet > 0:
         warnings.filterwarnings("ignore", category=NoTransactionsWarning)
-    response_files = glob.glob(os.path.join(block_response_path, "*.json"))
     if output_file.exists() and not overwrite:
         logger.error("`{}` exists. Use --overwrite if you want to do replace the file.")
         raise typer.Exit(1)
-    enriched_transactions = 0
-    logger.info("Processing {:,} response files.".format(len(response_files)))
-    with open(output_file, "w") as output_file_buffer:
-        for response_file in response_files:
-            with open(response_file, "r") as file_buffer:
-                polkadot_response = json.load(file_buffer)
-                transactions = enrich_block(polkadot_response)
+    if index_hashes and index is None:
+        logger.error("--index-hashes needs an --index file.")
+        raise typer.Exit(1)
+    try:
+        polkadot_responses = (
+            block for _, block in iter_blocks(block_response_path, start_block, end_block)
+        )
+        enriched_transactions = 0
+        logger.info("Processing block responses from `{}`.".format(block_response_path))
+        index_context = (
+            nullcontext() if index is None else AddressIndex(index, index_hashes)
+        )
+        with open(output_file, "w") as output_file_buffer, index_context as address_index:
+            while batch := list(islice(polkadot_responses, batch_size)):
+                transactions = enrich_blocks(batch)
                 for txn in transactions:
                     enriched_transactions += 1
                     output_file_buffer.write("{}\n".format(json.dumps(txn)))
+                if address_index is not None:
+                    address_index.add_transactions(
+                        transactions, (int(block["number"]) for block in batch)
+                    )
+    except InvalidInput as e:
+        logger.error("Invalid input provided to CLI.")
+        raise typer.Exit(1) from e
 
     logger.info(
-        "Completed processing all files in `{}` and wrote them to `{}`. Total number of transactions: {:,}".format(
+        "Completed processing all block responses from `{}` and wrote them to `{}`. Total number of transactions: {:,}".format(
             block_response_path, output_file, enriched_transactions
         )
     )
 
 
+@app.command()
+def convert_and_enrich(
+    input_dir: str = typer.Argument(
+        ...,
+        help="Where the raw export from polkadot sidecar can be found: a directory, an NDJSON file (plain, gzip or zstd), a tar archive, or `-` for NDJSON on the standard input.",
+    ),
+    output_dir: Path = typer.Argument(
+        ...,
+        exists=False,
+        file_okay=False,
+        dir_okay=True,
+        writable=True,
+        resolve_path=True,
+        help="Directory to write transformed json files.",
+    ),
+    output_file: Path = typer.Argument(
+        ...,
+        exists=False,
+        file_okay=True,
+        dir_okay=False,
+        writable=True,
+        resolve_path=True,
+        help="Write all enriched transactions to this file, with a new line separating each json.",
+    ),
+    quiet: int = typer.Option(0, "--quiet", "-q", count=True),
+    overwrite: bool = typer.Option(
+        False,
+        "--overwrite/--no-overwrite",
+        "-w/-N",
+        help="Overwrite the output file if it exists.",
+    ),
+    raise_error: bool = typer.Option(
+        False, help="Stop transformation if an unexpected error is seen"
+    ),
+    start_block: int = typer.Option(None, help="Only process blocks from this block onwards"),
+    end_block: int = typer.Option(None, help="Only process blocks up to this block"),
+    max_workers: int = typer.Option(
+        None, help="Number of processes that read the files of a directory. Defaults to the number of CPUs."
+    ),
+):
+    """Does the work of both `convert-raw-blocks-to-bigquery-schema` and `enrich` in a single pass, reading and parsing
+    every block response once. Writes the same outputs as the two commands."""
+    from polkadotetl.cli.datasources.bigquery import convert_and_enrich as convert_and_enrich_blocks
+
+    if output_file.exists() and not overwrite:
+        logger.error("`{}` exists. Use --overwrite if you want to do replace the file.".format(output_file))
+        raise typer.Exit(1)
+    try:
+        enriched_transactions = convert_and_enrich_blocks(
+            input_dir=input_dir,
+            output_dir=output_dir,
+            enriched_file=output_file,
+            raise_error=raise_error,
+            start_block=start_block,
+            end_block=end_block,
+            max_workers=max_workers,
+            quiet=quiet > 0,
+        )
+    except InvalidInput as e:
+        logger.error("Invalid input provided to CLI.")
+        raise typer.Exit(1) from e
+    logger.info(
+        "Completed processing all block responses from `{}`. Wrote them to `{}` and `{}`. Total number of transactions: {:,}".format(
+            input_dir, output_dir, output_file, enriched_transactions
+        )
+    )
+
+
+@app.command()
+def lookup(
+    index: Path = typer.Argument(
+        ...,
+        exists=True,
+        file_okay=True,
+        dir_okay=False,
+        resolve_path=True,
+        help="Index built by `enrich --index`.",
+    ),
+    queries: List[str] = typer.Argument(..., help="Addresses, or transaction hashes with --transaction-hash, to look up."),
+    transaction_hash: bool = typer.Option(
+        False, "--transaction-hash", help="Look up transaction hashes instead of addresses."
+    ),
+    start_block: int = typer.Option(None, help="Only return blocks from this block onwards"),
+    end_block: int = typer.Option(None, help="Only return blocks up to this block"),
+):
+    """Looks up the blocks with transactions from or to addresses, or with transaction hashes, in an index built by
+    `enrich --index`. Prints a json of the block numbers of every query."""
+    from polkadotetl.enrich.index import AddressIndex
+
+    try:
+        address_index = AddressIndex(index, read_only=True)
+    except InvalidInput as e:
+        logger.error("Invalid input provided to CLI.")
+        raise typer.Exit(1) from e
+    with address_index:
+        if transaction_hash:
+            if start_block is not None or end_block is not None:
+                logger.warning("--start-block and --end-block are ignored for transaction hashes.")
+            results = {query: address_index.lookup_transaction(query) for query in queries}
+        else:
+            results = {
+                query: address_index.lookup_address(query, start_block, end_block)
+                for query in queries
+            }
+        stats = address_index.stats()
+    logger.debug(
+        f"Index covers {stats['blocks']:,} blocks between {stats['start_block']} and {stats['end_block']}."
+    )
+    typer.echo(json.dumps(results))
+
+
+@app.command()
+def verify(
+    directories: List[Path] = typer.Argument(
+        ...,
+        exists=True,
+        file_okay=False,
+        dir_okay=True,
+        resolve_path=True,
+        readable=True,
+        help="Folders written by `export-blocks`, in either layout. Pass every shard of an export to verify them together.",
+    ),
+    start_block: int = typer.Option(None, help="First block expected. Defaults to the lowest block found."),
+    end_block: int = typer.Option(None, help="Last block expected. Defaults to the highest block found."),
+    sample_rate: float = typer.Option(
+        0.01, min=0.0, max=1.0, help="Fraction of the files to fully parse."
+    ),
+    max_workers: int = typer.Option(None, help="Number of processes checking files. Defaults to the number of CPUs."),
+    report_file: Path = typer.Option(
+        None,
+        file_okay=True,
+        dir_okay=False,
+        writable=True,
+        resolve_path=True,
+        help="Write the full report as a json to this file.",
+    ),
+):
+    """Verifies that exported blocks are complete: finds missing blocks, truncated or corrupt files, and blocks that
+    aren't finalized or were exported from a pruned node."""
+    from polkadotetl.export.verify import format_ranges, to_ranges, verify_blocks
+
+    try:
+        report = verify_blocks(directories, start_block, end_block, sample_rate, max_workers)
+    except InvalidInput as e:
+        logger.error("Invalid input provided to CLI.")
+        raise typer.Exit(1) from e
+    logger.info(
+        f"Checked {report.files:,} files for blocks {report.start_block}-{report.end_block}, fully parsing {report.sampled:,} of them."
+    )
+    if report.files == 0:
+        logger.error("No block files were found.")
+    if report.missing:
+        logger.error(
+            f"Missing {report.to_dict()['missing_blocks']:,} blocks: {format_ranges(report.missing)}"
+        )
+    if report.duplicates:
+        logger.error(f"Blocks in more than one file: {format_ranges(to_ranges(report.duplicates))}")
+    for problem, block_numbers in report.problems.items():
+        if block_numbers:
+            logger.error(
+                "{} blocks: {}".format(
+                    problem.replace("_", " ").capitalize(),
+                    format_ranges(to_ranges(sorted(block_numbers))),
+                )
+            )
+    if report_file is not None:
+        with open(report_file, "w") as file_buffer:
+            file_buffer.write(json.dumps(report.to_dict()))
+    if not report.ok:
+        raise typer.Exit(1)
+    logger.info("All blocks are present and intact.")
+
+
 def cli():
     """Helper function to run the cli."""
     app()
@@ -1,32 +1,44 @@
 """Polkadot Block Processor"""
+import io
 import json
 import random
 import glob
 import os
+from functools import partial
+from itertools import islice
 from pathlib import Path
+from typing import List, Optional, TextIO, Tuple, Union
 
 import typer
 from rich.progress import Progress, SpinnerColumn, TimeElapsedColumn
 
+from polkadotetl.core.sources import iter_blocks
 from polkadotetl.exceptions import PolkadotSidecarError, PruningError
 
 
 
 def convert_to_bigquery_schema(
-    input_dir: Path, output_dir: Path, raise_error: bool = False
+    input_dir: Union[str, Path],
+    output_dir: Path,
+    raise_error: bool = False,
+    start_block: Optional[int] = None,
+    end_block: Optional[int] = None,
 ):
     """This function cleans the raw sidecar response and makes it so that it can write it to BigQuery.
     1. Read Json.
     2. Remove data fields wherever pallet='parainherent' and pallet='timestamp'.
     3. "flatten" the data fields for pallet='system' and method='extrinsicSuccess|extrinsicFailed'
     The specific schema it writes to is in `schema.json`, found in the root level of this repository.
+
+    `input_dir` can be any block source that `polkadotetl.core.sources.iter_blocks` reads.
     """
     assert (
-        input_dir != output_dir
+        Path(input_dir) != Path(output_dir)
     ), "Please don't use the same folder for input and output."
     if not os.path.isdir(output_dir):
         output_dir.mkdir(parents=True, exist_ok=True)
     output_file = os.path.join(output_dir, f"batch.json")
+    output_prefix = os.path.join(os.path.abspath(output_dir), "")
 
     with open(output_file, "w") as fw:
 
@@ -35,25 +47,18 @@ def convert_to_bigquery_schema(
             *Progress.get_default_columns(),
             TimeElapsedColumn(),
         ) as progress:
-            task = progress.add_task("Processing", total=len(os.listdir(input_dir)))
-            for file_name in os.listdir(input_dir):
-                if "json" not in file_name:
-                    continue
-
-                file_path = os.path.join(input_dir, file_name)
-                try:
-                    with open(file_path, "r") as f:
-                        block_response = json.load(f)
-                except json.JSONDecodeError as e:
-                    progress.console.print(f"JSONDecodeError Processing: {file_path}, {e}")
+            task = progress.add_task("Processing", total=None)
+            for origin, block_response in iter_blocks(input_dir, start_block, end_block):
+                if os.path.abspath(origin).startswith(output_prefix):
+                    # don't read back our own output when it's inside the input directory
                     continue
                 try:
                     process(block_response)
                 except PruningError as e:
-                    progress.console.print(f"PruningError Processing: {file_path}, {e}")
+                    progress.console.print(f"PruningError Processing: {origin}, {e}")
                     continue
                 except Exception as e:
-                    progress.console.print(f"Error Processing: {file_path}, {e}")
+                    progress.console.print(f"Error Processing: {origin}, {e}")
                     if raise_error:
                         raise e
                     else:
@@ -63,16 +68,27 @@ def convert_to_bigquery_schema(
 
 
 def process(block_response: dict):
-    """Processes a single block response"""
+    """Processes a single block response in place"""
+    block_response.update(bigquery_row(block_response))
+
+
+def bigquery_row(block_response: dict) -> dict:
+    """Returns the BigQuery row of a single block response, without changing it.
+
+    Only the dicts and lists on the way to a changed value are copied, and
+    shallowly, so the block response can still be enriched after. Events whose
+    `data` is already all strings are shared with the block response."""
     # first ensure this has the extrinsics
     if "extrinsics" not in block_response.keys():
         raise Exception("Not a valid Substrate Block Response. Missing extrinsics")
 
-    for ix, extrinsic in enumerate(block_response["extrinsics"]):
+    extrinsics = []
+    for extrinsic in block_response["extrinsics"]:
+        extrinsic = dict(extrinsic)
         # convert the `signature field` to a STRING.
         signature = extrinsic.get("signature")
         if signature is not None and not isinstance(signature, str):
-            block_response["extrinsics"][ix]["signature"] = json.dumps(signature)
+            extrinsic["signature"] = json.dumps(signature)
         success = extrinsic.get("success", False)
         if success in [True, "true"]:
             success = True
@@ -80,25 +96,452 @@ def process(block_response: dict):
             if isinstance(success, str) and "Unable to fetch Events, cannot confirm extrinsic status. Check pruning settings on the node." in success:
                 raise PruningError("Check pruning settings for this block.")
             success = False
-        block_response["extrinsics"][ix]["success"] = success
+        extrinsic["success"] = success
 
         # Next, make sure that the `data` fields everywhere only have a list of strings
-        for iy, event in enumerate(block_response["extrinsics"][ix]["events"]):
-            data = event["data"]
-            for iz, item in enumerate(data):
-                if not isinstance(item, str):
-                    block_response["extrinsics"][ix]["events"][iy]["data"][
-                        iz
-                    ] = json.dumps(item)
+        extrinsic["events"] = _stringify_data(extrinsic["events"])
+        extrinsics.append(extrinsic)
 
+    row = dict(block_response)
+    row["extrinsics"] = extrinsics
     for key in ["onInitialize", "onFinalize"]:
         if key not in block_response.keys():
             raise Exception(f"Not a valid Substrate Block Response. Missing {key}")
-        for ix, event in enumerate(block_response[key]["events"]):
-            for iy, item in enumerate(event["data"]):
-                if not isinstance(item, str):
-                    block_response[key]["events"][ix]["data"][iy] = json.dumps(item)
+        events = _stringify_data(block_response[key]["events"])
+        if events is not block_response[key]["events"]:
+            row[key] = dict(block_response[key])
+            row[key]["events"] = events
 
     # next, serialize `extrinsics[].args`
+    for extrinsic in extrinsics:
+        extrinsic["args"] = json.dumps(extrinsic["args"])
+    return row
+
+
+def _stringify_data(events: list) -> list:
+    """Returns the events with only strings in their `data`. The list and the
+    events are copied only when one of them changes."""
+    stringified = None
+    for ix, event in enumerate(events):
+        if all(isinstance(item, str) for item in event["data"]):
+            continue
+        if stringified is None:
+            stringified = list(events)
+        event = dict(event)
+        event["data"] = [
+            item if isinstance(item, str) else json.dumps(item) for item in event["data"]
+        ]
+        stringified[ix] = event
+    return events if stringified is None else stringified
+
+
+# the normalized tables, which `convert_to_normalized_tables` writes as `{table}.json`
+NORMALIZED_TABLES = ("blocks", "extrinsics", "events")
+# the `phase` of the rows of the `events` table, in the order of the block
+EVENT_PHASES = ("onInitialize", "applyExtrinsic", "onFinalize")
+
+
+def _field(name: str, type_: str, mode: Optional[str] = None, fields: Optional[list] = None) -> dict:
+    field = {"name": name, "type": type_}
+    if mode is not None:
+        field["mode"] = mode
+    if fields is not None:
+        field["fields"] = fields
+    return field
+
+
+NORMALIZED_SCHEMAS = {
+    "blocks": [
+        _field("number", "INT64", "REQUIRED"),
+        _field("hash", "STRING", "REQUIRED"),
+        _field("parentHash", "STRING", "REQUIRED"),
+        _field("stateRoot", "STRING", "REQUIRED"),
+        _field("extrinsicsRoot", "STRING", "REQUIRED"),
+        _field("authorId", "STRING"),
+        _field("timestamp", "TIMESTAMP"),
+        _field("finalized", "BOOLEAN", "REQUIRED"),
+        _field("extrinsic_count", "INT64", "REQUIRED"),
+        _field("event_count", "INT64", "REQUIRED"),
+        _field(
+            "logs",
+            "RECORD",
+            "REPEATED",
+            [
+                _field("type", "STRING", "REQUIRED"),
+                _field("index", "STRING", "REQUIRED"),
+                _field("value", "STRING", "REPEATED"),
+            ],
+        ),
+    ],
+    "extrinsics": [
+        _field("block_number", "INT64", "REQUIRED"),
+        _field("extrinsic_index", "INT64", "REQUIRED"),
+        _field("hash", "STRING", "REQUIRED"),
+        _field("pallet", "STRING", "REQUIRED"),
+        _field("method", "STRING", "REQUIRED"),
+        _field("signer", "STRING"),
+        _field("signature", "STRING"),
+        _field("nonce", "INT64"),
+        _field("tip", "INT64"),
+        _field("args", "STRING", "REQUIRED"),
+        _field(
+            "era",
+            "RECORD",
+            fields=[
+                _field("mortalEra", "STRING", "REPEATED"),
+                _field("immortalEra", "STRING"),
+            ],
+        ),
+        _field(
+            "info",
+            "RECORD",
+            fields=[
+                _field("weight", "STRING"),
+                _field("class", "STRING"),
+                _field("partialFee", "STRING"),
+                _field("kind", "STRING"),
+            ],
+        ),
+        _field("paysFee", "BOOLEAN"),
+        _field("success", "BOOLEAN", "REQUIRED"),
+        _field("event_count", "INT64", "REQUIRED"),
+    ],
+    "events": [
+        _field("block_number", "INT64", "REQUIRED"),
+        _field("event_index", "INT64", "REQUIRED"),
+        _field("phase", "STRING", "REQUIRED"),
+        _field("extrinsic_index", "INT64"),
+        _field("pallet", "STRING", "REQUIRED"),
+        _field("method", "STRING", "REQUIRED"),
+        _field("data", "STRING", "REPEATED"),
+    ],
+}
+
+
+def write_normalized_schemas(directory: Union[str, Path]):
+    """Writes the BigQuery schema of every normalized table to `schema_{table}.json`."""
+    for table, schema in NORMALIZED_SCHEMAS.items():
+        with open(os.path.join(directory, f"schema_{table}.json"), "w") as file_buffer:
+            file_buffer.write(json.dumps(schema, indent=2) + "\n")
+
+
+def convert_to_normalized_tables(
+    input_dir: Union[str, Path],
+    output_dir: Path,
+    raise_error: bool = False,
+    start_block: Optional[int] = None,
+    end_block: Optional[int] = None,
+):
+    """Converts raw sidecar responses into narrow `blocks`, `extrinsics` and
+    `events` tables, written in a single pass as `blocks.json`,
+    `extrinsics.json` and `events.json` in `output_dir`.
+
+    Rows are keyed by the block number, the extrinsic index within the block
+    and the event index within the block, so the tables can be joined without
+    unnesting whole blocks. Their schemas are in the `schema_{table}.json`
+    files at the root level of this repository."""
+    from contextlib import ExitStack
+
+    assert (
+        Path(input_dir) != Path(output_dir)
+    ), "Please don't use the same folder for input and output."
+    if not os.path.isdir(output_dir):
+        output_dir.mkdir(parents=True, exist_ok=True)
+    output_prefix = os.path.join(os.path.abspath(output_dir), "")
+
+    with ExitStack() as stack:
+        files = {
+            table: stack.enter_context(open(os.path.join(output_dir, f"{table}.json"), "w"))
+            for table in NORMALIZED_TABLES
+        }
+        progress = stack.enter_context(
+            Progress(SpinnerColumn(), *Progress.get_default_columns(), TimeElapsedColumn())
+        )
+        task = progress.add_task("Processing", total=None)
+        for origin, block_response in iter_blocks(input_dir, start_block, end_block):
+            if os.path.abspath(origin).startswith(output_prefix):
+                # don't read back our own output when it's inside the input directory
+                continue
+            try:
+                block_row, extrinsic_rows, event_rows = normalize_block(block_response)
+            except PruningError as e:
+                progress.console.print(f"PruningError Processing: {origin}, {e}")
+                continue
+            except Exception as e:
+                progress.console.print(f"Error Processing: {origin}, {e}")
+                if raise_error:
+                    raise e
+                continue
+            files["blocks"].write("{}\n".format(json.dumps(block_row)))
+            for row in extrinsic_rows:
+                files["extrinsics"].write("{}\n".format(json.dumps(row)))
+            for row in event_rows:
+                files["events"].write("{}\n".format(json.dumps(row)))
+            progress.advance(task)
+
+
+def normalize_block(block_response: dict):
+    """Splits a single block response into a block row, extrinsic rows and event
+    rows, without modifying it. Fields are converted the same way as `process`.
+
+    The extrinsic and event indexes are positions in the block on chain. Blocks
+    exported with a projection record them, since extrinsics and events are
+    dropped from those."""
+    from datetime import datetime, timezone
+
+    from polkadotetl.export.projection import EVENT_INDEX, EXTRINSIC_INDEX
+
+    if "extrinsics" not in block_response.keys():
+        raise Exception("Not a valid Substrate Block Response. Missing extrinsics")
+    for key in ["onInitialize", "onFinalize"]:
+        if key not in block_response.keys():
+            raise Exception(f"Not a valid Substrate Block Response. Missing {key}")
+    block_number = int(block_response["number"])
+    extrinsic_rows = []
+    event_rows = []
+
+    def add_events(events: list, phase: str, extrinsic_index: Optional[int]):
+        for event in events:
+            event_rows.append(
+                dict(
+                    block_number=block_number,
+                    event_index=event.get(EVENT_INDEX, len(event_rows)),
+                    phase=phase,
+                    extrinsic_index=extrinsic_index,
+                    pallet=event["method"]["pallet"],
+                    method=event["method"]["method"],
+                    data=[item if isinstance(item, str) else json.dumps(item) for item in event["data"]],
+                )
+            )
+
+    on_initialize, apply_extrinsic, on_finalize = EVENT_PHASES
+    add_events(block_response["onInitialize"]["events"], on_initialize, None)
     for ix, extrinsic in enumerate(block_response["extrinsics"]):
-        block_response["extrinsics"][ix]["args"] = json.dumps(extrinsic["args"])
+        ix = extrinsic.get(EXTRINSIC_INDEX, ix)
+        signature = extrinsic.get("signature")
+        signer = None
+        if isinstance(signature, dict):
+            signer = signature.get("signer")
+            if isinstance(signer, dict):
+                signer = signer.get("id")
+        if signature is not None and not isinstance(signature, str):
+            signature = json.dumps(signature)
+        success = extrinsic.get("success", False)
+        if success in [True, "true"]:
+            success = True
+        else:
+            if isinstance(success, str) and "Unable to fetch Events, cannot confirm extrinsic status. Check pruning settings on the node." in success:
+                raise PruningError("Check pruning settings for this block.")
+            success = False
+        extrinsic_rows.append(
+            dict(
+                block_number=block_number,
+                extrinsic_index=ix,
+                hash=extrinsic["hash"],
+                pallet=extrinsic["method"]["pallet"],
+                method=extrinsic["method"]["method"],
+                signer=signer,
+                signature=signature,
+                nonce=extrinsic.get("nonce"),
+                tip=extrinsic.get("tip"),
+                args=json.dumps(extrinsic["args"]),
+                era=extrinsic.get("era"),
+                info=extrinsic.get("info") or None,
+                paysFee=extrinsic.get("paysFee"),
+                success=success,
+                event_count=len(extrinsic["events"]),
+            )
+        )
+        add_events(extrinsic["events"], apply_extrinsic, ix)
+    add_events(block_response["onFinalize"]["events"], on_finalize, None)
+
+    timestamp = None
+    extrinsics = block_response["extrinsics"]
+    if extrinsics and extrinsics[0]["method"]["pallet"] == "timestamp":
+        timestamp = datetime.fromtimestamp(
+            int(extrinsics[0]["args"]["now"]) / 1000, tz=timezone.utc
+        ).strftime("%Y-%m-%d %H:%M:%S.%f UTC")
+    block_row = dict(
+        number=block_number,
+        hash=block_response["hash"],
+        parentHash=block_response["parentHash"],
+        stateRoot=block_response["stateRoot"],
+        extrinsicsRoot=block_response["extrinsicsRoot"],
+        authorId=block_response.get("authorId"),
+        timestamp=timestamp,
+        finalized=block_response["finalized"],
+        extrinsic_count=len(extrinsic_rows),
+        event_count=len(event_rows),
+        logs=block_response.get("logs", []),
+    )
+    return block_row, extrinsic_rows, event_rows
+
+
+# block files per task of `convert_and_enrich`, and tasks in flight per worker
+CONVERT_AND_ENRICH_BATCH_SIZE = 256
+CONVERT_AND_ENRICH_TASKS_PER_WORKER = 4
+
+
+def convert_and_enrich(
+    input_dir: Union[str, Path],
+    output_dir: Path,
+    enriched_file: Path,
+    raise_error: bool = False,
+    start_block: Optional[int] = None,
+    end_block: Optional[int] = None,
+    max_workers: Optional[int] = None,
+    quiet: bool = False,
+) -> int:
+    """Writes both the BigQuery rows of `convert_to_bigquery_schema`, as
+    `batch.json` in `output_dir`, and the transactions of `enrich`, as
+    `enriched_file`, reading and parsing every block only once.
+
+    Every block is enriched first and then converted with `bigquery_row`,
+    which leaves the parsed block as it is, so the two don't need a copy of it.
+    The files of a directory are read, enriched and converted in parallel
+    across `max_workers` processes; other sources are read in this process.
+    Workers send back each output of a batch as one string, which is much
+    cheaper to pass between processes than a string per row, while this
+    process writes straight to the output files.
+    The outputs are in the same order as those of the two separate commands.
+
+    Returns the number of enriched transactions."""
+    from concurrent.futures import ProcessPoolExecutor
+
+    from polkadotetl.core.layout import iter_block_files
+
+    assert (
+        Path(input_dir) != Path(output_dir)
+    ), "Please don't use the same folder for input and output."
+    if not os.path.isdir(output_dir):
+        output_dir.mkdir(parents=True, exist_ok=True)
+    output_prefix = os.path.join(os.path.abspath(output_dir), "")
+    enriched_path = os.path.abspath(enriched_file)
+
+    def is_output(origin: str) -> bool:
+        # don't read back our own output when it's inside the input directory
+        origin = os.path.abspath(origin)
+        return origin.startswith(output_prefix) or origin == enriched_path
+
+    max_workers = max_workers or os.cpu_count() or 1
+    executor = None
+    if os.path.isdir(input_dir) and max_workers > 1:
+        file_batches = _batches(
+            (path for path in iter_block_files(input_dir) if not is_output(path)),
+            CONVERT_AND_ENRICH_BATCH_SIZE,
+        )
+        executor = ProcessPoolExecutor(max_workers=max_workers)
+        convert_and_enrich_files = partial(
+            _convert_and_enrich_files,
+            start_block=start_block,
+            end_block=end_block,
+            raise_error=raise_error,
+            quiet=quiet,
+        )
+
+        def results(fw, enriched_buffer):
+            # submit a few batches per worker at a time, since `map` would queue all of them at once
+            tasks = CONVERT_AND_ENRICH_TASKS_PER_WORKER * max_workers
+            while batches := list(islice(file_batches, tasks)):
+                for rows, transactions, *counts in executor.map(convert_and_enrich_files, batches):
+                    fw.write(rows)
+                    enriched_buffer.write(transactions)
+                    yield counts
+    else:
+        block_batches = _batches(
+            (
+                (origin, block)
+                for origin, block in iter_blocks(input_dir, start_block, end_block)
+                if not is_output(origin)
+            ),
+            CONVERT_AND_ENRICH_BATCH_SIZE,
+        )
+
+        def results(fw, enriched_buffer):
+            for batch in block_batches:
+                yield _convert_and_enrich_blocks(batch, raise_error, quiet, fw, enriched_buffer)
+
+    enriched_transactions = 0
+    try:
+        with open(os.path.join(output_dir, "batch.json"), "w") as fw, open(
+            enriched_file, "w"
+        ) as enriched_buffer, Progress(
+            SpinnerColumn(),
+            *Progress.get_default_columns(),
+            TimeElapsedColumn(),
+        ) as progress:
+            task = progress.add_task("Processing", total=None)
+            for row_count, transaction_count, errors in results(fw, enriched_buffer):
+                for error in errors:
+                    progress.console.print(error)
+                enriched_transactions += transaction_count
+                progress.advance(task, row_count)
+    finally:
+        if executor is not None:
+            executor.shutdown()
+    return enriched_transactions
+
+
+def _batches(items, batch_size: int):
+    items = iter(items)
+    while batch := list(islice(items, batch_size)):
+        yield batch
+
+
+def _convert_and_enrich_files(
+    file_paths: List[str],
+    start_block: Optional[int],
+    end_block: Optional[int],
+    raise_error: bool,
+    quiet: bool,
+):
+    from polkadotetl.core.sources import read_block_file
+
+    blocks = []
+    for file_path in file_paths:
+        block = read_block_file(file_path, start_block, end_block)
+        if block is not None:
+            blocks.append((file_path, block))
+    rows = io.StringIO()
+    transactions = io.StringIO()
+    counts = _convert_and_enrich_blocks(blocks, raise_error, quiet, rows, transactions)
+    return (rows.getvalue(), transactions.getvalue(), *counts)
+
+
+def _convert_and_enrich_blocks(
+    blocks: List[Tuple[str, dict]],
+    raise_error: bool,
+    quiet: bool,
+    rows_buffer: TextIO,
+    transactions_buffer: TextIO,
+) -> Tuple[int, int, List[str]]:
+    """Enriches and converts a batch of `(origin, block)` pairs into the two
+    buffers, and returns the number of rows and of transactions and the errors
+    to print."""
+    import warnings
+
+    from polkadotetl.enrich.columnar import enrich_blocks
+    from polkadotetl.warnings import NoTransactionsWarning
+
+    with warnings.catch_warnings():
+        if quiet:
+            warnings.filterwarnings("ignore", category=NoTransactionsWarning)
+        transactions = enrich_blocks(block for _, block in blocks)
+    for transaction in transactions:
+        transactions_buffer.write("{}\n".format(json.dumps(transaction)))
+    transaction_count = len(transactions)
+    # free the transactions of the batch before converting it
+    del transactions
+    row_count = 0
+    errors = []
+    for origin, block_response in blocks:
+        try:
+            rows_buffer.write("{}\n".format(json.dumps(bigquery_row(block_response))))
+            row_count += 1
+        except PruningError as e:
+            errors.append(f"PruningError Processing: {origin}, {e}")
+        except Exception as e:
+            errors.append(f"Error Processing: {origin}, {e}")
+            if raise_error:
+                raise e
+    return row_count, transaction_count, errors
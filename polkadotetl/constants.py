@@ -3,8 +3,40 @@ POLKADOT_TREASURY = "13UVJyLnbVp9RBZYFwFGyDvVd1y27Tt8tkntv6Q7JVPhFsTB"
 DECIMAL_AFTER_REDENOMINATION = 1.0 * (10 ** 10)
 SIDECAR_RETRIES = 5
 SIDECAR_RETRY_DELAY_IN_SECONDS = 10
+# the sidecar refuses `/blocks?range=` queries over this many blocks
+SIDECAR_MAX_RANGE_SIZE = 500
+# range queries are tried at most this many times before the range is split,
+# since splitting a failed range is a retry in itself
+SIDECAR_RANGE_RETRIES = 2
+# a node that doesn't answer a JSON-RPC batch call in this long is retried
+NODE_TIMEOUT_IN_SECONDS = 60
 NEAREST_BLOCK_THRESHOLD_IN_SECONDS = 5
+POLKADOT_BLOCK_TIME_IN_SECONDS = 6
+# gzip level of block files that are compressed before they are written
+BLOCK_FILE_COMPRESSION_LEVEL = 6
 REWARD_DESTINATION_STASH = "Stash"
 REWARD_DESTINATION_STAKED = "Staked"
 REWARD_DESTINATION_CONTROLLER = "Stash"
 REWARD_DESTINATION_ACCOUNT = "Account"
+# extrinsics from these pallets never move balances
+IGNORED_EXTRINSIC_PALLETS = (
+    "paraInherent",
+    "timestamp",
+)
+# `pallet.method` of the events that are enriched into transactions
+ENRICHED_EVENTS = (
+    "balances.BalanceSet",
+    "balances.Deposit",
+    "balances.DustLost",
+    "balances.ReserveRepatriated",
+    "balances.Slashed",
+    "balances.Transfer",
+    "balances.TransferAllowDeath",
+    "claims.Claimed",
+    "identity.SubIdentityAdded",
+    "identity.SubIdentityRemoved",
+    "identity.SubIdentityRevoked",
+    "staking.Reward",
+    "staking.Rewarded",
+    "treasury.Deposit",
+)
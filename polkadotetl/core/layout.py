@@ -0,0 +1,84 @@
+"""Directory layouts of raw block files"""
+import enum
+import gzip
+import os
+import threading
+from pathlib import Path
+from typing import Iterator, Union
+
+BLOCK_FILE_SUFFIX = ".json"
+COMPRESSED_BLOCK_FILE_SUFFIX = ".json.gz"
+GZIP_MAGIC = b"\x1f\x8b"
+
+
+class Layout(str, enum.Enum):
+    """This defines how raw block files are laid out in a directory.
+
+    FLAT keeps every `{block_number}.json` in the directory itself.
+    SHARDED nests them as `{n // 1_000_000}/{n // 1_000}/{n}.json`, so that no
+    directory holds more than a thousand entries."""
+
+    FLAT = "flat"
+    SHARDED = "sharded"
+
+
+def block_file_path(
+    directory: Union[str, Path],
+    block_number: int,
+    layout: Layout = Layout.FLAT,
+    compressed: bool = False,
+) -> Path:
+    """Returns the path of the raw file of a block in an output directory.
+
+    Compressed block files are gzip files named `{block_number}.json.gz`."""
+    directory = Path(directory)
+    if layout == Layout.SHARDED:
+        directory = (
+            directory / str(block_number // 1_000_000) / str(block_number // 1_000)
+        )
+    suffix = COMPRESSED_BLOCK_FILE_SUFFIX if compressed else BLOCK_FILE_SUFFIX
+    return directory / f"{block_number}{suffix}"
+
+
+def decompress_block_file(content: bytes) -> bytes:
+    """Returns the json of a block file's content, decompressing it if it is gzip compressed."""
+    if content.startswith(GZIP_MAGIC):
+        return gzip.decompress(content)
+    return content
+
+
+def write_block_file(path: Path, content: Union[str, bytes]):
+    """Writes a block file atomically.
+
+    The content is written to a hidden temporary file next to `path` and then
+    renamed over it, so readers never see a partially written block."""
+    path.parent.mkdir(parents=True, exist_ok=True)
+    temporary_path = path.with_name(
+        f".{path.name}.{os.getpid()}.{threading.get_ident()}.tmp"
+    )
+    try:
+        with open(temporary_path, "wb" if isinstance(content, bytes) else "w") as file_buffer:
+            file_buffer.write(content)
+        os.replace(temporary_path, path)
+    except BaseException:
+        temporary_path.unlink(missing_ok=True)
+        raise
+
+
+def iter_block_files(directory: Union[str, Path]) -> Iterator[str]:
+    """Lazily yields the paths of all block files in a directory, with either
+    layout, compressed or not.
+
+    Directories are walked with `os.scandir`, one at a time, so the full
+    listing of a large export is never held in memory. Hidden entries, such
+    as the temporary files of writes in progress, are skipped."""
+    pending = [os.fspath(directory)]
+    while pending:
+        with os.scandir(pending.pop()) as entries:
+            for entry in entries:
+                if entry.name.startswith("."):
+                    continue
+                if entry.is_dir():
+                    pending.append(entry.path)
+                elif entry.name.endswith((BLOCK_FILE_SUFFIX, COMPRESSED_BLOCK_FILE_SUFFIX)):
+                    yield entry.path
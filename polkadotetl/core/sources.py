@@ -0,0 +1,246 @@
+"""Sources of raw block responses.
+
+`iter_blocks` lazily yields the block responses exported by `export-blocks`
+from wherever they are stored:
+
+- a directory of block files, in either layout, compressed or not,
+- a newline-separated file of block jsons (NDJSON), plain, gzip or zstd compressed,
+- a tar archive (optionally compressed) of block files or NDJSON files,
+- the standard input, as NDJSON, when the source is `-`.
+
+Compression and tar archives are detected from the content rather than the file
+name. zstd needs the optional `zstandard` package.
+"""
+import gzip
+import io
+import json
+import os
+import sys
+import tarfile
+from pathlib import Path
+from typing import BinaryIO, Iterator, Optional, Tuple, Union
+
+from polkadotetl.core.layout import (
+    BLOCK_FILE_SUFFIX,
+    COMPRESSED_BLOCK_FILE_SUFFIX,
+    GZIP_MAGIC,
+    decompress_block_file,
+    iter_block_files,
+)
+from polkadotetl.exceptions import InvalidInput
+from polkadotetl.logger import logger
+
+STDIN = "-"
+ZSTD_MAGIC = b"\x28\xb5\x2f\xfd"
+TAR_MAGIC_OFFSET = 257
+TAR_MAGIC = b"ustar"
+
+
+def iter_blocks(
+    source: Union[str, Path],
+    start_block: Optional[int] = None,
+    end_block: Optional[int] = None,
+) -> Iterator[Tuple[str, dict]]:
+    """Lazily yields `(origin, block response)` pairs from a block source.
+
+    `origin` names where the block was read from, for error messages. Only
+    blocks between `start_block` and `end_block` (both inclusive, when given)
+    are yielded. Records that aren't valid json are logged and skipped.
+
+    The source is checked when this is called rather than when the first block
+    is read, so that callers fail before they open their outputs."""
+    in_range = _BlockRange(start_block, end_block)
+    if os.fspath(source) == STDIN:
+        blocks = _iter_stream(STDIN, sys.stdin.buffer, in_range)
+    elif os.path.isdir(source):
+        blocks = _iter_directory(source, in_range)
+    elif os.path.isfile(source):
+        blocks = _iter_file(os.fspath(source), in_range)
+    else:
+        message = f"`{source}` is not a directory, a file or `-`."
+        logger.error(message)
+        raise InvalidInput(message)
+    return _in_range(blocks, in_range)
+
+
+def _in_range(
+    blocks: Iterator[Tuple[str, dict]], in_range: "_BlockRange"
+) -> Iterator[Tuple[str, dict]]:
+    for origin, block in blocks:
+        if in_range.contains(block.get("number")):
+            yield origin, block
+
+
+def read_block_file(
+    file_path: Union[str, Path],
+    start_block: Optional[int] = None,
+    end_block: Optional[int] = None,
+) -> Optional[dict]:
+    """Reads one block file, compressed or not. Returns `None` when the file
+    can't be read as a block, or its block is out of range."""
+    file_path = os.fspath(file_path)
+    with open(file_path, "rb") as file_buffer:
+        block = _load_block_file(file_path, file_buffer.read())
+    if block is None or not _BlockRange(start_block, end_block).contains(block.get("number")):
+        return None
+    return block
+
+
+class _BlockRange:
+    """Checks block numbers against an optional, inclusive range."""
+
+    def __init__(self, start_block: Optional[int], end_block: Optional[int]):
+        self.start_block = start_block
+        self.end_block = end_block
+
+    def contains(self, block_number) -> bool:
+        if self.start_block is None and self.end_block is None:
+            return True
+        try:
+            block_number = int(block_number)
+        except (TypeError, ValueError):
+            return False
+        if self.start_block is not None and block_number < self.start_block:
+            return False
+        if self.end_block is not None and block_number > self.end_block:
+            return False
+        return True
+
+
+def _iter_directory(directory, in_range: _BlockRange) -> Iterator[Tuple[str, dict]]:
+    for file_path in iter_block_files(directory):
+        file_name = os.path.basename(file_path)
+        block_number = file_name.split(".", 1)[0]
+        # skip files by name before reading them
+        if block_number.isdigit() and not in_range.contains(block_number):
+            continue
+        with open(file_path, "rb") as file_buffer:
+            block = _load_block_file(file_path, file_buffer.read())
+        if block is not None:
+            yield file_path, block
+
+
+def _iter_file(file_path: str, in_range: _BlockRange) -> Iterator[Tuple[str, dict]]:
+    with open(file_path, "rb") as file_buffer:
+        yield from _iter_stream(file_path, file_buffer, in_range)
+
+
+def _iter_stream(
+    origin: str, stream: BinaryIO, in_range: _BlockRange
+) -> Iterator[Tuple[str, dict]]:
+    """Yields the blocks of a (possibly compressed) NDJSON stream or tar archive."""
+    stream = _decompress(origin, stream)
+    head, stream = _read_head(stream, TAR_MAGIC_OFFSET + len(TAR_MAGIC))
+    if head[TAR_MAGIC_OFFSET:].startswith(TAR_MAGIC):
+        yield from _iter_tar(origin, stream, in_range)
+    else:
+        yield from _iter_lines(origin, stream)
+
+
+def _iter_tar(
+    origin: str, stream: BinaryIO, in_range: _BlockRange
+) -> Iterator[Tuple[str, dict]]:
+    with tarfile.open(fileobj=stream, mode="r|") as archive:
+        for member in archive:
+            if not member.isfile():
+                continue
+            member_name = os.path.basename(member.name)
+            member_origin = f"{origin}:{member.name}"
+            if member_name.startswith("."):
+                continue
+            if member_name.endswith((BLOCK_FILE_SUFFIX, COMPRESSED_BLOCK_FILE_SUFFIX)):
+                block_number = member_name.split(".", 1)[0]
+                if block_number.isdigit() and not in_range.contains(block_number):
+                    continue
+                block = _load_block_file(member_origin, archive.extractfile(member).read())
+                if block is not None:
+                    yield member_origin, block
+            elif member_name.endswith((".ndjson", ".jsonl")):
+                yield from _iter_stream(
+                    member_origin, archive.extractfile(member), in_range
+                )
+
+
+def _iter_lines(origin: str, stream: BinaryIO) -> Iterator[Tuple[str, dict]]:
+    for line_number, line in enumerate(stream, start=1):
+        if not line.strip():
+            continue
+        line_origin = f"{origin}:{line_number}"
+        block = _load(line_origin, line)
+        if block is not None:
+            yield line_origin, block
+
+
+def _decompress(origin: str, stream: BinaryIO) -> io.BufferedReader:
+    """Returns a buffered stream of the decompressed content of `stream`."""
+    magic, stream = _read_head(stream, len(ZSTD_MAGIC))
+    if magic.startswith(GZIP_MAGIC):
+        return io.BufferedReader(gzip.GzipFile(fileobj=stream))
+    if magic.startswith(ZSTD_MAGIC):
+        try:
+            import zstandard
+        except ImportError as e:
+            message = f"`{origin}` is zstd compressed. Install `zstandard` to read it."
+            logger.error(message)
+            raise InvalidInput(message) from e
+        return io.BufferedReader(
+            zstandard.ZstdDecompressor().stream_reader(
+                stream, read_across_frames=True, closefd=False
+            )
+        )
+    return stream
+
+
+def _read_head(stream: BinaryIO, size: int) -> Tuple[bytes, io.BufferedReader]:
+    """Reads the first `size` bytes of a stream, or all of it when it's shorter,
+    and returns them with a buffered stream of the whole content.
+
+    `peek` can return fewer bytes than asked for, such as from a pipe or a
+    decompressor, so the head is read instead, and put back in front of the
+    rest of the stream."""
+    head = b""
+    while len(head) < size:
+        chunk = stream.read(size - len(head))
+        if not chunk:
+            break
+        head += chunk
+    return head, io.BufferedReader(_PrefixedStream(head, stream))
+
+
+class _PrefixedStream(io.RawIOBase):
+    """A raw stream of `prefix` followed by the rest of `stream`."""
+
+    def __init__(self, prefix: bytes, stream: BinaryIO):
+        self.prefix = prefix
+        self.stream = stream
+
+    def readable(self) -> bool:
+        return True
+
+    def readinto(self, buffer) -> int:
+        if self.prefix:
+            size = min(len(buffer), len(self.prefix))
+            buffer[:size] = self.prefix[:size]
+            self.prefix = self.prefix[size:]
+            return size
+        read = getattr(self.stream, "read1", self.stream.read)
+        data = read(len(buffer))
+        buffer[: len(data)] = data
+        return len(data)
+
+
+def _load_block_file(origin: str, content: bytes) -> Optional[dict]:
+    try:
+        content = decompress_block_file(content)
+    except (OSError, EOFError) as e:
+        logger.error(f"Corrupt gzip file: {origin}, {e}")
+        return None
+    return _load(origin, content)
+
+
+def _load(origin: str, content: bytes) -> Optional[dict]:
+    try:
+        return json.loads(content)
+    except (json.JSONDecodeError, UnicodeDecodeError) as e:
+        logger.error(f"JSONDecodeError Processing: {origin}, {e}")
+        return None
@@ -4,7 +4,7 @@ import datetime
 
 from polkadotetl.logger import logger
 from polkadotetl.core.types import TransferTypes
-from polkadotetl.constants import POLKADOT_TREASURY, DECIMAL_AFTER_REDENOMINATION, REWARD_DESTINATION_STASH, REWARD_DESTINATION_STAKED, REWARD_DESTINATION_CONTROLLER, REWARD_DESTINATION_ACCOUNT
+from polkadotetl.constants import POLKADOT_TREASURY, DECIMAL_AFTER_REDENOMINATION, REWARD_DESTINATION_STASH, REWARD_DESTINATION_STAKED, REWARD_DESTINATION_CONTROLLER, REWARD_DESTINATION_ACCOUNT, IGNORED_EXTRINSIC_PALLETS, ENRICHED_EVENTS
 from polkadotetl.exceptions import BlockNotFinalized
 from polkadotetl.warnings import NoTransactionsWarning
 
@@ -24,27 +24,12 @@ def enrich_block(sidecar_block_response: dict):
     # is in "paraInherent", "timestamp"
     extrinsics = sidecar_block_response["extrinsics"]
     block_timestamp = extrinsics[0]["args"]["now"]
-    ignored_extrinsic_pallets = [
-        "paraInherent",
-        "timestamp",
-    ]
+    # read up front, like `enrich_blocks`, so a block without it is rejected
+    # whether or not it has a `balances.Deposit` event
+    author_id = sidecar_block_response["authorId"]
+    ignored_extrinsic_pallets = IGNORED_EXTRINSIC_PALLETS
     # use only some events from every extrinsics
-    required_events = [
-        "balances.BalanceSet",
-        "balances.Deposit",
-        "balances.DustLost",
-        "balances.ReserveRepatriated",
-        "balances.Slashed",
-        "balances.Transfer",
-        "balances.TransferAllowDeath",
-        "claims.Claimed",
-        "identity.SubIdentityAdded",
-        "identity.SubIdentityRemoved",
-        "identity.SubIdentityRevoked",
-        "staking.Reward",
-        "staking.Rewarded",
-        "treasury.Deposit",
-    ]
+    required_events = ENRICHED_EVENTS
     txns = []
     for extrinsic in extrinsics:
         # ignore extrinsics where the method.pallet is not required
@@ -176,7 +161,6 @@ def enrich_block(sidecar_block_response: dict):
             elif event_type == "balances.Deposit":
                 # multiple cases
                 data = event["data"]
-                author_id = sidecar_block_response["authorId"]
                 validator = signer
                 address = data[0]
                 if address in (author_id, validator, POLKADOT_TREASURY):
@@ -0,0 +1,315 @@
+"""Columnar enrichment of many blocks at once.
+
+`enrich_block` formats, filters and converts one event at a time. For bulk
+backfills, `enrich_blocks` first pulls the relevant events of many blocks into
+column buffers (event type codes, interned addresses and the raw event data),
+and then computes the sender, receiver, type, value and fee columns one event
+type at a time. Amounts are kept as exact integer planck values until the rows
+are written out, where they are formatted the same way `enrich_block` does, so
+the output matches `enrich_block` row for row.
+"""
+import warnings
+from collections import defaultdict
+from typing import Dict, Iterable, List, Optional
+
+from polkadotetl.logger import logger
+from polkadotetl.core.types import TransferTypes
+from polkadotetl.constants import (
+    POLKADOT_TREASURY,
+    DECIMAL_AFTER_REDENOMINATION,
+    REWARD_DESTINATION_STASH,
+    REWARD_DESTINATION_STAKED,
+    REWARD_DESTINATION_CONTROLLER,
+    REWARD_DESTINATION_ACCOUNT,
+    IGNORED_EXTRINSIC_PALLETS,
+    ENRICHED_EVENTS,
+)
+from polkadotetl.exceptions import BlockNotFinalized
+from polkadotetl.warnings import NoTransactionsWarning
+
+TOKEN_ADDRESS = "0x0000"
+EVENT_CODES = {
+    tuple(event_type.split(".")): code for code, event_type in enumerate(ENRICHED_EVENTS)
+}
+
+# Marks the signer of the extrinsic as the sender or receiver of a rule.
+SIGNER = object()
+
+# event type: (sender, receiver, index of the amount in the event data, type, whether the amount is a fee)
+# The sender and receiver are either an index into the event data, `SIGNER` or a fixed address.
+# `balances.Deposit` and `staking.Rewarded` depend on more than their own event and
+# are computed separately.
+TRANSFER_RULES = {
+    "balances.Transfer": (SIGNER, 1, 2, TransferTypes.NORMAL, False),
+    "balances.TransferAllowDeath": (SIGNER, 1, 2, TransferTypes.NORMAL, False),
+    "treasury.Deposit": (SIGNER, POLKADOT_TREASURY, 0, TransferTypes.FEE, True),
+    "staking.Reward": (None, 0, 1, TransferTypes.NO_SENDER, False),
+    "claims.Claimed": (None, 0, 2, TransferTypes.NO_SENDER, False),
+    "identity.SubIdentityAdded": (0, 1, 2, TransferTypes.NORMAL, False),
+    "identity.SubIdentityRevoked": (0, 1, 2, TransferTypes.NORMAL, False),
+    "identity.SubIdentityRemoved": (0, 1, 2, TransferTypes.NORMAL, False),
+    "balances.ReserveRepatriated": (0, 1, 2, TransferTypes.NORMAL, False),
+    "balances.Slashed": (0, POLKADOT_TREASURY, 1, TransferTypes.NORMAL, False),
+    "balances.DustLost": (0, None, 1, TransferTypes.NO_RECEIVER, False),
+    "balances.BalanceSet": (None, 0, 1, TransferTypes.BALANCES_SET_BY_ROOT, False),
+}
+
+
+class EventColumns:
+    """Column buffers holding the enrichable events of many blocks.
+
+    Every event is a row. Per-block values (number, timestamp, author) are
+    stored once per block, and rows point at their block by index."""
+
+    def __init__(self):
+        self.block_numbers = []
+        self.block_timestamps = []
+        self.author_ids = []
+        self.block_indexes = []
+        self.transaction_hashes = []
+        self.event_codes = []
+        self.statuses = []
+        self.signers = []
+        self.event_data = []
+        self._interned = {}
+
+    def __len__(self):
+        return len(self.event_codes)
+
+    def intern(self, value: Optional[str]) -> Optional[str]:
+        """Returns a shared copy of an address or hash."""
+        if not isinstance(value, str):
+            return value
+        return self._interned.setdefault(value, value)
+
+    def add_block(self, sidecar_block_response: dict):
+        """Pulls the enrichable events of a block into the column buffers."""
+        block_number = sidecar_block_response["number"]
+        if not sidecar_block_response["finalized"]:
+            message = f"Block #{block_number} is not yet finalized. Cannot be enriched."
+            logger.error(message)
+            raise BlockNotFinalized(message)
+        extrinsics = sidecar_block_response["extrinsics"]
+        block_index = len(self.block_numbers)
+        self.block_numbers.append(block_number)
+        self.block_timestamps.append(int(extrinsics[0]["args"]["now"]) / 1000)
+        self.author_ids.append(sidecar_block_response["authorId"])
+
+        event_codes = EVENT_CODES
+        for extrinsic in extrinsics:
+            if extrinsic["method"]["pallet"] in IGNORED_EXTRINSIC_PALLETS:
+                continue
+            signer = SIGNER
+            for event in extrinsic["events"]:
+                method = event["method"]
+                code = event_codes.get((method["pallet"], method["method"]))
+                if code is None:
+                    continue
+                if signer is SIGNER:
+                    signer = self.intern(_get_signer(extrinsic["signature"]))
+                    transaction_hash = self.intern(extrinsic["hash"])
+                    status = extrinsic["success"]
+                self.block_indexes.append(block_index)
+                self.transaction_hashes.append(transaction_hash)
+                self.event_codes.append(code)
+                self.statuses.append(status)
+                self.signers.append(signer)
+                self.event_data.append(event["data"])
+
+    def compute(self) -> Dict[str, list]:
+        """Computes the sender, receiver, type, value and fee columns.
+
+        Values and fees are integer planck amounts. `None` stands for an amount
+        that `enrich_block` sets to a plain `0`, such as the value of a failed
+        extrinsic or the fee of a transfer."""
+        rows = len(self)
+        columns = dict(
+            sender_address=[None] * rows,
+            receiver_address=[None] * rows,
+            type=[0] * rows,
+            value=[None] * rows,
+            fee=[None] * rows,
+        )
+        rows_by_code = defaultdict(list)
+        for row, code in enumerate(self.event_codes):
+            rows_by_code[code].append(row)
+        for code, rows in rows_by_code.items():
+            event_type = ENRICHED_EVENTS[code]
+            if event_type == "balances.Deposit":
+                self._compute_deposits(rows, columns)
+            elif event_type == "staking.Rewarded":
+                self._compute_rewards(rows, columns)
+            else:
+                self._compute_transfers(rows, TRANSFER_RULES[event_type], columns)
+        return columns
+
+    def _party(self, rows: List[int], party) -> list:
+        """Returns the sender or receiver of `rows` for a rule."""
+        if party is SIGNER:
+            return [self.signers[row] for row in rows]
+        if isinstance(party, int):
+            event_data = self.event_data
+            return [self.intern(event_data[row][party]) for row in rows]
+        return [party] * len(rows)
+
+    def _amounts(self, rows: List[int], index: int, gated: bool) -> list:
+        """Returns the planck amounts at `index` of the event data of `rows`.
+
+        Gated amounts are only counted for successful extrinsics."""
+        event_data = self.event_data
+        if not gated:
+            return [int(event_data[row][index]) for row in rows]
+        statuses = self.statuses
+        return [
+            int(event_data[row][index]) if statuses[row] else None for row in rows
+        ]
+
+    def _compute_transfers(self, rows: List[int], rule: tuple, columns: Dict[str, list]):
+        sender, receiver, amount_index, type_, is_fee = rule
+        _scatter(columns["sender_address"], rows, self._party(rows, sender))
+        _scatter(columns["receiver_address"], rows, self._party(rows, receiver))
+        _scatter(columns["type"], rows, [type_.value] * len(rows))
+        if is_fee:
+            _scatter(columns["fee"], rows, self._amounts(rows, amount_index, gated=False))
+        else:
+            _scatter(columns["value"], rows, self._amounts(rows, amount_index, gated=True))
+
+    def _compute_deposits(self, rows: List[int], columns: Dict[str, list]):
+        # A deposit to the block author, the signer or the treasury is a fee.
+        event_data, signers = self.event_data, self.signers
+        author_ids, block_indexes = self.author_ids, self.block_indexes
+        fee_rows, value_rows = [], []
+        for row in rows:
+            address = event_data[row][0]
+            if address in (author_ids[block_indexes[row]], signers[row], POLKADOT_TREASURY):
+                fee_rows.append(row)
+            else:
+                value_rows.append(row)
+        _scatter(columns["sender_address"], fee_rows, self._party(fee_rows, SIGNER))
+        _scatter(columns["receiver_address"], fee_rows, self._party(fee_rows, 0))
+        _scatter(columns["type"], fee_rows, [TransferTypes.FEE.value] * len(fee_rows))
+        _scatter(columns["fee"], fee_rows, self._amounts(fee_rows, 1, gated=False))
+        _scatter(columns["receiver_address"], value_rows, self._party(value_rows, 0))
+        _scatter(
+            columns["type"], value_rows, [TransferTypes.NO_SENDER.value] * len(value_rows)
+        )
+        _scatter(columns["value"], value_rows, self._amounts(value_rows, 1, gated=True))
+
+    def _compute_rewards(self, rows: List[int], columns: Dict[str, list]):
+        # https://github.com/paritytech/polkadot-sdk/blob/master/substrate/frame/staking/src/lib.rs#L401
+        event_data, statuses = self.event_data, self.statuses
+        receivers, values = [], []
+        for row in rows:
+            data = event_data[row]
+            destination = data[1]
+            if REWARD_DESTINATION_STASH in destination:
+                receiver_address = data[0]
+            elif REWARD_DESTINATION_STAKED in destination:
+                receiver_address = data[0]
+            elif REWARD_DESTINATION_CONTROLLER in destination:
+                receiver_address = destination["Controller"]
+            elif REWARD_DESTINATION_ACCOUNT in destination:
+                receiver_address = destination["Account"]
+            else:
+                receiver_address = data[0]
+            receivers.append(self.intern(receiver_address))
+            # rewards paid to the stash have no value
+            if statuses[row] and REWARD_DESTINATION_STASH not in destination:
+                values.append(int(data[2]))
+            else:
+                values.append(None)
+        _scatter(columns["receiver_address"], rows, receivers)
+        _scatter(columns["type"], rows, [TransferTypes.NO_SENDER.value] * len(rows))
+        _scatter(columns["value"], rows, values)
+
+    def to_transactions(self) -> List[dict]:
+        """Returns the enriched transactions of all the blocks, in the same
+        order and with the same duplicates removed as `enrich_block`."""
+        columns = self.compute()
+        block_numbers, block_timestamps = self.block_numbers, self.block_timestamps
+        transactions = []
+        seen = set()
+        last_block_index = None
+        blocks_with_transactions = set()
+        for (
+            block_index,
+            transaction_hash,
+            sender_address,
+            receiver_address,
+            type_,
+            value,
+            fee,
+        ) in zip(
+            self.block_indexes,
+            self.transaction_hashes,
+            columns["sender_address"],
+            columns["receiver_address"],
+            columns["type"],
+            columns["value"],
+            columns["fee"],
+        ):
+            if block_index != last_block_index:
+                seen = set()
+                last_block_index = block_index
+            coin_value = _format_amount(value)
+            fee = _format_amount(fee)
+            key = (transaction_hash, sender_address, receiver_address, type_, coin_value, fee)
+            if key in seen:
+                continue
+            seen.add(key)
+            blocks_with_transactions.add(block_index)
+            transactions.append(
+                dict(
+                    block=block_numbers[block_index],
+                    transaction_hash=transaction_hash,
+                    sender_address=sender_address,
+                    receiver_address=receiver_address,
+                    type=type_,
+                    token_address=TOKEN_ADDRESS,
+                    coin_value=coin_value,
+                    fee=fee,
+                    block_timestamp=block_timestamps[block_index],
+                    log_index=0,
+                )
+            )
+        for block_index, block_number in enumerate(block_numbers):
+            if block_index not in blocks_with_transactions:
+                warnings.warn(
+                    f"Block #{block_number} doesn't have any transactions with relevant events.",
+                    NoTransactionsWarning,
+                )
+        return transactions
+
+
+def enrich_blocks(sidecar_block_responses: Iterable[dict]) -> List[dict]:
+    """Enriches many block responses from the sidecar at once.
+
+    Returns the same transactions as calling `enrich_block` on every block in
+    turn and concatenating the results."""
+    columns = EventColumns()
+    for sidecar_block_response in sidecar_block_responses:
+        columns.add_block(sidecar_block_response)
+    return columns.to_transactions()
+
+
+def _get_signer(signature: Optional[dict]) -> Optional[str]:
+    if signature is None:
+        return None
+    if isinstance(signature["signer"], dict):
+        return signature["signer"]["id"]
+    if isinstance(signature["signer"], str):
+        return signature["signer"]
+    raise TypeError(
+        "Signature signer is not a string or a dictionary. Value:{}".format(signature)
+    )
+
+
+def _format_amount(planck: Optional[int]) -> str:
+    if planck is None:
+        return "0"
+    return str(planck / DECIMAL_AFTER_REDENOMINATION)
+
+
+def _scatter(column: list, rows: List[int], values: list):
+    for row, value in zip(rows, values):
+        column[row] = value
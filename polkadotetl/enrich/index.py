@@ -0,0 +1,149 @@
+"""An on-disk index from addresses and transaction hashes to block numbers.
+
+The index is a SQLite database that `enrich` builds from the transactions it
+writes. Its tables are clustered by their key (`WITHOUT ROWID`), so the blocks
+of an address are stored together, in order, and a lookup reads a handful of
+pages no matter how large the index is. Rows are inserted idempotently, so the
+index can be updated incrementally by enriching more blocks into it, and
+enriching the same blocks twice leaves it unchanged.
+"""
+import os
+import sqlite3
+from pathlib import Path
+from typing import Dict, Iterable, List, Optional, Union
+
+from polkadotetl.exceptions import InvalidInput
+from polkadotetl.logger import logger
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS addresses (
+    address TEXT NOT NULL,
+    block INTEGER NOT NULL,
+    PRIMARY KEY (address, block)
+) WITHOUT ROWID;
+CREATE TABLE IF NOT EXISTS transactions (
+    hash TEXT NOT NULL,
+    block INTEGER NOT NULL,
+    PRIMARY KEY (hash, block)
+) WITHOUT ROWID;
+CREATE TABLE IF NOT EXISTS blocks (
+    block INTEGER PRIMARY KEY
+);
+"""
+
+
+class AddressIndex:
+    """Maps the sender and receiver addresses of enriched transactions, and
+    optionally their transaction hashes, to the blocks they appear in.
+
+    Use it as a context manager, so pending rows are written when it closes.
+    With `read_only`, an existing index is opened for lookups without creating
+    or changing anything, so it can be read while it is being updated, or from
+    a read-only file."""
+
+    def __init__(
+        self,
+        path: Union[str, Path],
+        index_hashes: bool = False,
+        read_only: bool = False,
+    ):
+        self.path = path
+        self.index_hashes = index_hashes
+        self.read_only = read_only
+        if read_only:
+            if not os.path.isfile(path):
+                message = f"`{path}` is not an address index."
+                logger.error(message)
+                raise InvalidInput(message)
+            self.connection = sqlite3.connect(
+                f"{Path(path).resolve().as_uri()}?mode=ro", uri=True
+            )
+        else:
+            self.connection = sqlite3.connect(path)
+            self.connection.executescript(SCHEMA)
+            self.connection.execute("PRAGMA journal_mode=WAL")
+
+    def __enter__(self) -> "AddressIndex":
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+    def close(self):
+        if not self.read_only:
+            self.connection.commit()
+        self.connection.close()
+
+    def add_transactions(
+        self, transactions: Iterable[dict], block_numbers: Iterable[int] = ()
+    ):
+        """Indexes enriched transactions, as produced by `enrich_block`, and
+        records `block_numbers` and the blocks of the transactions as indexed,
+        including the blocks without any transactions.
+
+        The rows are sorted before they are inserted, so they are appended to
+        the clustered tables in key order."""
+        addresses = set()
+        hashes = set()
+        blocks = set(block_numbers)
+        for transaction in transactions:
+            block_number = int(transaction["block"])
+            blocks.add(block_number)
+            for address in (
+                transaction["sender_address"],
+                transaction["receiver_address"],
+            ):
+                if address is not None:
+                    addresses.add((address, block_number))
+            if self.index_hashes and transaction["transaction_hash"] is not None:
+                hashes.add((transaction["transaction_hash"], block_number))
+        with self.connection:
+            self.connection.executemany(
+                "INSERT OR IGNORE INTO addresses VALUES (?, ?)", sorted(addresses)
+            )
+            self.connection.executemany(
+                "INSERT OR IGNORE INTO transactions VALUES (?, ?)", sorted(hashes)
+            )
+            self.connection.executemany(
+                "INSERT OR IGNORE INTO blocks VALUES (?)",
+                ((block_number,) for block_number in sorted(blocks)),
+            )
+
+    def lookup_address(
+        self,
+        address: str,
+        start_block: Optional[int] = None,
+        end_block: Optional[int] = None,
+    ) -> List[int]:
+        """Returns the blocks with transactions from or to `address`, in order."""
+        return self._lookup("addresses", "address", address, start_block, end_block)
+
+    def lookup_transaction(self, transaction_hash: str) -> List[int]:
+        """Returns the blocks of the transaction with this hash."""
+        return self._lookup("transactions", "hash", transaction_hash, None, None)
+
+    def stats(self) -> Dict[str, Optional[int]]:
+        """Returns the number of indexed blocks, with or without transactions,
+        and the lowest and highest of them."""
+        blocks, start_block, end_block = self.connection.execute(
+            "SELECT COUNT(*), MIN(block), MAX(block) FROM blocks"
+        ).fetchone()
+        return dict(blocks=blocks, start_block=start_block, end_block=end_block)
+
+    def _lookup(
+        self,
+        table: str,
+        column: str,
+        key: str,
+        start_block: Optional[int],
+        end_block: Optional[int],
+    ) -> List[int]:
+        rows = self.connection.execute(
+            f"SELECT block FROM {table} WHERE {column} = ? AND block BETWEEN ? AND ? ORDER BY block",
+            (
+                key,
+                -1 if start_block is None else start_block,
+                2 ** 63 - 1 if end_block is None else end_block,
+            ),
+        )
+        return [block_number for block_number, in rows]
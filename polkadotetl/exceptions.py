@@ -29,3 +29,8 @@ class PruningError(Exception):
 
         'Unable to fetch Events, cannot confirm extrinsic status. Check pruning settings on the node.'
     """
+
+
+class PolkadotNodeError(RequestException):
+    """Raised when a Substrate node answers a JSON-RPC call with an error,
+    or without a result that the call needs."""
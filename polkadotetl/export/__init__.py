@@ -1,15 +1,21 @@
 """Functions to export polkadot blocks from a sidecar"""
 from datetime import datetime
 from pathlib import Path
-from typing import Optional
+from typing import List, Optional
 
-from polkadotetl.constants import SIDECAR_RETRIES
+from polkadotetl.constants import SIDECAR_RETRIES, SIDECAR_RETRY_DELAY_IN_SECONDS
+from polkadotetl.core.layout import Layout
+from polkadotetl.exceptions import InvalidInput
+from polkadotetl.logger import logger
 from polkadotetl.export.internals import (
     InputType,
+    Partition,
     validate_inputs,
     export_blocks_by_number,
+    export_blocks_by_partition,
     export_blocks_by_timestamp,
 )
+from polkadotetl.export.projection import Projection
 
 
 def export_blocks(
@@ -20,9 +26,44 @@ def export_blocks(
     start_timestamp: Optional[datetime] = None,
     end_timestamp: Optional[datetime] = None,
     retries: int = SIDECAR_RETRIES,
-):
-    """Exports all blocks from a sidecar into a folder of jsons"""
+    partition: Optional[Partition] = None,
+    max_workers: int = 4,
+    batch_size: int = 1,
+    layout: Layout = Layout.FLAT,
+    projection: Optional[Projection] = None,
+    passthrough: bool = False,
+    compressed: bool = False,
+    concurrency: int = 1,
+    retry_max_delay: int = SIDECAR_RETRY_DELAY_IN_SECONDS,
+) -> List[str]:
+    """Exports all blocks from a sidecar into a folder of jsons.
+
+    When `partition` is set, the timestamp range is exported into a folder per
+    partition and the keys of the partitions that could not be completed are
+    returned. With a `projection`, blocks are pruned before they are written.
+    See `export_blocks_by_number` for the other options."""
     input_type = validate_inputs(start_block, end_block, start_timestamp, end_timestamp)
+    if partition is not None:
+        if input_type != InputType.TIMESTAMP:
+            message = "A partitioned export needs a start and an end timestamp."
+            logger.error(message)
+            raise InvalidInput(message)
+        return export_blocks_by_partition(
+            output_directory,
+            sidecar_url,
+            start_timestamp,
+            end_timestamp,
+            partition,
+            max_workers,
+            retries,
+            batch_size,
+            layout,
+            projection,
+            passthrough,
+            compressed,
+            concurrency,
+            retry_max_delay,
+        )
 
     if input_type == InputType.BLOCKS:
         export_blocks_by_number(
@@ -31,6 +72,13 @@ def export_blocks(
             start_block,
             end_block,
             retries,
+            batch_size,
+            layout,
+            projection,
+            passthrough,
+            compressed,
+            concurrency,
+            retry_max_delay,
         )
     else:
         export_blocks_by_timestamp(
@@ -39,4 +87,12 @@ def export_blocks(
             start_timestamp,
             end_timestamp,
             retries,
+            batch_size,
+            layout,
+            projection,
+            passthrough,
+            compressed,
+            concurrency,
+            retry_max_delay,
         )
+    return []
@@ -0,0 +1,230 @@
+"""Benchmarks a sidecar to find the export settings it handles best.
+
+`bench_sidecar` fetches a deterministic sample of block ranges at increasing
+concurrency, for every batch size, and measures the throughput, the latency
+percentiles and the error rate of every combination. A concurrency level is
+not raised further once its error rate goes over the limit, since a sidecar
+that starts failing only gets slower from there.
+
+The recommended settings can be saved as a profile, which `export-blocks`
+loads with `--profile`. Like `export-blocks`, it also benchmarks the JSON-RPC
+of a node, given a node url.
+"""
+import json
+import random
+import time
+from concurrent.futures import ThreadPoolExecutor
+from math import ceil
+from pathlib import Path
+from typing import Iterable, List, Optional, Union
+from urllib.parse import urlparse, urlunparse
+
+from polkadotetl.constants import SIDECAR_RETRIES, SIDECAR_RETRY_DELAY_IN_SECONDS
+from polkadotetl.exceptions import InvalidInput
+from polkadotetl.export.internals import _backend
+from polkadotetl.logger import logger
+
+PERCENTILES = (50, 90, 99)
+
+
+class TrialResult:
+    """The measurements of one concurrency level and batch size."""
+
+    def __init__(self, concurrency: int, batch_size: int):
+        self.concurrency = concurrency
+        self.batch_size = batch_size
+        self.requests = 0
+        self.errors = 0
+        self.blocks = 0
+        self.seconds = 0.0
+        self.latencies: List[float] = []
+
+    @property
+    def error_rate(self) -> float:
+        return self.errors / self.requests if self.requests else 0.0
+
+    @property
+    def blocks_per_second(self) -> float:
+        return self.blocks / self.seconds if self.seconds else 0.0
+
+    def percentile(self, percentile: int) -> Optional[float]:
+        """Returns a latency percentile in seconds, by the nearest-rank method."""
+        if not self.latencies:
+            return None
+        latencies = sorted(self.latencies)
+        return latencies[max(ceil(percentile / 100 * len(latencies)) - 1, 0)]
+
+    def to_dict(self) -> dict:
+        return dict(
+            concurrency=self.concurrency,
+            batch_size=self.batch_size,
+            requests=self.requests,
+            errors=self.errors,
+            error_rate=round(self.error_rate, 4),
+            blocks_per_second=round(self.blocks_per_second, 1),
+            **{
+                f"p{percentile}_seconds": None
+                if self.percentile(percentile) is None
+                else round(self.percentile(percentile), 4)
+                for percentile in PERCENTILES
+            },
+        )
+
+
+class SidecarProfile:
+    """The export settings recommended for a sidecar."""
+
+    def __init__(
+        self,
+        concurrency: int = 1,
+        batch_size: int = 1,
+        retries: int = SIDECAR_RETRIES,
+        retry_max_delay: int = SIDECAR_RETRY_DELAY_IN_SECONDS,
+        sidecar: Optional[str] = None,
+        measured: Optional[dict] = None,
+    ):
+        self.concurrency = concurrency
+        self.batch_size = batch_size
+        self.retries = retries
+        self.retry_max_delay = retry_max_delay
+        self.sidecar = sidecar
+        self.measured = measured
+
+    def to_dict(self) -> dict:
+        return dict(
+            sidecar=self.sidecar,
+            concurrency=self.concurrency,
+            batch_size=self.batch_size,
+            retries=self.retries,
+            retry_max_delay=self.retry_max_delay,
+            measured=self.measured,
+        )
+
+    def save(self, path: Union[str, Path]):
+        with open(path, "w") as file_buffer:
+            json.dump(self.to_dict(), file_buffer, indent=2)
+
+    @classmethod
+    def load(cls, path: Union[str, Path]) -> "SidecarProfile":
+        try:
+            with open(path) as file_buffer:
+                profile = json.load(file_buffer)
+            return cls(
+                concurrency=int(profile["concurrency"]),
+                batch_size=int(profile["batch_size"]),
+                retries=int(profile["retries"]),
+                retry_max_delay=int(profile["retry_max_delay"]),
+                sidecar=profile.get("sidecar"),
+                measured=profile.get("measured"),
+            )
+        except (OSError, ValueError, KeyError, TypeError) as e:
+            message = f"`{path}` is not a valid sidecar profile. {e}"
+            logger.error(message)
+            raise InvalidInput(message) from e
+
+
+def bench_sidecar(
+    sidecar_url: str,
+    start_block: int,
+    end_block: int,
+    concurrency_levels: Iterable[int] = (1, 2, 4, 8, 16),
+    batch_sizes: Iterable[int] = (1, 10, 50),
+    requests_per_trial: int = 32,
+    max_error_rate: float = 0.01,
+    seed: int = 0,
+) -> List[TrialResult]:
+    """Measures every combination of concurrency level and batch size against a
+    sidecar, over block ranges sampled between `start_block` and `end_block`.
+
+    Every trial makes `requests_per_trial` requests for ranges of `batch_size`
+    blocks. Requests aren't retried, so that errors show in the error rate."""
+    if start_block > end_block:
+        message = f"Start block number has to be smaller than end block number. {start_block=:,} and {end_block=:,}"
+        logger.error(message)
+        raise InvalidInput(message)
+    rng = random.Random(seed)
+    results = []
+    for batch_size in sorted(set(batch_sizes)):
+        for concurrency in sorted(set(concurrency_levels)):
+            starts = [
+                rng.randint(start_block, max(end_block - batch_size + 1, start_block))
+                for _ in range(requests_per_trial)
+            ]
+            result = _run_trial(sidecar_url, starts, concurrency, batch_size)
+            results.append(result)
+            logger.info(
+                f"{concurrency=}, {batch_size=}: {result.blocks_per_second:,.1f} blocks/s, "
+                f"p50 {result.percentile(50)}s, error rate {result.error_rate:.1%}"
+            )
+            if result.error_rate > max_error_rate:
+                logger.warning(
+                    f"Not raising the concurrency over {concurrency} for {batch_size=} as the error rate is too high."
+                )
+                break
+    return results
+
+
+def _run_trial(
+    sidecar_url: str, starts: List[int], concurrency: int, batch_size: int
+) -> TrialResult:
+    result = TrialResult(concurrency, batch_size)
+    backend = _backend(sidecar_url)
+
+    def fetch(start: int):
+        request_start = time.perf_counter()
+        try:
+            if batch_size == 1:
+                backend.get_block(sidecar_url, start)
+            else:
+                backend.get_blocks(sidecar_url, start, start + batch_size - 1)
+            error = False
+        except Exception as e:
+            logger.debug(f"Request for {batch_size} blocks from #{start:,} failed. {e}")
+            error = True
+        return time.perf_counter() - request_start, error
+
+    trial_start = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=concurrency) as executor:
+        for latency, error in executor.map(fetch, starts):
+            result.requests += 1
+            if error:
+                result.errors += 1
+            else:
+                result.blocks += batch_size
+                result.latencies.append(latency)
+    result.seconds = time.perf_counter() - trial_start
+    return result
+
+
+def recommend(
+    sidecar_url: str, results: List[TrialResult], max_error_rate: float = 0.01
+) -> SidecarProfile:
+    """Recommends the trial with the highest throughput within the error rate limit.
+
+    The maximum retry delay is a few times the p99 latency of that trial, and
+    requests are retried more often against a sidecar that had errors."""
+    acceptable = [
+        result
+        for result in results
+        if result.blocks and result.error_rate <= max_error_rate
+    ]
+    if not acceptable:
+        message = "No trial finished within the error rate limit. Unable to recommend settings."
+        logger.error(message)
+        raise InvalidInput(message)
+    best = max(acceptable, key=lambda result: result.blocks_per_second)
+    retry_max_delay = min(max(ceil(best.percentile(99) * 4), 1), SIDECAR_RETRY_DELAY_IN_SECONDS * 6)
+    retries = SIDECAR_RETRIES * 2 if best.errors else SIDECAR_RETRIES
+    return SidecarProfile(
+        concurrency=best.concurrency,
+        batch_size=best.batch_size,
+        retries=retries,
+        retry_max_delay=retry_max_delay,
+        sidecar=_redact(sidecar_url),
+        measured=best.to_dict(),
+    )
+
+
+def _redact(sidecar_url: str) -> str:
+    """Returns the sidecar url without its query, which probably has the API key."""
+    return urlunparse(urlparse(sidecar_url)._replace(query=""))
@@ -1,14 +1,27 @@
-from collections import defaultdict
-from datetime import datetime
+from bisect import bisect_right
+from datetime import date, datetime, timedelta
 from enum import Enum
+from itertools import chain
+from math import ceil, floor
+import gzip
 import json
 import pytz
 from pathlib import Path
-from typing import Optional
+from typing import Callable, Dict, List, Optional, Sequence, Tuple
 from polkadotetl.logger import logger
 from polkadotetl.exceptions import InvalidInput, NoBlockAtTimestamp
-from polkadotetl.constants import NEAREST_BLOCK_THRESHOLD_IN_SECONDS, SIDECAR_RETRIES
-from polkadotetl.export import sidecar
+from polkadotetl.constants import (
+    BLOCK_FILE_COMPRESSION_LEVEL,
+    NEAREST_BLOCK_THRESHOLD_IN_SECONDS,
+    POLKADOT_BLOCK_TIME_IN_SECONDS,
+    SIDECAR_MAX_RANGE_SIZE,
+    SIDECAR_RANGE_RETRIES,
+    SIDECAR_RETRIES,
+    SIDECAR_RETRY_DELAY_IN_SECONDS,
+)
+from polkadotetl.core.layout import Layout, block_file_path, write_block_file
+from polkadotetl.export import node, sidecar
+from polkadotetl.export.projection import Projection
 from tenacity import RetryError
 
 
@@ -19,6 +32,36 @@ class InputType(Enum):
     TIMESTAMP = 1
 
 
+class Partition(str, Enum):
+    """Determines how a timestamp range is split for a partitioned export."""
+
+    DAY = "day"
+    HOUR = "hour"
+
+    @property
+    def length(self) -> timedelta:
+        return timedelta(days=1) if self is Partition.DAY else timedelta(hours=1)
+
+    def floor(self, timestamp: datetime) -> datetime:
+        """Returns the start of the partition that `timestamp` falls in."""
+        timestamp = timestamp.replace(minute=0, second=0, microsecond=0)
+        if self is Partition.DAY:
+            timestamp = timestamp.replace(hour=0)
+        return timestamp
+
+    def key(self, partition_start: datetime) -> str:
+        """Returns the name of a partition, which is also its directory name."""
+        if self is Partition.DAY:
+            return partition_start.strftime("%Y-%m-%d")
+        return partition_start.strftime("%Y-%m-%dT%H")
+
+
+def _backend(url: str):
+    """Returns the module that reads blocks from `url`: `node` for the JSON-RPC
+    of a Substrate node, and `sidecar` otherwise."""
+    return node if node.is_node_url(url) else sidecar
+
+
 def validate_inputs(
     start_block: Optional[int] = None,
     end_block: Optional[int] = None,
@@ -66,83 +109,35 @@ def get_block_for_timestamp(
     timestamp: datetime,
     threshold_in_seconds=NEAREST_BLOCK_THRESHOLD_IN_SECONDS,
     search_for_next_block=True
-    # If set to False, the first block before `timestamp` parameter will be returned
-    # else, the first block after `timestamp` parameter is returned
+    # If set to False, the last block on or before `timestamp` parameter will be returned
+    # else, the first block on or after `timestamp` parameter is returned
 ):
     """Returns the nearest block number for a particular timestamp.
-    `threshold_in_seconds` controls the closeness of the block.
-    """
-    start_block_number = 1
 
+    The search is exact, so `threshold_in_seconds` is no longer used and is
+    only kept for compatibility.
+    """
     if not timestamp.tzinfo:
         timestamp = pytz.utc.localize(timestamp)
         # if no timezone is passed assume UTC
-
-    requestor = sidecar.PolkadotRequestor()
-    get_block = requestor.build_requestor(sidecar.get_block)
-    end_block_response = get_block(sidecar_url, "head")
-    end_block_number = int(end_block_response["number"])
-    low = start_block_number
-    high = end_block_number
-    mid = low
-    logger.debug(
-        f"Searching for a block that occurs at {timestamp:} between {low:,} and {high:,} blocks."
-    )
-    # NOTE: use binary search algorithm to get the block number for this timestamp
-    searched = defaultdict(int)
-    last_mid = None
-    last_timestamp = None
-
-    while low <= high:
-        mid = (high + low) // 2
-        logger.debug(f"Checking if block #{mid:,} happens at {timestamp.timestamp():,}")
-        response = get_block(sidecar_url, mid)
-        # get the timestamp out of the first extrinsic
-        current_timestamp = int(response["extrinsics"][0]["args"]["now"]) / 1000
-        # divide by 1000 because it is in milliseconds
-        actual_timestamp = datetime.utcfromtimestamp(current_timestamp)
-        difference = timestamp - pytz.utc.localize(actual_timestamp)
-        logger.debug(
-            f"Block #{mid:,} happens at {current_timestamp:,}. Difference=`{difference}`"
+    if search_for_next_block:
+        block_number, head_block_number = _search_blocks_for_timestamps(
+            sidecar_url, [timestamp]
         )
-
-        if current_timestamp < int(timestamp.timestamp()):
-            low = mid + 1
-        elif current_timestamp > int(timestamp.timestamp()):
-            high = mid - 1
-        else:
-            logger.debug(f"Found block #{mid:,} at timestamp {timestamp.timestamp():,}")
-            return mid
-
-        # NOTE: doing this because the blocks will not happen at exact timestamp values so we need the nearest one.
-        if last_mid is not None:
-            if abs(last_timestamp - timestamp.timestamp()) < threshold_in_seconds:
-                if (
-                    last_timestamp - timestamp.timestamp() >= 0.0 
-                    and
-                    search_for_next_block
-                ):
-                    nearest = last_mid
-                    nearest_timestamp_epoch = last_timestamp
-
-                elif (
-                    last_timestamp - timestamp.timestamp() > 0.0 
-                    and
-                    not search_for_next_block
-                ):
-                    nearest = mid
-                    nearest_timestamp_epoch = current_timestamp
-                nearest_timestamp = datetime.utcfromtimestamp(nearest_timestamp_epoch)
-                diff = timestamp - pytz.utc.localize(nearest_timestamp)
-                logger.warning(
-                    f"Could not find an exact block at timestamp {timestamp:}. The nearest block is {nearest:,} at {nearest_timestamp}. Difference={diff}"
-                )
-                return nearest
-        last_mid = mid
-        last_timestamp = current_timestamp
-    message = f"There is no block at timestamp `{timestamp}. Last searched block: {mid:,}. {actual_timestamp=}, {difference=}`."
-    logger.error(message)
-    raise NoBlockAtTimestamp(message)
+        found = block_number[0] <= head_block_number
+    else:
+        # block timestamps are in milliseconds, so this is the first block after `timestamp`
+        block_number, _ = _search_blocks_for_timestamps(
+            sidecar_url, [timestamp + timedelta(milliseconds=1)]
+        )
+        block_number[0] -= 1
+        found = block_number[0] >= 1
+    if not found:
+        message = f"There is no block at timestamp `{timestamp}`."
+        logger.error(message)
+        raise NoBlockAtTimestamp(message)
+    logger.debug(f"Found block #{block_number[0]:,} for timestamp {timestamp}")
+    return block_number[0]
 
 
 def export_blocks_by_timestamp(
@@ -151,6 +146,13 @@ def export_blocks_by_timestamp(
     start_timestamp: Optional[datetime] = None,
     end_timestamp: Optional[datetime] = None,
     retries: int = SIDECAR_RETRIES,
+    batch_size: int = 1,
+    layout: Layout = Layout.FLAT,
+    projection: Optional[Projection] = None,
+    passthrough: bool = False,
+    compressed: bool = False,
+    concurrency: int = 1,
+    retry_max_delay: int = SIDECAR_RETRY_DELAY_IN_SECONDS,
 ):
     """Exports blocks from the sidecar by block timestamp"""
     # TODO: Implement this function
@@ -170,6 +172,13 @@ def export_blocks_by_timestamp(
         start_block,
         end_block,
         retries,
+        batch_size,
+        layout,
+        projection,
+        passthrough,
+        compressed,
+        concurrency,
+        retry_max_delay,
     )
 
 
@@ -179,58 +188,539 @@ def export_blocks_by_number(
     start_block: int,
     end_block: int,
     retries: int = SIDECAR_RETRIES,
-):
-    """Exports blocks from the sidecar by block number"""
+    batch_size: int = 1,
+    layout: Layout = Layout.FLAT,
+    projection: Optional[Projection] = None,
+    passthrough: bool = False,
+    compressed: bool = False,
+    concurrency: int = 1,
+    retry_max_delay: int = SIDECAR_RETRY_DELAY_IN_SECONDS,
+) -> List[int]:
+    """Exports blocks from the sidecar by block number.
+
+    With a `batch_size` over 1, blocks are fetched with the sidecar's range
+    query instead of one request per block. See `_export_blocks_in_batches`.
+    With a `projection`, blocks are pruned before they are written.
+
+    `sidecar_url` can also be the url of a node's JSON-RPC, in which case
+    blocks are read from the node and assembled into sidecar block responses.
+    See `polkadotetl.export.node`.
+
+    With `passthrough`, the raw bytes of every block response are written as
+    they are received, without decoding and encoding the json, after a light
+    check. See `sidecar.get_raw_block`. With `compressed`, block files are
+    written gzip compressed, as `{block_number}.json.gz`.
+
+    With a `concurrency` over 1, the range is split into segments that are
+    exported by that many threads. `retry_max_delay` caps the backoff between
+    retries of a request.
+
+    Returns the block numbers that could not be exported."""
     if start_block > end_block:
-        message = f"Start block number has to be smaller than end block number. {start=:,} and {end=:,}"
+        message = f"Start block number has to be smaller than end block number. {start_block=:,} and {end_block=:,}"
         logger.error(message)
         raise InvalidInput(message)
-    requestor = sidecar.PolkadotRequestor(retries=retries)
-    get_block = requestor.build_requestor(sidecar.get_block)
+    if passthrough and projection is not None:
+        message = "Passthrough writes blocks as they are received, so it can't be combined with a projection."
+        logger.error(message)
+        raise InvalidInput(message)
+    if passthrough and batch_size > 1:
+        message = "Passthrough fetches one block per request, so it can't be combined with a batch size over 1."
+        logger.error(message)
+        raise InvalidInput(message)
+    backend = _backend(sidecar_url)
+    if passthrough and backend is node:
+        message = "Passthrough writes sidecar responses as they are received, so it can't read blocks from a node."
+        logger.error(message)
+        raise InvalidInput(message)
+    requestor = sidecar.PolkadotRequestor(retries=retries, retry_max_delay=retry_max_delay)
+    get_block = requestor.build_requestor(backend.get_block)
+    get_raw_block = requestor.build_requestor(sidecar.get_raw_block)
+    if projection is not None and backend is sidecar:
+        sidecar_url = projection.sidecar_url(sidecar_url)
     logger.info(
         f"Getting {end_block - start_block + 1:,} blocks between {start_block:,} and {end_block:,}"
     )
-    for block_number in range(start_block, end_block + 1):
-        try:
-            response = get_block(sidecar_url, block_number)
-            response_json_path = output_directory / f"{block_number}.json"
-            with open(response_json_path, "w") as file_buffer:
-                file_buffer.write(json.dumps(response))
-                logger.debug(
-                    f"Wrote block response of block #{block_number} to {response_json_path}."
+
+    def export_segment(segment_start: int, segment_end: int) -> List[int]:
+        if batch_size > 1:
+            return _export_blocks_in_batches(
+                output_directory, sidecar_url, segment_start, segment_end, get_block, batch_size, layout, projection, compressed, retry_max_delay, retries
+            )
+        failed_blocks = []
+        for block_number in range(segment_start, segment_end + 1):
+            try:
+                if passthrough:
+                    write_block_file(
+                        block_file_path(output_directory, block_number, layout, compressed),
+                        get_raw_block(sidecar_url, block_number, compressed),
+                    )
+                else:
+                    response = get_block(sidecar_url, block_number)
+                    _write_block(output_directory, block_number, response, layout, projection, compressed)
+            except RetryError:
+                logger.error(f"Unable to export block {block_number} due to retry failures")
+                failed_blocks.append(block_number)
+        return failed_blocks
+
+    if concurrency > 1:
+        from concurrent.futures import ThreadPoolExecutor
+
+        segments = _split_range(start_block, end_block, concurrency, batch_size)
+        with ThreadPoolExecutor(max_workers=concurrency) as executor:
+            failed_blocks = sorted(
+                chain.from_iterable(
+                    executor.map(lambda segment: export_segment(*segment), segments)
                 )
+            )
+    else:
+        failed_blocks = export_segment(start_block, end_block)
+
+    logger.debug(f"Wrote {end_block - start_block + 1 - len(failed_blocks)} blocks to {output_directory}.")
+    return failed_blocks
+
+
+def _split_range(
+    start_block: int, end_block: int, concurrency: int, batch_size: int
+) -> List[Tuple[int, int]]:
+    """Splits a range of blocks into segments for concurrent workers.
+
+    There are a few segments per worker, so that a worker that finishes early
+    picks up another segment instead of idling, but no segment is smaller than
+    a batch."""
+    segments_per_worker = 4
+    segment_size = max(
+        ceil((end_block - start_block + 1) / (concurrency * segments_per_worker)),
+        min(batch_size, SIDECAR_MAX_RANGE_SIZE),
+    )
+    return [
+        (segment_start, min(segment_start + segment_size - 1, end_block))
+        for segment_start in range(start_block, end_block + 1, segment_size)
+    ]
+
+
+def _export_blocks_in_batches(
+    output_directory: Path,
+    sidecar_url: str,
+    start_block: int,
+    end_block: int,
+    get_block: Callable,
+    batch_size: int,
+    layout: Layout,
+    projection: Optional[Projection] = None,
+    compressed: bool = False,
+    retry_max_delay: int = SIDECAR_RETRY_DELAY_IN_SECONDS,
+    retries: int = SIDECAR_RETRIES,
+) -> List[int]:
+    """Exports blocks with `/blocks?range=` queries and returns the blocks that
+    could not be exported.
+
+    The batch size adapts to the sidecar: it doubles after every successful
+    batch, up to `batch_size`, and halves after a failure. A failed batch is
+    split in halves until the blocks that can't be fetched are isolated, and
+    these are fetched one at a time as a last resort. Range queries are tried
+    at most `SIDECAR_RANGE_RETRIES` times, and never more than `retries`,
+    since splitting them is a retry in itself.
+    """
+    max_batch_size = min(batch_size, SIDECAR_MAX_RANGE_SIZE)
+    get_blocks = sidecar.PolkadotRequestor(
+        retries=min(retries, SIDECAR_RANGE_RETRIES), retry_max_delay=retry_max_delay
+    ).build_requestor(_backend(sidecar_url).get_blocks)
+    failed_blocks = []
+
+    def export_range(low: int, high: int) -> bool:
+        """Exports blocks `low` to `high` and returns whether the range query worked."""
+        if low == high:
+            try:
+                _write_block(output_directory, low, get_block(sidecar_url, low), layout, projection, compressed)
+            except RetryError:
+                logger.error(f"Unable to export block {low} due to retry failures")
+                failed_blocks.append(low)
+            return True
+        try:
+            responses = get_blocks(sidecar_url, low, high)
         except RetryError:
-            logger.error(f"Unable to export block {block_number} due to retry failures")
+            logger.warning(f"Unable to export blocks {low}-{high}. Splitting the range.")
+            mid = (low + high) // 2
+            export_range(low, mid)
+            export_range(mid + 1, high)
+            return False
+        for block_number, response in zip(range(low, high + 1), responses):
+            _write_block(output_directory, block_number, response, layout, projection, compressed)
+        return True
+
+    current_batch_size = max_batch_size
+    block_number = start_block
+    while block_number <= end_block:
+        batch_end = min(block_number + current_batch_size - 1, end_block)
+        if export_range(block_number, batch_end):
+            current_batch_size = min(current_batch_size * 2, max_batch_size)
+        else:
+            current_batch_size = max(current_batch_size // 2, 2)
+        block_number = batch_end + 1
+    return sorted(failed_blocks)
+
+
+def _write_block(
+    output_directory: Path,
+    block_number: int,
+    response: dict,
+    layout: Layout,
+    projection: Optional[Projection] = None,
+    compressed: bool = False,
+):
+    """Writes one block response, projected if a projection is given, to its own file."""
+    if projection is not None:
+        response = projection.project(response)
+    response_json_path = block_file_path(output_directory, block_number, layout, compressed)
+    content = json.dumps(response)
+    if compressed:
+        content = gzip.compress(content.encode(), compresslevel=BLOCK_FILE_COMPRESSION_LEVEL)
+    write_block_file(response_json_path, content)
+    logger.debug(
+        f"Wrote block response of block #{block_number} to {response_json_path}."
+    )
 
-    logger.debug(f"Wrote {end_block - start_block + 1} blocks to {output_directory}.")
+
+def export_blocks_by_partition(
+    output_directory: Path,
+    sidecar_url: str,
+    start_timestamp: datetime,
+    end_timestamp: datetime,
+    partition: Partition = Partition.DAY,
+    max_workers: int = 4,
+    retries: int = SIDECAR_RETRIES,
+    batch_size: int = 1,
+    layout: Layout = Layout.FLAT,
+    projection: Optional[Projection] = None,
+    passthrough: bool = False,
+    compressed: bool = False,
+    concurrency: int = 1,
+    retry_max_delay: int = SIDECAR_RETRY_DELAY_IN_SECONDS,
+):
+    """Exports the blocks of every day or hour partition between two timestamps
+    into a directory per partition, exporting several partitions in parallel.
+
+    A partition is written into a hidden `.{key}.partial` directory first and
+    renamed to `{key}` once all of its blocks are exported, so a `{key}`
+    directory is always complete and can be loaded as soon as it appears.
+    Partitions that are already complete are skipped, as are partitions that
+    the chain hasn't finished yet.
+    """
+    from concurrent.futures import ThreadPoolExecutor, as_completed
+
+    if start_timestamp > end_timestamp:
+        message = f"Start timestamp has to be before end timestamp. {start_timestamp=:} and {end_timestamp=:}"
+        logger.error(message)
+        raise InvalidInput(message)
+    block_ranges = get_block_ranges_for_partitions(
+        sidecar_url, start_timestamp, end_timestamp, partition, retries
+    )
+    pending = {}
+    for partition_start, block_range in block_ranges.items():
+        key = partition.key(partition_start)
+        if (output_directory / key).is_dir():
+            logger.info(f"Skipping partition {key} as it's already exported.")
+            continue
+        pending[key] = block_range
+    logger.info(
+        f"Exporting {len(pending):,} partitions by {partition.value} with {max_workers} workers."
+    )
+
+    def export_partition(key: str, start_block: int, end_block: int) -> List[int]:
+        partial_directory = output_directory / f".{key}.partial"
+        partial_directory.mkdir(exist_ok=True)
+        failed_blocks = export_blocks_by_number(
+            partial_directory,
+            sidecar_url,
+            start_block,
+            end_block,
+            retries,
+            batch_size,
+            layout,
+            projection,
+            passthrough,
+            compressed,
+            concurrency,
+            retry_max_delay,
+        )
+        if not failed_blocks:
+            partial_directory.rename(output_directory / key)
+        return failed_blocks
+
+    incomplete_partitions = []
+    with ThreadPoolExecutor(max_workers=max_workers) as executor:
+        futures = {
+            executor.submit(export_partition, key, *block_range): key
+            for key, block_range in pending.items()
+        }
+        for future in as_completed(futures):
+            key = futures[future]
+            failed_blocks = future.result()
+            if failed_blocks:
+                logger.error(
+                    f"Partition {key} is incomplete. Unable to export {len(failed_blocks):,} blocks."
+                )
+                incomplete_partitions.append(key)
+            else:
+                logger.info(f"Completed partition {key}.")
+    return sorted(incomplete_partitions)
 
 
 def get_block_on_or_after_timestamp(
     sidecar_url: str,
     timestamp: datetime    
 ):
-    return get_block_for_timestamp(sidecar_url=sidecar_url, timestamp=timestamp)
+    return get_blocks_for_timestamps(sidecar_url, [timestamp])[0]
 
 
 def get_block_before_timestamp(
     sidecar_url: str,
     timestamp: datetime    
 ):
-    return (
-        get_block_for_timestamp(sidecar_url=sidecar_url, timestamp=timestamp) - 1
+    return get_block_on_or_after_timestamp(sidecar_url, timestamp) - 1
+
+
+def get_blocks_for_timestamps(
+    sidecar_url: str,
+    timestamps: Sequence[datetime],
+    retries: int = SIDECAR_RETRIES,
+    parallel_probes: int = 1,
+) -> List[int]:
+    """Returns the first block produced on or after each of the sorted `timestamps`.
+
+    All timestamps are resolved in a single search: every probed block
+    narrows the bounds of all the timestamps around it, so neighbouring
+    timestamps share their probes instead of each running a search from
+    block 1 to the head. A timestamp later than the head block resolves to
+    `head + 1`. See `_search_blocks_for_timestamps` for how blocks are probed.
+    """
+    blocks, _ = _search_blocks_for_timestamps(
+        sidecar_url, timestamps, retries, parallel_probes
+    )
+    return blocks
+
+
+def _search_blocks_for_timestamps(
+    sidecar_url: str,
+    timestamps: Sequence[datetime],
+    retries: int = SIDECAR_RETRIES,
+    parallel_probes: int = 1,
+) -> Tuple[List[int], int]:
+    """Implements `get_blocks_for_timestamps` and also returns the head block number.
+
+    The search runs in rounds. In every round, the block of each unresolved
+    timestamp is estimated by interpolating between the nearest probed blocks
+    (or from the ~6 second block time, next to the head), and that block and
+    the one before it are probed, which usually brackets the timestamp in one
+    or two rounds. Ranges that interpolation doesn't halve are also bisected
+    in the next round, so the search is never slower than a binary search.
+    Up to `parallel_probes` timestamps of a range are estimated per round.
+    When a range has fewer timestamps than that, it is also split evenly by
+    `parallel_probes` blocks, so a single timestamp is found in fewer rounds.
+    The blocks of a round are probed concurrently. Probes only request
+    the timestamp extrinsic of a block, not the whole block.
+    """
+    from concurrent.futures import ThreadPoolExecutor
+
+    epochs = []
+    for timestamp in timestamps:
+        if not timestamp.tzinfo:
+            # if no timezone is passed assume UTC
+            timestamp = pytz.utc.localize(timestamp)
+        epochs.append(timestamp.timestamp())
+    if any(earlier > later for earlier, later in zip(epochs, epochs[1:])):
+        message = "Timestamps have to be sorted in ascending order."
+        logger.error(message)
+        raise InvalidInput(message)
+
+    backend = _backend(sidecar_url)
+    requestor = sidecar.PolkadotRequestor(retries=retries)
+    get_head_block_number = requestor.build_requestor(backend.get_head_block_number)
+    get_block_timestamp = requestor.build_requestor(backend.get_block_timestamp)
+    head_block_number = get_head_block_number(sidecar_url)
+    probes = {head_block_number: get_block_timestamp(sidecar_url, head_block_number)}
+
+    blocks = [head_block_number + 1] * len(epochs)
+    # Every pending search is (low, high, first, last, stalled): the answers for
+    # epochs[first:last] all lie within the block range [low, high], and
+    # `stalled` is set when the last round didn't halve the range.
+    pending = [(1, head_block_number + 1, 0, len(epochs), False)]
+    rounds = 0
+    with ThreadPoolExecutor(max_workers=max(parallel_probes, 1)) as executor:
+        while pending:
+            rounds += 1
+            round_probes = set()
+            for low, high, first, last, stalled in pending:
+                targets = min(max(parallel_probes, 1), last - first)
+                for target in range(targets):
+                    epoch = epochs[first + (2 * target + 1) * (last - first) // (2 * targets)]
+                    estimate = _estimate_block(epoch, low, high, probes)
+                    round_probes.update({max(estimate - 1, low), estimate})
+                if targets < parallel_probes:
+                    # an estimate can miss, so the range is also split evenly,
+                    # which narrows it by `parallel_probes + 1` in any case
+                    round_probes.update(
+                        low + (high - low) * probe // (parallel_probes + 1)
+                        for probe in range(1, parallel_probes + 1)
+                    )
+                if stalled:
+                    round_probes.add((low + high) // 2)
+            round_probes = sorted(round_probes - probes.keys())
+            logger.debug(f"Probing blocks {round_probes}")
+            for block_number, block_timestamp in zip(
+                round_probes,
+                executor.map(
+                    lambda block_number: get_block_timestamp(sidecar_url, block_number),
+                    round_probes,
+                ),
+            ):
+                probes[block_number] = block_timestamp
+
+            next_pending = []
+            for low, high, first, last, _ in pending:
+                for sub_low, sub_high, sub_first, sub_last in _split_search(
+                    low, high, first, last, epochs, probes
+                ):
+                    if sub_first >= sub_last:
+                        continue
+                    if sub_low == sub_high:
+                        blocks[sub_first:sub_last] = [sub_low] * (sub_last - sub_first)
+                        continue
+                    stalled = (sub_high - sub_low) * 2 > high - low
+                    next_pending.append((sub_low, sub_high, sub_first, sub_last, stalled))
+            pending = next_pending
+    logger.debug(
+        f"Resolved {len(epochs):,} timestamps with {len(probes):,} block probes in {rounds} rounds."
+    )
+    return blocks, head_block_number
+
+
+def _estimate_block(epoch: float, low: int, high: int, probes: Dict[int, float]) -> int:
+    """Estimates the first block on or after `epoch` within [low, high - 1]
+    from the probed blocks around the range."""
+    left = low - 1 if low - 1 in probes else None
+    right = next((block for block in (high, high - 1) if block in probes), None)
+    if left is not None and right is not None and probes[right] > probes[left]:
+        estimate = left + ceil(
+            (epoch - probes[left]) / (probes[right] - probes[left]) * (right - left)
+        )
+    elif right is not None:
+        estimate = right - floor((probes[right] - epoch) / POLKADOT_BLOCK_TIME_IN_SECONDS)
+    elif left is not None:
+        estimate = left + ceil((epoch - probes[left]) / POLKADOT_BLOCK_TIME_IN_SECONDS)
+    else:
+        estimate = (low + high) // 2
+    return min(max(estimate, low), high - 1)
+
+
+def _split_search(
+    low: int,
+    high: int,
+    first: int,
+    last: int,
+    epochs: List[float],
+    probes: Dict[int, float],
+) -> List[Tuple[int, int, int, int]]:
+    """Splits a pending search around every probed block within it."""
+    searches = []
+    for block_number in sorted(block for block in probes if low <= block < high):
+        # epochs up to the probed block's timestamp are answered by it or an earlier block
+        split = bisect_right(epochs, probes[block_number], first, last)
+        searches.append((low, block_number, first, split))
+        low, first = block_number + 1, split
+    searches.append((low, high, first, last))
+    return searches
+
+
+def get_block_ranges_for_dates(
+    sidecar_url: str,
+    start_date: date,
+    end_date: date,
+    retries: int = SIDECAR_RETRIES,
+    parallel_probes: int = 1,
+) -> Dict[date, Tuple[int, int]]:
+    """Returns the (start block, end block) of every UTC day between
+    `start_date` and `end_date`, both inclusive.
+
+    Days that have no blocks yet are left out. The range of a day that is
+    still in progress ends at the head block."""
+    if start_date > end_date:
+        message = f"Start date has to be before end date. {start_date=:} and {end_date=:}"
+        logger.error(message)
+        raise InvalidInput(message)
+    days = [
+        datetime(start_date.year, start_date.month, start_date.day, tzinfo=pytz.utc)
+        + offset * Partition.DAY.length
+        for offset in range((end_date - start_date).days + 2)
+    ]
+    block_ranges = _get_block_ranges(
+        sidecar_url, days, retries, include_open=True, parallel_probes=parallel_probes
+    )
+    return {day.date(): block_range for day, block_range in block_ranges.items()}
+
+
+def get_block_ranges_for_partitions(
+    sidecar_url: str,
+    start_timestamp: datetime,
+    end_timestamp: datetime,
+    partition: Partition = Partition.DAY,
+    retries: int = SIDECAR_RETRIES,
+) -> Dict[datetime, Tuple[int, int]]:
+    """Returns the (start block, end block) of every partition overlapping the
+    range between `start_timestamp` and `end_timestamp`, keyed by the start of
+    the partition.
+
+    Only whole partitions are returned, so the range is widened to the
+    partition boundaries. Partitions the chain hasn't finished yet are left out."""
+    if not start_timestamp.tzinfo:
+        start_timestamp = pytz.utc.localize(start_timestamp)
+    if not end_timestamp.tzinfo:
+        end_timestamp = pytz.utc.localize(end_timestamp)
+    boundary = partition.floor(start_timestamp.astimezone(pytz.utc))
+    boundaries = [boundary]
+    while boundary <= end_timestamp:
+        boundary += partition.length
+        boundaries.append(boundary)
+    return _get_block_ranges(sidecar_url, boundaries, retries, include_open=False)
+
+
+def _get_block_ranges(
+    sidecar_url: str,
+    boundaries: List[datetime],
+    retries: int,
+    include_open: bool,
+    parallel_probes: int = 1,
+) -> Dict[datetime, Tuple[int, int]]:
+    """Returns the block range between every pair of consecutive `boundaries`."""
+    boundary_blocks, head_block_number = _search_blocks_for_timestamps(
+        sidecar_url, boundaries, retries, parallel_probes
     )
+    block_ranges = {}
+    for boundary, start_block, next_start_block in zip(
+        boundaries, boundary_blocks, boundary_blocks[1:]
+    ):
+        if start_block > next_start_block - 1:
+            logger.warning(f"There are no blocks in the range starting at {boundary}.")
+            continue
+        if next_start_block > head_block_number and not include_open:
+            logger.warning(f"The range starting at {boundary} is still being produced.")
+            continue
+        block_ranges[boundary] = (start_block, next_start_block - 1)
+    return block_ranges
 
 
 def get_latest_block(
         sidecar_url: str,
 ):
+    backend = _backend(sidecar_url)
     requestor = sidecar.PolkadotRequestor()
-    get_block = requestor.build_requestor(sidecar.get_block)
-    end_block_response = get_block(sidecar_url, "head")
-    print(end_block_response)
+    get_head_block_number = requestor.build_requestor(backend.get_head_block_number)
+    get_block_timestamp = requestor.build_requestor(backend.get_block_timestamp)
+    latest_block_number = get_head_block_number(sidecar_url)
 
     latest_block_timestamp = str(datetime.utcfromtimestamp(
-        int(end_block_response["extrinsics"][0]["args"]["now"]) / 1000)
+        get_block_timestamp(sidecar_url, latest_block_number))
                                  .strftime('%Y-%m-%d %H:%M:%S %Z'))
 
-    return int(end_block_response["number"]), latest_block_timestamp
+    return latest_block_number, latest_block_timestamp
@@ -0,0 +1,521 @@
+"""Reads blocks directly from a Substrate node's JSON-RPC, instead of the sidecar.
+
+A node url is a WebSocket url (`ws://`, `wss://`) or an HTTP url prefixed with
+`rpc+` (`rpc+http://`, `rpc+https://`), so it can be passed wherever a sidecar
+url is accepted. The functions here have the same signatures as their
+counterparts in `polkadotetl.export.sidecar`.
+
+The blocks of a range are fetched with two JSON-RPC batch calls: one for the
+block hashes (`chain_getBlockHash`), and one for every block's body
+(`chain_getBlock`), events and validators (`state_getStorage`) and runtime
+version. The runtime metadata is fetched once per runtime version.
+
+Extrinsics and events are SCALE decoded with the optional `scalecodec`
+package of the `node` extra, and assembled into the block shape of the
+sidecar's `/blocks/{n}`, so the blocks can be enriched and converted like
+sidecar blocks. Headers, digests and the block author are decoded here. Fee estimates and docs, which the
+sidecar computes, are not part of these blocks.
+"""
+import hashlib
+import json
+import re
+import threading
+from typing import Dict, List, Optional, Tuple
+from urllib.parse import urlparse
+
+import requests
+
+from polkadotetl.constants import NODE_TIMEOUT_IN_SECONDS
+from polkadotetl.exceptions import InvalidBlockNumber, InvalidInput, PolkadotNodeError
+from polkadotetl.logger import logger
+
+NODE_URL_SCHEMES = ("ws", "wss", "rpc+http", "rpc+https")
+# twox128("System") + twox128("Events") and friends
+SYSTEM_EVENTS_KEY = "0x26aa394eea5630e07c48ae0c9558cef780d41e5e16056765bc8461851072c9d7"
+TIMESTAMP_NOW_KEY = "0xf0c365c3cf59d671eb72da0e7a4113c49f1f0515f462cdcf84e0f1d6045dfcbb"
+SESSION_VALIDATORS_KEY = "0xcec5070d609dd3497f72bde07fc96ba088dcde934c658227ee1dfafcd6e16903"
+POLKADOT_SS58_FORMAT = 0
+BASE58_ALPHABET = "123456789ABCDEFGHJKLMNPQRSTUVWXYZabcdefghijkmnopqrstuvwxyz"
+BABE_ENGINE_ID = b"BABE"
+DIGEST_ITEM_TYPES = {
+    0: "Other",
+    4: "Consensus",
+    5: "Seal",
+    6: "PreRuntime",
+    8: "RuntimeEnvironmentUpdated",
+}
+EVENT_PHASE_INITIALIZATION = "initialization"
+EVENT_PHASE_EXTRINSIC = "extrinsic"
+EVENT_PHASE_FINALIZATION = "finalization"
+
+
+def is_node_url(url: str) -> bool:
+    """Returns whether a url points to a node's JSON-RPC rather than a sidecar."""
+    return urlparse(url).scheme in NODE_URL_SCHEMES
+
+
+def get_block(node_url, block_number) -> dict:
+    """Gets 1 block from the node, in the shape of a sidecar block response."""
+    if block_number == "head":
+        block_number = get_head_block_number(node_url)
+    if not isinstance(block_number, int):
+        raise InvalidBlockNumber(f"`{block_number}` is invalid.")
+    return get_blocks(node_url, block_number, block_number)[0]
+
+
+def get_blocks(node_url, start_block, end_block) -> List[dict]:
+    """Gets a range of blocks from the node with two batch calls, ordered by
+    block number, in the shape of sidecar block responses."""
+    if not isinstance(start_block, int) or not isinstance(end_block, int):
+        raise InvalidBlockNumber(f"`{start_block}-{end_block}` is invalid.")
+    block_numbers = range(start_block, end_block + 1)
+    *block_hashes, finalized_hash = call_batch(
+        node_url,
+        [("chain_getBlockHash", [block_number]) for block_number in block_numbers]
+        + [("chain_getFinalizedHead", [])],
+    )
+    if None in block_hashes:
+        message = f"The node doesn't have all of blocks #{start_block:,}-#{end_block:,}"
+        logger.error(message)
+        raise PolkadotNodeError(message)
+    calls = []
+    for block_hash in block_hashes:
+        calls.extend(
+            [
+                ("chain_getBlock", [block_hash]),
+                ("state_getStorage", [SYSTEM_EVENTS_KEY, block_hash]),
+                ("state_getStorage", [SESSION_VALIDATORS_KEY, block_hash]),
+                ("state_getRuntimeVersion", [block_hash]),
+            ]
+        )
+    calls.append(("chain_getHeader", [finalized_hash]))
+    *results, finalized_header = call_batch(node_url, calls)
+    finalized_number = int(finalized_header["number"], 16)
+
+    decoder = get_decoder(node_url)
+    block_results = [results[index : index + 4] for index in range(0, len(results), 4)]
+    missing_metadata = {}
+    for block_hash, (_, _, _, runtime_version) in zip(block_hashes, block_results):
+        spec_version = runtime_version["specVersion"]
+        if not decoder.has_metadata(spec_version):
+            missing_metadata.setdefault(spec_version, block_hash)
+    if missing_metadata:
+        metadata = call_batch(
+            node_url,
+            [("state_getMetadata", [block_hash]) for block_hash in missing_metadata.values()],
+        )
+        for spec_version, metadata_hex in zip(missing_metadata, metadata):
+            decoder.load_metadata(spec_version, metadata_hex)
+
+    return [
+        build_block(
+            decoder,
+            block_hash,
+            signed_block["block"],
+            events_hex,
+            validators_hex,
+            runtime_version["specVersion"],
+            finalized=block_number <= finalized_number,
+        )
+        for block_number, block_hash, (signed_block, events_hex, validators_hex, runtime_version) in zip(
+            block_numbers, block_hashes, block_results
+        )
+    ]
+
+
+def get_block_timestamp(node_url, block_number) -> float:
+    """Gets the epoch timestamp of 1 block from the node, from the `Timestamp.Now` storage."""
+    (block_hash,) = call_batch(node_url, [("chain_getBlockHash", [block_number])])
+    if block_hash is None:
+        message = f"The node doesn't have block #{block_number:,}"
+        logger.error(message)
+        raise PolkadotNodeError(message)
+    (now,) = call_batch(node_url, [("state_getStorage", [TIMESTAMP_NOW_KEY, block_hash])])
+    if now is None:
+        message = f"Error getting the timestamp of block #{block_number:,}"
+        logger.error(message)
+        raise PolkadotNodeError(message)
+    # divide by 1000 because it is in milliseconds
+    return int.from_bytes(_from_hex(now), "little") / 1000
+
+
+def get_head_block_number(node_url) -> int:
+    """Gets the number of the HEAD block from the node."""
+    (header,) = call_batch(node_url, [("chain_getHeader", [])])
+    return int(header["number"], 16)
+
+
+def call_batch(node_url: str, calls: List[Tuple[str, list]]) -> list:
+    """Makes a JSON-RPC batch call and returns the results in the order of `calls`."""
+    payload = [
+        {"jsonrpc": "2.0", "id": call_id, "method": method, "params": params}
+        for call_id, (method, params) in enumerate(calls)
+    ]
+    url = urlparse(node_url)
+    # NOTE: Do not log node_url since it will probably have the API key.
+    base_url = url._replace(query="", scheme=url.scheme.replace("rpc+", "")).geturl()
+    if url.scheme in ("ws", "wss"):
+        responses = _call_websocket(node_url, base_url, payload)
+    else:
+        response = requests.post(
+            url._replace(scheme=url.scheme.replace("rpc+", "")).geturl(),
+            json=payload,
+            timeout=NODE_TIMEOUT_IN_SECONDS,
+        )
+        response.raise_for_status()
+        try:
+            responses = response.json()
+        except ValueError as e:
+            message = f"Got a batch response from {base_url} that isn't json: {response.text[:200]}"
+            logger.error(message)
+            raise PolkadotNodeError(message) from e
+    if not isinstance(responses, list):
+        message = f"Got an invalid batch response from {base_url}: {str(responses)[:200]}"
+        logger.error(message)
+        raise PolkadotNodeError(message)
+    responses = {response.get("id"): response for response in responses}
+    results = []
+    for call_id, (method, _) in enumerate(calls):
+        response = responses.get(call_id)
+        if response is None or "error" in response:
+            message = f"Got error {None if response is None else response['error']} calling {method} on {base_url}"
+            logger.error(message)
+            raise PolkadotNodeError(message)
+        results.append(response.get("result"))
+    return results
+
+
+def _call_websocket(node_url: str, base_url: str, payload: list):
+    try:
+        import websocket
+    except ImportError as e:
+        message = "WebSocket node urls need the `websocket-client` package from the `node` extra. Install it, or use an `rpc+http` url."
+        logger.error(message)
+        raise InvalidInput(message) from e
+    # these aren't `RequestException`s, so they're raised as `PolkadotNodeError`s to be retried
+    try:
+        connection = websocket.create_connection(node_url, timeout=NODE_TIMEOUT_IN_SECONDS)
+        try:
+            connection.send(json.dumps(payload))
+            return json.loads(connection.recv())
+        finally:
+            connection.close()
+    except (websocket.WebSocketException, OSError, ValueError) as e:
+        message = f"Error calling {base_url}: {type(e).__name__}: {e}"
+        logger.error(message)
+        raise PolkadotNodeError(message) from e
+
+
+def build_block(
+    decoder,
+    block_hash: str,
+    block: dict,
+    events_hex: Optional[str],
+    validators_hex: Optional[str],
+    spec_version: int,
+    finalized: bool,
+) -> dict:
+    """Assembles the sidecar block response of a `chain_getBlock` block and its events."""
+    header = block["header"]
+    logs = [decode_digest_item(log) for log in header["digest"]["logs"]]
+    events = decoder.decode_events(spec_version, events_hex) if events_hex else []
+    extrinsic_events: Dict[int, List[dict]] = {}
+    on_initialize = []
+    on_finalize = []
+    for event in events:
+        sidecar_event = {
+            "method": {
+                "pallet": to_lower_camel_case(event["pallet"]),
+                "method": event["method"],
+            },
+            "data": [_to_sidecar_value(item) for item in event["data"]],
+        }
+        if event["phase"] == EVENT_PHASE_EXTRINSIC:
+            extrinsic_events.setdefault(event["extrinsic_index"], []).append(sidecar_event)
+        elif event["phase"] == EVENT_PHASE_INITIALIZATION:
+            on_initialize.append(sidecar_event)
+        else:
+            on_finalize.append(sidecar_event)
+    extrinsics = [
+        build_extrinsic(
+            extrinsic_hex,
+            decoder.decode_extrinsic(spec_version, extrinsic_hex),
+            extrinsic_events.get(index, []),
+        )
+        for index, extrinsic_hex in enumerate(block["extrinsics"])
+    ]
+    return {
+        "number": str(int(header["number"], 16)),
+        "hash": block_hash,
+        "parentHash": header["parentHash"],
+        "stateRoot": header["stateRoot"],
+        "extrinsicsRoot": header["extrinsicsRoot"],
+        "authorId": decode_author(header["digest"]["logs"], validators_hex),
+        "logs": logs,
+        "onInitialize": {"events": on_initialize},
+        "extrinsics": extrinsics,
+        "onFinalize": {"events": on_finalize},
+        "finalized": finalized,
+    }
+
+
+def build_extrinsic(extrinsic_hex: str, extrinsic: dict, events: List[dict]) -> dict:
+    """Assembles the sidecar shape of a decoded extrinsic."""
+    success = any(
+        event["method"] == {"pallet": "system", "method": "ExtrinsicSuccess"}
+        for event in events
+    )
+    pays_fee = False
+    for event in events:
+        if event["method"]["pallet"] == "system" and event["method"]["method"] in (
+            "ExtrinsicSuccess",
+            "ExtrinsicFailed",
+        ):
+            dispatch_info = event["data"][-1]
+            if isinstance(dispatch_info, dict):
+                pays_fee = dispatch_info.get("paysFee") in ("Yes", True)
+    era = extrinsic.get("era")
+    if era is None or era in ("00", "0x00"):
+        era = {"immortalEra": "0x00"}
+    else:
+        era = {"mortalEra": [str(item) for item in era]}
+    signer = extrinsic.get("signer")
+    return {
+        "method": {
+            "pallet": to_lower_camel_case(extrinsic["pallet"]),
+            "method": to_lower_camel_case(extrinsic["method"]),
+        },
+        "signature": None
+        if signer is None
+        else {"signature": extrinsic.get("signature"), "signer": {"id": signer}},
+        "nonce": None if extrinsic.get("nonce") is None else str(extrinsic["nonce"]),
+        "args": {
+            to_lower_camel_case(name): _to_sidecar_value(value)
+            for name, value in extrinsic["args"].items()
+        },
+        "tip": None if extrinsic.get("tip") is None else str(extrinsic["tip"]),
+        "hash": "0x" + hashlib.blake2b(_from_hex(extrinsic_hex), digest_size=32).hexdigest(),
+        "info": {},
+        "era": era,
+        "events": events,
+        "success": success,
+        "paysFee": pays_fee,
+    }
+
+
+def _to_sidecar_value(value):
+    """Converts decoded values like the sidecar does: numbers become strings and keys camel case."""
+    if isinstance(value, bool) or value is None:
+        return value
+    if isinstance(value, int):
+        return str(value)
+    if isinstance(value, (list, tuple)):
+        return [_to_sidecar_value(item) for item in value]
+    if isinstance(value, dict):
+        return {
+            to_lower_camel_case(key) if "_" in key else key: _to_sidecar_value(item)
+            for key, item in value.items()
+        }
+    return value
+
+
+def to_lower_camel_case(name: str) -> str:
+    """Converts pallet, call and argument names to the sidecar's casing,
+    such as `ParaInherent` to `paraInherent` and `transfer_keep_alive` to `transferKeepAlive`."""
+    head, *rest = name.split("_")
+    return head[:1].lower() + head[1:] + "".join(part[:1].upper() + part[1:] for part in rest)
+
+
+def decode_digest_item(log_hex: str) -> dict:
+    """Decodes a header digest log into the sidecar's `{type, index, value}`."""
+    data = _from_hex(log_hex)
+    index = data[0]
+    log_type = DIGEST_ITEM_TYPES.get(index, "Other")
+    if index in (4, 5, 6):
+        length, offset = decode_compact(data, 5)
+        value = ["0x" + data[1:5].hex(), "0x" + data[offset : offset + length].hex()]
+    else:
+        value = ["0x" + data[1:].hex()]
+    return {"type": log_type, "index": str(index), "value": value}
+
+
+def decode_author(logs: List[str], validators_hex: Optional[str]) -> Optional[str]:
+    """Finds the block author from the BABE pre-runtime digest and the session validators."""
+    if validators_hex is None:
+        return None
+    validators_data = _from_hex(validators_hex)
+    count, offset = decode_compact(validators_data, 0)
+    validators = [
+        validators_data[offset + 32 * index : offset + 32 * (index + 1)] for index in range(count)
+    ]
+    for log_hex in logs:
+        data = _from_hex(log_hex)
+        if data[0] != 6 or data[1:5] != BABE_ENGINE_ID:
+            continue
+        _, offset = decode_compact(data, 5)
+        # a BABE pre-digest is a variant byte followed by the authority index
+        authority_index = int.from_bytes(data[offset + 1 : offset + 5], "little")
+        if authority_index < len(validators):
+            return ss58_encode(validators[authority_index])
+    return None
+
+
+def decode_compact(data: bytes, offset: int) -> Tuple[int, int]:
+    """Decodes a SCALE compact integer and returns it with the offset after it."""
+    mode = data[offset] & 0b11
+    if mode == 0:
+        return data[offset] >> 2, offset + 1
+    if mode == 1:
+        return int.from_bytes(data[offset : offset + 2], "little") >> 2, offset + 2
+    if mode == 2:
+        return int.from_bytes(data[offset : offset + 4], "little") >> 2, offset + 4
+    length = (data[offset] >> 2) + 4
+    return int.from_bytes(data[offset + 1 : offset + 1 + length], "little"), offset + 1 + length
+
+
+def ss58_encode(public_key: bytes, ss58_format: int = POLKADOT_SS58_FORMAT) -> str:
+    """Encodes a 32 byte public key as an SS58 address."""
+    payload = bytes([ss58_format]) + public_key
+    checksum = hashlib.blake2b(b"SS58PRE" + payload, digest_size=64).digest()[:2]
+    data = payload + checksum
+    number = int.from_bytes(data, "big")
+    encoded = ""
+    while number:
+        number, remainder = divmod(number, 58)
+        encoded = BASE58_ALPHABET[remainder] + encoded
+    leading_zeros = len(data) - len(data.lstrip(b"\0"))
+    return BASE58_ALPHABET[0] * leading_zeros + encoded
+
+
+def _from_hex(value: str) -> bytes:
+    return bytes.fromhex(value[2:] if value.startswith("0x") else value)
+
+
+class ScaleDecoder:
+    """Decodes extrinsics and events with `scalecodec`, using the runtime
+    metadata of every runtime version.
+
+    Decoded extrinsics are `{pallet, method, args, signer, signature, nonce,
+    tip, era}` and decoded events are `{phase, extrinsic_index, pallet, method,
+    data}`, which `build_block` assembles into sidecar blocks."""
+
+    def __init__(self, ss58_format: int = POLKADOT_SS58_FORMAT):
+        try:
+            from scalecodec.base import RuntimeConfigurationObject
+            from scalecodec.type_registry import load_type_registry_preset
+        except ImportError as e:
+            message = "Reading blocks from a node needs the `scalecodec` package. Install the `node` extra to continue."
+            logger.error(message)
+            raise InvalidInput(message) from e
+        self.ss58_format = ss58_format
+        self.runtimes = {}
+        self.lock = threading.Lock()
+        self._runtime_configuration = lambda: RuntimeConfigurationObject(ss58_format=ss58_format)
+        # `core` has the metadata and extrinsic types, `legacy` the types of runtimes before metadata v14
+        self._type_registries = [load_type_registry_preset("core"), load_type_registry_preset("legacy")]
+
+    def has_metadata(self, spec_version: int) -> bool:
+        return spec_version in self.runtimes
+
+    def load_metadata(self, spec_version: int, metadata_hex: str):
+        from scalecodec.base import ScaleBytes
+
+        runtime_configuration = self._runtime_configuration()
+        for type_registry in self._type_registries:
+            runtime_configuration.update_type_registry(type_registry)
+        metadata = runtime_configuration.create_scale_object(
+            "MetadataVersioned", data=ScaleBytes(metadata_hex)
+        )
+        metadata.decode()
+        runtime_configuration.add_portable_registry(metadata)
+        events_type = "Vec<EventRecord<Event, Hash>>"
+        for pallet in metadata.pallets:
+            if pallet.name == "System" and pallet.storage is not None:
+                events_type = pallet.get_storage_function("Events").get_value_type_string()
+        with self.lock:
+            self.runtimes[spec_version] = (runtime_configuration, metadata, events_type)
+
+    def decode_extrinsic(self, spec_version: int, extrinsic_hex: str) -> dict:
+        from scalecodec.base import ScaleBytes
+        from scalecodec.types import GenericMultiAddress
+
+        runtime_configuration, metadata, _ = self.runtimes[spec_version]
+        extrinsic = runtime_configuration.create_scale_object(
+            "Extrinsic", data=ScaleBytes(extrinsic_hex), metadata=metadata
+        )
+        value = extrinsic.decode()
+        call = value["call"]
+        args = {}
+        for arg in extrinsic.value_object["call"].value_object["call_args"]:
+            arg_value = arg.value_object["value"]
+            if isinstance(arg_value, GenericMultiAddress):
+                # scalecodec flattens an address to its account, the sidecar keeps
+                # the variant, such as `{"id": ...}`
+                address = arg_value.value
+                if isinstance(address, dict):
+                    address = next(iter(address.values()))
+                args[arg.value["name"]] = {to_lower_camel_case(arg_value.value_object[0]): address}
+            else:
+                args[arg.value["name"]] = arg_value.value
+        signature = value.get("signature")
+        if isinstance(signature, dict):
+            signature = next(iter(signature.values()), None)
+        return dict(
+            pallet=call["call_module"],
+            method=call["call_function"],
+            args=args,
+            signer=value.get("address"),
+            signature=signature,
+            nonce=value.get("nonce"),
+            tip=value.get("tip"),
+            era=value.get("era"),
+        )
+
+    def decode_events(self, spec_version: int, events_hex: str) -> List[dict]:
+        from scalecodec.base import ScaleBytes
+
+        runtime_configuration, metadata, events_type = self.runtimes[spec_version]
+        events = runtime_configuration.create_scale_object(
+            events_type, data=ScaleBytes(events_hex), metadata=metadata
+        )
+        decoded = []
+        for record in events.decode():
+            phase = record["phase"]
+            extrinsic_index = record.get("extrinsic_idx")
+            if isinstance(phase, dict):
+                phase, extrinsic_index = next(iter(phase.items()))
+            if phase == "ApplyExtrinsic":
+                phase = EVENT_PHASE_EXTRINSIC
+            elif phase == "Initialization":
+                phase = EVENT_PHASE_INITIALIZATION
+            else:
+                phase = EVENT_PHASE_FINALIZATION
+            attributes = record.get("attributes")
+            if isinstance(attributes, dict):
+                data = list(attributes.values())
+            elif isinstance(attributes, (list, tuple)):
+                data = list(attributes)
+            else:
+                data = [] if attributes is None else [attributes]
+            decoded.append(
+                dict(
+                    phase=phase,
+                    extrinsic_index=extrinsic_index,
+                    pallet=record["module_id"],
+                    method=record["event_id"],
+                    data=data,
+                )
+            )
+        return decoded
+
+
+_decoders: Dict[str, ScaleDecoder] = {}
+_decoders_lock = threading.Lock()
+
+
+def get_decoder(node_url: str) -> ScaleDecoder:
+    """Returns the decoder of a node, which caches the metadata of its runtime versions."""
+    with _decoders_lock:
+        if node_url not in _decoders:
+            _decoders[node_url] = ScaleDecoder()
+        return _decoders[node_url]
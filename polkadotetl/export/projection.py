@@ -0,0 +1,152 @@
+"""Projection of block responses at export time.
+
+A full sidecar block response carries much more than the transfer analytics
+use: `paraInherent` args that make up most of the bytes of a block, the docs of
+every event and extrinsic, fee estimates and every system event. A
+`Projection` prunes block responses before they are written, and asks the
+sidecar to leave out docs and fees in the first place.
+
+A projected block keeps the shape of a sidecar block response, so it can still
+be enriched, converted to the BigQuery schema and verified. Since extrinsics and
+events are dropped, the ones that are kept record their original position in
+the block, as `extrinsicIndex` and `eventIndex`, for the normalized tables.
+"""
+from typing import Iterable, Optional
+from urllib.parse import parse_qsl, urlencode, urlparse, urlunparse
+
+from polkadotetl.constants import ENRICHED_EVENTS
+
+TIMESTAMP_PALLET = "timestamp"
+PARA_INHERENT_PALLET = "paraInherent"
+# sidecar query parameters of `/blocks` that leave out docs and fee estimates
+SKIP_DOCS_AND_FEES_PARAMETERS = {
+    "eventDocs": "false",
+    "extrinsicDocs": "false",
+    "noFees": "true",
+}
+# fields that record the original position of the extrinsics and events of a projected block
+EXTRINSIC_INDEX = "extrinsicIndex"
+EVENT_INDEX = "eventIndex"
+
+
+class Projection:
+    """Determines which parts of a block response are exported.
+
+    - `events` is an allowlist of the events to keep, as `pallet` or
+      `pallet.method`, such as `balances` or `balances.Transfer`. All events are
+      kept when it is `None`.
+    - `extrinsic_pallets` is an allowlist of the pallets of the extrinsics to
+      keep. All extrinsics are kept when it is `None`.
+    - `drop_empty_extrinsics` drops the extrinsics that have no events left.
+    - `drop_para_inherent_args` empties the args of `paraInherent` extrinsics.
+    - `skip_docs_and_fees` requests blocks without docs and fee estimates, and
+      drops any docs that the sidecar returns anyway.
+
+    The `timestamp.set` extrinsic is always kept, since the block timestamp is
+    read from it."""
+
+    def __init__(
+        self,
+        events: Optional[Iterable[str]] = None,
+        extrinsic_pallets: Optional[Iterable[str]] = None,
+        drop_empty_extrinsics: bool = False,
+        drop_para_inherent_args: bool = False,
+        skip_docs_and_fees: bool = False,
+    ):
+        self.events = None if events is None else frozenset(events)
+        self.extrinsic_pallets = (
+            None if extrinsic_pallets is None else frozenset(extrinsic_pallets)
+        )
+        self.drop_empty_extrinsics = drop_empty_extrinsics
+        self.drop_para_inherent_args = drop_para_inherent_args
+        self.skip_docs_and_fees = skip_docs_and_fees
+
+    @classmethod
+    def transfers(cls) -> "Projection":
+        """Keeps only what `enrich_block` uses."""
+        return cls(
+            events=ENRICHED_EVENTS,
+            drop_empty_extrinsics=True,
+            drop_para_inherent_args=True,
+            skip_docs_and_fees=True,
+        )
+
+    def sidecar_url(self, sidecar_url: str) -> str:
+        """Returns the sidecar url with the query parameters of this projection.
+
+        Parameters that are already in the url are left as they are."""
+        if not self.skip_docs_and_fees:
+            return sidecar_url
+        url = urlparse(sidecar_url)
+        query = parse_qsl(url.query, keep_blank_values=True)
+        present = {name for name, _ in query}
+        query.extend(
+            (name, value)
+            for name, value in SKIP_DOCS_AND_FEES_PARAMETERS.items()
+            if name not in present
+        )
+        return urlunparse(url._replace(query=urlencode(query)))
+
+    def keeps_event(self, event: dict) -> bool:
+        if self.events is None:
+            return True
+        pallet = event["method"]["pallet"]
+        return (
+            pallet in self.events
+            or "{}.{}".format(pallet, event["method"]["method"]) in self.events
+        )
+
+    def project(self, block_response: dict) -> dict:
+        """Prunes a block response in place and returns it."""
+        _record_indexes(block_response)
+        for key in ("onInitialize", "onFinalize"):
+            if key in block_response:
+                block_response[key]["events"] = self._project_events(
+                    block_response[key]["events"]
+                )
+        extrinsics = []
+        for extrinsic in block_response["extrinsics"]:
+            pallet = extrinsic["method"]["pallet"]
+            if pallet == TIMESTAMP_PALLET:
+                extrinsics.append(extrinsic)
+                continue
+            if (
+                self.extrinsic_pallets is not None
+                and pallet not in self.extrinsic_pallets
+            ):
+                continue
+            extrinsic["events"] = self._project_events(extrinsic["events"])
+            if self.drop_empty_extrinsics and not extrinsic["events"]:
+                continue
+            if self.drop_para_inherent_args and pallet == PARA_INHERENT_PALLET:
+                extrinsic["args"] = {}
+            if self.skip_docs_and_fees:
+                extrinsic.pop("docs", None)
+            extrinsics.append(extrinsic)
+        block_response["extrinsics"] = extrinsics
+        return block_response
+
+    def _project_events(self, events: list) -> list:
+        events = [event for event in events if self.keeps_event(event)]
+        if self.skip_docs_and_fees:
+            for event in events:
+                event.pop("docs", None)
+        return events
+
+
+def _record_indexes(block_response: dict):
+    """Records the position of every extrinsic in the block, and of every event
+    in the order of `onInitialize`, the extrinsics and `onFinalize`.
+
+    Positions that are already recorded are kept, so projecting a projected
+    block again doesn't renumber it."""
+    events = [block_response.get("onInitialize", {}).get("events", [])]
+    for extrinsic_index, extrinsic in enumerate(block_response["extrinsics"]):
+        extrinsic.setdefault(EXTRINSIC_INDEX, extrinsic_index)
+        events.append(extrinsic["events"])
+    events.append(block_response.get("onFinalize", {}).get("events", []))
+    event_index = 0
+    for phase_events in events:
+        for event in phase_events:
+            event.setdefault(EVENT_INDEX, event_index)
+            event_index += 1
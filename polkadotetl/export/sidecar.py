@@ -1,11 +1,26 @@
-from typing import Callable, Optional
+from typing import Callable, List, Optional, Tuple
+import gzip
+import re
+import zlib
 import requests
 from requests.exceptions import InvalidURL, RequestException
 
-from polkadotetl.constants import SIDECAR_RETRIES, SIDECAR_RETRY_DELAY_IN_SECONDS
+from polkadotetl.constants import (
+    BLOCK_FILE_COMPRESSION_LEVEL,
+    SIDECAR_RETRIES,
+    SIDECAR_RETRY_DELAY_IN_SECONDS,
+)
 from polkadotetl.exceptions import PolkadotSidecarError, InvalidBlockNumber
 from polkadotetl.logger import logger
 
+# a block response starts with its number, while an error response starts with its code
+RAW_BLOCK_HEAD_SIZE = 64
+RAW_BLOCK_NUMBER = re.compile(rb'^\s*\{\s*"number"\s*:\s*"(\d+)"')
+RAW_BLOCK_TAIL_SIZE = 64
+RAW_BLOCK_EXTRINSICS = b'"extrinsics"'
+# decompressed bytes per step when checking a compressed response
+RAW_BLOCK_CHUNK_SIZE = 2 ** 16
+
 
 class PolkadotRequestor:
     """PolkadotRequestor
@@ -111,3 +126,167 @@ def get_block(sidecar_url, block_number):
         logger.error(message)
         raise PolkadotSidecarError(message)
     return block_response
+
+
+def get_raw_block(sidecar_url, block_number, compressed=False) -> bytes:
+    """Gets 1 block response from the polkadot sidecar as raw json bytes, without decoding the json.
+
+    The response is requested gzip-encoded, and only checked for the block
+    number at its start, the `extrinsics` field and its closing brace. With
+    `compressed`, the gzip bytes are returned as they were received, or
+    compressed here if the sidecar didn't compress them. A compressed response
+    is checked while it's decompressed in chunks, so only its head and tail
+    are kept, and the gzip trailer is verified on the way."""
+    from urllib.parse import urlparse, urljoin
+
+    validate_url(sidecar_url)
+    if not isinstance(block_number, int):
+        raise InvalidBlockNumber(f"`{block_number}` is invalid.")
+    url = urlparse(sidecar_url)
+    base_block_url = urljoin(sidecar_url, f"blocks/{block_number}")
+    # NOTE: Do not log raw block_url since it will probably have the API key.
+    if url.query != "":
+        block_url = f"{base_block_url}?{url.query}"
+    else:
+        block_url = base_block_url
+    response = requests.get(block_url, headers={"Accept-Encoding": "gzip"}, stream=True)
+    response.raise_for_status()
+    content = response.raw.read(decode_content=False)
+    gzipped = response.headers.get("Content-Encoding", "").lower() == "gzip"
+    try:
+        if gzipped and compressed:
+            block_response = None
+            head, tail, has_extrinsics = _scan_gzip(content)
+        else:
+            block_response = gzip.decompress(content) if gzipped else content
+            head = block_response[:RAW_BLOCK_HEAD_SIZE]
+            tail = block_response[-RAW_BLOCK_TAIL_SIZE:]
+            has_extrinsics = RAW_BLOCK_EXTRINSICS in block_response
+    except (zlib.error, OSError, EOFError) as e:
+        message = f"Got a corrupt response for block #{block_number:,} from {base_block_url}"
+        logger.error(message)
+        raise PolkadotSidecarError(message) from e
+    match = RAW_BLOCK_NUMBER.match(head)
+    if (
+        match is None
+        or int(match.group(1)) != block_number
+        or not tail.rstrip().endswith(b"}")
+        or not has_extrinsics
+    ):
+        message = f"Error getting block number #{block_number:,} from {base_block_url}"
+        logger.error(message)
+        raise PolkadotSidecarError(message)
+    if not compressed:
+        return block_response
+    if gzipped:
+        return content
+    return gzip.compress(block_response, compresslevel=BLOCK_FILE_COMPRESSION_LEVEL)
+
+
+def _scan_gzip(content: bytes) -> Tuple[bytes, bytes, bool]:
+    """Decompresses a gzip response in chunks, and returns its head, its tail and
+    whether it has the `extrinsics` field, without keeping the rest of it.
+
+    Raises `zlib.error` when the gzip stream or its trailer (the CRC32 and the
+    size) is corrupt, and `EOFError` when it is truncated."""
+    decompressor = zlib.decompressobj(16 + zlib.MAX_WBITS)
+    head = b""
+    tail = b""
+    has_extrinsics = False
+    pending = content
+    while True:
+        chunk = decompressor.decompress(pending, RAW_BLOCK_CHUNK_SIZE)
+        pending = decompressor.unconsumed_tail
+        if len(head) < RAW_BLOCK_HEAD_SIZE:
+            head += chunk[: RAW_BLOCK_HEAD_SIZE - len(head)]
+        # the tail of the previous chunk is kept, for a field split between chunks
+        window = tail + chunk
+        has_extrinsics = has_extrinsics or RAW_BLOCK_EXTRINSICS in window
+        tail = window[-RAW_BLOCK_TAIL_SIZE:]
+        if not pending:
+            break
+    if not decompressor.eof:
+        raise EOFError("Compressed response ended before the end of its gzip stream")
+    return head, tail, has_extrinsics
+
+
+def get_blocks(sidecar_url, start_block, end_block) -> List[dict]:
+    """Gets the block responses of a range of blocks from the polkadot sidecar
+    in a single request, ordered by block number."""
+    from urllib.parse import urlparse, urljoin
+
+    validate_url(sidecar_url)
+    if not isinstance(start_block, int) or not isinstance(end_block, int):
+        raise InvalidBlockNumber(f"`{start_block}-{end_block}` is invalid.")
+    url = urlparse(sidecar_url)
+    base_blocks_url = urljoin(sidecar_url, "blocks")
+    # NOTE: Do not log raw blocks_url since it will probably have the API key.
+    blocks_url = f"{base_blocks_url}?range={start_block}-{end_block}"
+    if url.query != "":
+        blocks_url = f"{blocks_url}&{url.query}"
+    response = requests.get(blocks_url)
+    response.raise_for_status()
+    blocks_response = response.json()
+    if not isinstance(blocks_response, list):
+        message = f"Got error code {blocks_response.get('code')} querying for blocks #{start_block:,}-#{end_block:,}"
+        logger.error(message)
+        raise PolkadotSidecarError(message)
+    block_responses = {}
+    for block_response in blocks_response:
+        if "extrinsics" not in block_response.keys():
+            message = f"Error getting blocks #{start_block:,}-#{end_block:,} from {base_blocks_url}"
+            logger.error(message)
+            raise PolkadotSidecarError(message)
+        block_responses[int(block_response["number"])] = block_response
+    missing_blocks = set(range(start_block, end_block + 1)) - block_responses.keys()
+    if missing_blocks:
+        message = f"Blocks #{start_block:,}-#{end_block:,} from {base_blocks_url} are missing {len(missing_blocks):,} blocks"
+        logger.error(message)
+        raise PolkadotSidecarError(message)
+    return [block_responses[block_number] for block_number in range(start_block, end_block + 1)]
+
+
+def get_block_timestamp(sidecar_url, block_number) -> float:
+    """Gets the epoch timestamp of 1 block from the polkadot sidecar.
+
+    Only the `timestamp.set` extrinsic of the block is requested, which is
+    a small fraction of the whole block."""
+    extrinsic_response = _get_json(sidecar_url, f"blocks/{block_number}/extrinsics/0")
+    if "extrinsics" not in extrinsic_response.keys():
+        message = f"Error getting the timestamp of block #{block_number:,}"
+        logger.error(message)
+        raise PolkadotSidecarError(message)
+    # divide by 1000 because it is in milliseconds
+    return int(extrinsic_response["extrinsics"]["args"]["now"]) / 1000
+
+
+def get_head_block_number(sidecar_url) -> int:
+    """Gets the number of the HEAD block from the polkadot sidecar, by requesting only its header."""
+    header_response = _get_json(sidecar_url, "blocks/head/header")
+    if "number" not in header_response.keys():
+        message = "Error getting the header of the HEAD block"
+        logger.error(message)
+        raise PolkadotSidecarError(message)
+    return int(header_response["number"])
+
+
+def _get_json(sidecar_url, path) -> dict:
+    """Requests a path of the polkadot sidecar and returns the json response."""
+    from urllib.parse import urlparse, urljoin
+
+    validate_url(sidecar_url)
+    url = urlparse(sidecar_url)
+    base_path_url = urljoin(sidecar_url, path)
+    # NOTE: Do not log raw path_url since it will probably have the API key.
+    if url.query != "":
+        path_url = f"{base_path_url}?{url.query}"
+    else:
+        path_url = base_path_url
+    response = requests.get(path_url)
+    response.raise_for_status()
+    json_response = response.json()
+    if (code := json_response.get("code")) is not None:
+        message = f"Got error code {code} querying {base_path_url}"
+        logger.error(message)
+        raise PolkadotSidecarError(message)
+    return json_response
@@ -3,6 +3,7 @@ import json
 import pathlib
 from celery import Celery
 import json
+from polkadotetl.core.layout import Layout, block_file_path, write_block_file
 from polkadotetl.export import sidecar
 from polkadotetl.logger import logger
 
@@ -11,13 +12,13 @@ app = Celery("tasks", broker="pyamqp://guest@localhost", backend="rpc://")
 
 @app.task
 def get_block_and_write_to_file(
-    sidecar_url: str, block_number: int, output_directory: str
+    sidecar_url: str, block_number: int, output_directory: str, layout: str = Layout.FLAT.value
 ):
     """Gets a block from the sidecar and writes to file"""
     requestor = sidecar.PolkadotRequestor(retries=5)
     get_block = requestor.build_requestor(sidecar.get_block)
 
-    response_json_path = pathlib.Path(output_directory) / f"{block_number}.json"
+    response_json_path = block_file_path(output_directory, block_number, Layout(layout))
     if response_json_path.exists():
         with open(response_json_path) as file_buffer:
             try:
@@ -33,5 +34,4 @@ def get_block_and_write_to_file(
                 else:
                     pass
     response = get_block(sidecar_url, block_number)
-    with open(response_json_path, "w") as file_buffer:
-        file_buffer.write(json.dumps(response))
+    write_block_file(response_json_path, json.dumps(response))
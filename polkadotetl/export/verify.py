@@ -0,0 +1,235 @@
+"""Verifies that an exported range of blocks is complete and intact.
+
+Reading every exported block with a full json parse takes hours for the whole
+chain, so blocks are checked cheaply instead:
+
+- missing blocks are found from the file names alone,
+- truncated files are found from their size and their last bytes, since a
+  complete block response always ends with `}`,
+- blocks that aren't finalized are found from the `finalized` field, which
+  the sidecar writes at the very end of a block response,
+- blocks whose events were pruned on the node are found with a plain byte
+  search for the sidecar's pruning message,
+- a deterministic sample of the files is fully parsed, to catch corruption
+  that the checks above can't see.
+
+Compressed block files are decompressed in memory and checked the same way,
+except that a truncated gzip file is found by decompressing it.
+
+Files are checked in parallel across processes.
+"""
+import gzip
+import json
+import mmap
+import os
+import re
+from array import array
+from concurrent.futures import ProcessPoolExecutor
+from itertools import islice
+from pathlib import Path
+from typing import Dict, Iterable, List, Optional, Tuple, Union
+
+from polkadotetl.core.layout import COMPRESSED_BLOCK_FILE_SUFFIX, iter_block_files
+from polkadotetl.exceptions import InvalidInput
+from polkadotetl.logger import logger
+
+TAIL_SIZE = 64
+CHECK_BATCH_SIZE = 65536
+FINALIZED_FALSE = re.compile(rb'"finalized"\s*:\s*false')
+PRUNING_MESSAGE = b"Unable to fetch Events, cannot confirm extrinsic status"
+# Knuth's multiplicative hash, so the sample is spread across the range and stable between runs
+SAMPLE_HASH_MULTIPLIER = 2654435761
+SAMPLE_HASH_MODULUS = 2 ** 32
+
+EMPTY = "empty"
+TRUNCATED = "truncated"
+CORRUPT = "corrupt"
+NOT_FINALIZED = "not_finalized"
+PRUNED = "pruned"
+
+
+class VerificationReport:
+    """The result of verifying a range of exported blocks."""
+
+    def __init__(self, start_block: Optional[int], end_block: Optional[int]):
+        self.start_block = start_block
+        self.end_block = end_block
+        self.files = 0
+        self.sampled = 0
+        self.missing: List[Tuple[int, int]] = []
+        self.duplicates: List[int] = []
+        self.problems: Dict[str, List[int]] = {
+            problem: [] for problem in (EMPTY, TRUNCATED, CORRUPT, NOT_FINALIZED, PRUNED)
+        }
+
+    @property
+    def ok(self) -> bool:
+        # a directory without block files is empty or mistyped, not verified
+        return self.files > 0 and not (
+            self.missing or self.duplicates or any(self.problems.values())
+        )
+
+    def to_dict(self) -> dict:
+        return dict(
+            start_block=self.start_block,
+            end_block=self.end_block,
+            files=self.files,
+            sampled=self.sampled,
+            missing=[list(block_range) for block_range in self.missing],
+            missing_blocks=sum(end - start + 1 for start, end in self.missing),
+            duplicates=self.duplicates,
+            **{problem: sorted(blocks) for problem, blocks in self.problems.items()},
+        )
+
+
+def verify_blocks(
+    directories: Iterable[Union[str, Path]],
+    start_block: Optional[int] = None,
+    end_block: Optional[int] = None,
+    sample_rate: float = 0.01,
+    max_workers: Optional[int] = None,
+) -> VerificationReport:
+    """Verifies the block files of one or more export directories (in either
+    layout, such as the shards of one export) against a range of blocks.
+
+    When the range isn't given, it is taken from the lowest and highest
+    block found. The report isn't ok when no block files are found.
+    `sample_rate` is the fraction of files that are fully parsed."""
+    if start_block is not None and end_block is not None and start_block > end_block:
+        message = f"Start block number has to be smaller than end block number. {start_block=:,} and {end_block=:,}"
+        logger.error(message)
+        raise InvalidInput(message)
+    block_files = (
+        (block_number, path)
+        for directory in directories
+        for block_number, path in _numbered_block_files(directory)
+        if (start_block is None or block_number >= start_block)
+        and (end_block is None or block_number <= end_block)
+    )
+    block_numbers = array("q")
+    report = VerificationReport(start_block, end_block)
+    threshold = int(sample_rate * SAMPLE_HASH_MODULUS)
+    block_files = _with_sampling(block_files, threshold)
+    with ProcessPoolExecutor(max_workers=max_workers) as executor:
+        # submit the files in batches, since `map` would queue all of them at once
+        while batch := list(islice(block_files, CHECK_BATCH_SIZE)):
+            for block_number, problems, sampled in executor.map(
+                _check_block_file, batch, chunksize=256
+            ):
+                block_numbers.append(block_number)
+                report.files += 1
+                report.sampled += sampled
+                for problem in problems:
+                    report.problems[problem].append(block_number)
+    if not block_numbers:
+        # without any blocks found, a single bound is the whole range
+        if start_block is not None or end_block is not None:
+            report.start_block = start_block if start_block is not None else end_block
+            report.end_block = end_block if end_block is not None else start_block
+            report.missing = [(report.start_block, report.end_block)]
+        return report
+
+    if report.start_block is None:
+        report.start_block = min(block_numbers)
+    if report.end_block is None:
+        report.end_block = max(block_numbers)
+    seen = bytearray(report.end_block - report.start_block + 1)
+    for block_number in block_numbers:
+        offset = block_number - report.start_block
+        if seen[offset]:
+            report.duplicates.append(block_number)
+        seen[offset] = 1
+    report.duplicates.sort()
+    report.missing = _missing_ranges(seen, report.start_block)
+    return report
+
+
+def _numbered_block_files(directory) -> Iterable[Tuple[int, str]]:
+    for path in iter_block_files(directory):
+        name = os.path.basename(path).split(".", 1)[0]
+        if not name.isdigit():
+            logger.warning(f"Ignoring `{path}` as it isn't named after a block.")
+            continue
+        yield int(name), path
+
+
+def _with_sampling(block_files, threshold: int) -> Iterable[Tuple[int, str, bool]]:
+    for block_number, path in block_files:
+        sampled = (block_number * SAMPLE_HASH_MULTIPLIER) % SAMPLE_HASH_MODULUS < threshold
+        yield block_number, path, sampled
+
+
+def _check_block_file(block_file: Tuple[int, str, bool]) -> Tuple[int, List[str], bool]:
+    """Checks one block file and returns the problems found in it."""
+    block_number, path, sampled = block_file
+    with open(path, "rb") as file_buffer:
+        size = os.fstat(file_buffer.fileno()).st_size
+        if size == 0:
+            return block_number, [EMPTY], False
+        if path.endswith(COMPRESSED_BLOCK_FILE_SUFFIX):
+            try:
+                content = gzip.decompress(file_buffer.read())
+            except EOFError:
+                return block_number, [TRUNCATED], False
+            except OSError:
+                return block_number, [CORRUPT], False
+            return (block_number, *_check_content(block_number, content, sampled))
+        with mmap.mmap(file_buffer.fileno(), 0, access=mmap.ACCESS_READ) as content:
+            return (block_number, *_check_content(block_number, content, sampled))
+
+
+def _check_content(block_number: int, content, sampled: bool) -> Tuple[List[str], bool]:
+    """Checks the json of one block, in bytes or a memory map, and returns the
+    problems found in it and whether it was fully parsed."""
+    tail = content[max(len(content) - TAIL_SIZE, 0):].rstrip()
+    if not tail.endswith(b"}"):
+        return [TRUNCATED], False
+    problems = []
+    if FINALIZED_FALSE.search(tail):
+        problems.append(NOT_FINALIZED)
+    if content.find(PRUNING_MESSAGE) != -1:
+        problems.append(PRUNED)
+    if sampled:
+        try:
+            block = json.loads(content[:])
+            valid = (
+                str(block.get("number")) == str(block_number)
+                and "extrinsics" in block
+                and "code" not in block
+            )
+        except ValueError:
+            valid = False
+        if not valid:
+            problems.append(CORRUPT)
+    return problems, sampled
+
+
+def _missing_ranges(seen: bytearray, start_block: int) -> List[Tuple[int, int]]:
+    """Returns the gaps in `seen` as compact, inclusive block ranges."""
+    missing = []
+    offset = seen.find(0)
+    while offset != -1:
+        end = seen.find(1, offset)
+        if end == -1:
+            end = len(seen)
+        missing.append((start_block + offset, start_block + end - 1))
+        offset = seen.find(0, end)
+    return missing
+
+
+def to_ranges(block_numbers: Iterable[int]) -> List[Tuple[int, int]]:
+    """Collapses sorted block numbers into inclusive ranges of consecutive blocks."""
+    block_ranges = []
+    for block_number in block_numbers:
+        if block_ranges and block_ranges[-1][1] == block_number - 1:
+            block_ranges[-1] = (block_ranges[-1][0], block_number)
+        else:
+            block_ranges.append((block_number, block_number))
+    return block_ranges
+
+
+def format_ranges(block_ranges: Iterable[Tuple[int, int]]) -> str:
+    """Formats block ranges compactly, such as `5-9,12,20-21`."""
+    return ",".join(
+        str(start) if start == end else f"{start}-{end}" for start, end in block_ranges
+    )
@@ -0,0 +1,114 @@
+"""Tests for benchmarking a sidecar"""
+import json
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qs, urlparse
+
+import pytest
+from typer.testing import CliRunner
+
+# the stand-in fails range queries over this many blocks, like an overloaded sidecar
+MAX_WORKING_RANGE = 20
+
+
+@pytest.fixture
+def local_sidecar():
+    """Serves small blocks and ranges of blocks over HTTP, with a little latency."""
+
+    class Handler(BaseHTTPRequestHandler):
+        def do_GET(self):
+            url = urlparse(self.path)
+            time.sleep(0.002)
+            if url.path == "/blocks":
+                start, end = map(int, parse_qs(url.query)["range"][0].split("-"))
+                if end - start + 1 > MAX_WORKING_RANGE:
+                    self.send_error(500)
+                    return
+                content = [{"number": str(n), "extrinsics": []} for n in range(start, end + 1)]
+            else:
+                content = {"number": url.path.rsplit("/", 1)[1], "extrinsics": []}
+            body = json.dumps(content).encode()
+            self.send_response(200)
+            self.send_header("Content-Length", str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+
+        def log_message(self, *args):
+            pass
+
+    server = ThreadingHTTPServer(("127.0.0.1", 0), Handler)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    yield f"http://127.0.0.1:{server.server_port}/?apikey=secret"
+    server.shutdown()
+
+
+def test_bench_sidecar(local_sidecar):
+    from polkadotetl.export.bench import bench_sidecar, recommend
+
+    results = bench_sidecar(
+        local_sidecar, 1000, 2000, concurrency_levels=(1, 4), batch_sizes=(1, 10, 50), requests_per_trial=8
+    )
+    trials = [(result.concurrency, result.batch_size) for result in results]
+    # the failing batch size isn't tried at a higher concurrency
+    assert trials == [(1, 1), (4, 1), (1, 10), (4, 10), (1, 50)]
+    assert results[-1].error_rate == 1.0
+    assert all(result.error_rate == 0 for result in results[:-1])
+    assert all(result.percentile(50) <= result.percentile(99) for result in results[:-1])
+
+    profile = recommend(local_sidecar, results)
+    assert profile.batch_size == 10
+    assert profile.sidecar == f"{local_sidecar.split('?')[0]}"
+    assert profile.measured["blocks_per_second"] == max(
+        result.to_dict()["blocks_per_second"] for result in results
+    )
+
+
+def test_export_with_profile(local_sidecar, tmp_path, monkeypatch):
+    import polkadotetl.export
+    from polkadotetl.cli import app
+
+    runner = CliRunner()
+    profile = tmp_path / "profile.json"
+    result = runner.invoke(
+        app,
+        [
+            "bench-sidecar", local_sidecar, "--start-block", "1000", "--end-block", "2000",
+            "--concurrency", "1", "--concurrency", "2", "--batch-size", "1", "--batch-size", "10",
+            "--requests-per-trial", "4", "--save-profile", str(profile),
+        ],
+    )
+    assert result.exit_code == 0, result.output
+    assert json.loads(profile.read_text())["batch_size"] == 10
+
+    calls = []
+    monkeypatch.setattr(
+        polkadotetl.export, "export_blocks_by_number", lambda *args: calls.append(args) or []
+    )
+    output_directory = tmp_path / "blocks"
+    output_directory.mkdir()
+    result = runner.invoke(
+        app,
+        [
+            "export-blocks", str(output_directory), local_sidecar, "--start-block", "1000",
+            "--end-block", "1099", "--profile", str(profile), "--retries", "7",
+        ],
+    )
+    assert result.exit_code == 0, result.output
+    saved = json.loads(profile.read_text())
+    *_, batch_size, layout, projection, passthrough, compressed, concurrency, retry_max_delay = calls[0]
+    assert (batch_size, concurrency, retry_max_delay) == (
+        saved["batch_size"], saved["concurrency"], saved["retry_max_delay"]
+    )
+    # options given explicitly take precedence over the profile
+    assert calls[0][4] == 7
+
+
+def test_export_blocks_concurrently(local_sidecar, tmp_path):
+    from polkadotetl.export import internals
+
+    failed_blocks = internals.export_blocks_by_number(
+        tmp_path, local_sidecar, 1000, 1199, batch_size=10, concurrency=4
+    )
+    assert failed_blocks == []
+    assert sorted(int(path.stem) for path in tmp_path.iterdir()) == list(range(1000, 1200))
@@ -0,0 +1,142 @@
+"""Columnar enrichment tests"""
+import warnings
+
+import pytest
+
+AUTHOR = "1AuthorAddress"
+ALICE = "1AliceAddress"
+BOB = "1BobAddress"
+TREASURY = "13UVJyLnbVp9RBZYFwFGyDvVd1y27Tt8tkntv6Q7JVPhFsTB"
+
+
+def event(pallet, method, *data):
+    return {"method": {"pallet": pallet, "method": method}, "data": list(data)}
+
+
+def extrinsic(pallet, method, events, signer=ALICE, success=True, hash_="0x01"):
+    return {
+        "method": {"pallet": pallet, "method": method},
+        "signature": None if signer is None else {"signer": {"id": signer}},
+        "hash": hash_,
+        "success": success,
+        "args": {},
+        "events": events,
+    }
+
+
+def block(number, *extrinsics, finalized=True):
+    timestamp = extrinsic("timestamp", "set", [], signer=None)
+    timestamp["args"] = {"now": str(1_650_000_000_000 + number * 6000)}
+    return {
+        "number": str(number),
+        "authorId": AUTHOR,
+        "finalized": finalized,
+        "extrinsics": [timestamp, *extrinsics],
+    }
+
+
+def sample_blocks():
+    return [
+        block(
+            1,
+            extrinsic(
+                "balances",
+                "transfer",
+                [
+                    event("balances", "Withdraw", ALICE, "150000000"),
+                    event("balances", "Transfer", ALICE, BOB, "12345678901234567"),
+                    event("balances", "Deposit", AUTHOR, "30000000"),
+                    event("balances", "Deposit", BOB, "7"),
+                    event("treasury", "Deposit", "120000000"),
+                    event("treasury", "Deposit", "120000000"),
+                    event("system", "ExtrinsicSuccess", {"weight": 1}),
+                ],
+                hash_="0xaa",
+            ),
+            extrinsic(
+                "balances",
+                "transferAllowDeath",
+                [
+                    event("balances", "TransferAllowDeath", BOB, ALICE, "0"),
+                    event("balances", "DustLost", BOB, "3"),
+                ],
+                signer=BOB,
+                success=False,
+                hash_="0xbb",
+            ),
+        ),
+        block(2, extrinsic("staking", "bond", [event("system", "ExtrinsicSuccess", {})])),
+        block(
+            3,
+            extrinsic(
+                "staking",
+                "payoutStakers",
+                [
+                    event("staking", "Rewarded", ALICE, "Staked", "1000"),
+                    event("staking", "Rewarded", BOB, "Stash", "2000"),
+                    event("staking", "Rewarded", ALICE, {"Account": BOB}, "3000"),
+                    event("staking", "Reward", BOB, "4000"),
+                    event("balances", "Slashed", ALICE, "5000"),
+                    event("balances", "BalanceSet", BOB, "6000"),
+                    event("claims", "Claimed", ALICE, "0xeth", "7000"),
+                    event("balances", "ReserveRepatriated", ALICE, BOB, "8000", "Free"),
+                    event("balances", "Deposit", TREASURY, "9000"),
+                ],
+                hash_="0xcc",
+            ),
+            extrinsic(
+                "paraInherent",
+                "enter",
+                [event("balances", "Deposit", BOB, "1")],
+                signer=None,
+            ),
+        ),
+    ]
+
+
+def test_enrich_blocks_matches_enrich_block():
+    from polkadotetl.enrich import enrich_block
+    from polkadotetl.enrich.columnar import enrich_blocks
+
+    expected = []
+    with warnings.catch_warnings(record=True) as expected_warnings:
+        warnings.simplefilter("always")
+        for sample_block in sample_blocks():
+            expected.extend(enrich_block(sample_block))
+    with warnings.catch_warnings(record=True) as actual_warnings:
+        warnings.simplefilter("always")
+        actual = enrich_blocks(sample_blocks())
+    assert actual == expected
+    assert len(actual) == 15
+    assert [str(w.message) for w in actual_warnings] == [
+        str(w.message) for w in expected_warnings
+    ]
+
+
+def test_enrich_blocks_not_finalized():
+    from polkadotetl.enrich.columnar import enrich_blocks
+    from polkadotetl.exceptions import BlockNotFinalized
+
+    with pytest.raises(BlockNotFinalized):
+        enrich_blocks([block(1, finalized=False)])
+
+
+@pytest.mark.parametrize("with_deposit", [False, True])
+def test_enrich_blocks_and_enrich_block_need_author(with_deposit):
+    from polkadotetl.enrich import enrich_block
+    from polkadotetl.enrich.columnar import enrich_blocks
+
+    events = [event("balances", "Transfer", ALICE, BOB, "10000000000")]
+    if with_deposit:
+        events.append(event("balances", "Deposit", AUTHOR, "100"))
+    without_author = block(1, extrinsic("balances", "transfer", events))
+    del without_author["authorId"]
+    with pytest.raises(KeyError):
+        enrich_block(without_author)
+    with pytest.raises(KeyError):
+        enrich_blocks([without_author])
+
+    # a null author, as the sidecar returns when it can't find it, is the same for both
+    null_author = block(1, extrinsic("balances", "transfer", events))
+    null_author["authorId"] = None
+    assert enrich_blocks([null_author]) == enrich_block(null_author)
@@ -0,0 +1,93 @@
+"""Tests for the combined convert and enrich pass"""
+import copy
+import json
+
+import pytest
+from typer.testing import CliRunner
+
+
+def read_lines(path):
+    with open(path) as file_buffer:
+        return [json.loads(line) for line in file_buffer]
+
+
+@pytest.mark.parametrize("mix", ["transfer", "era_payout", "para_inherent"])
+def test_bigquery_row_does_not_mutate(mix):
+    from polkadotetl.cli.datasources.bigquery import bigquery_row, process
+    from benchmarks.synthetic import generate_blocks
+
+    for block in generate_blocks(100, 3, mix=mix):
+        original = copy.deepcopy(block)
+        row = bigquery_row(block)
+        assert block == original
+        process(block)
+        assert row == block
+
+
+def test_bigquery_row_shares_unchanged_events():
+    from polkadotetl.cli.datasources.bigquery import bigquery_row
+    from benchmarks.synthetic import generate_block
+
+    block = generate_block(100, mix="era_payout")
+    block["onInitialize"]["events"] = [{"method": {"pallet": "system", "method": "Remarked"}, "data": ["0x01"]}]
+    block["onFinalize"]["events"].append({"method": {"pallet": "system", "method": "Remarked"}, "data": [{"id": 1}]})
+    row = bigquery_row(block)
+    assert row["onInitialize"] is block["onInitialize"]
+    assert row["onFinalize"]["events"] is not block["onFinalize"]["events"]
+    assert row["onFinalize"]["events"][-1]["data"] == ['{"id": 1}']
+    for extrinsic, row_extrinsic in zip(block["extrinsics"], row["extrinsics"]):
+        for event, row_event in zip(extrinsic["events"], row_extrinsic["events"]):
+            if all(isinstance(item, str) for item in event["data"]):
+                assert row_event is event
+
+
+@pytest.mark.parametrize("source", ["directory", "ndjson"])
+def test_convert_and_enrich_matches_separate_commands(tmp_path, source):
+    from polkadotetl.cli import app
+    from benchmarks.synthetic import generate_blocks, write_blocks
+
+    for mix in ("transfer", "era_payout"):
+        write_blocks(tmp_path / "blocks" / mix, 100, 300, mix=mix)
+    if source == "ndjson":
+        input_path = tmp_path / "blocks.json"
+        with open(input_path, "w") as file_buffer:
+            for mix in ("transfer", "era_payout"):
+                for block in generate_blocks(100, 300, mix=mix):
+                    file_buffer.write(json.dumps(block) + "\n")
+    else:
+        input_path = tmp_path / "blocks"
+
+    runner = CliRunner()
+    result = runner.invoke(
+        app, ["convert-raw-blocks-to-bigquery-schema", str(input_path), str(tmp_path / "converted"), "--end-block", "350"]
+    )
+    assert result.exit_code == 0, result.output
+    result = runner.invoke(app, ["enrich", str(input_path), str(tmp_path / "enriched.json"), "-q", "--end-block", "350"])
+    assert result.exit_code == 0, result.output
+    result = runner.invoke(
+        app,
+        [
+            "convert-and-enrich", str(input_path), str(tmp_path / "combined"), str(tmp_path / "combined.json"),
+            "-q", "--end-block", "350", "--max-workers", "2",
+        ],
+    )
+    assert result.exit_code == 0, result.output
+
+    rows = read_lines(tmp_path / "combined" / "batch.json")
+    assert len(rows) == 2 * 251
+    assert rows == read_lines(tmp_path / "converted" / "batch.json")
+    transactions = read_lines(tmp_path / "combined.json")
+    assert transactions
+    assert transactions == read_lines(tmp_path / "enriched.json")
+
+
+def test_convert_and_enrich_does_not_overwrite(tmp_path):
+    from polkadotetl.cli import app
+    from benchmarks.synthetic import write_blocks
+
+    write_blocks(tmp_path / "blocks", 100, 2)
+    (tmp_path / "enriched.json").write_text("")
+    result = CliRunner().invoke(
+        app, ["convert-and-enrich", str(tmp_path / "blocks"), str(tmp_path / "out"), str(tmp_path / "enriched.json")]
+    )
+    assert result.exit_code == 1
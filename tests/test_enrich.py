@@ -1,18 +1,27 @@
 """Enrichment functionality tests"""
 
 
-def test_enrich_blocks():
-    """Tests whether block responses from the polkadot sidecar can be enriched."""
+def test_enrich_blocks(tmp_path):
+    """Tests whether block responses from the polkadot sidecar can be enriched.
+
+    Uses the block jsons in `tests/sample_blocks/` when they exist, and synthetic
+    blocks otherwise."""
     import glob
     import json
     import os
     import csv
     from polkadotetl.enrich import enrich_block
+    from benchmarks.synthetic import MIXES, write_blocks
+
     sample_blocks = glob.glob(
         os.path.join(
             os.path.dirname(os.path.realpath(__file__)), "sample_blocks/*.json"
         )
     )
+    if not sample_blocks:
+        for index, mix in enumerate(MIXES):
+            write_blocks(tmp_path / "sample_blocks", 100 * index, 20, mix=mix)
+        sample_blocks = glob.glob(str(tmp_path / "sample_blocks/*.json"))
     txns = []
     assert len(sample_blocks) > 0, "Need sample block jsons before testing."
     for sample_block in sample_blocks:
@@ -29,9 +38,7 @@ def test_enrich_blocks():
             assert isinstance(enriched_block[0], dict)
             txns.extend(enriched_block)
 
-    with open(
-        "result.csv".format(os.path.basename(sample_block)), "w", newline=""
-    ) as f:
+    with open(tmp_path / "result.csv", "w", newline="") as f:
         fieldnames = txns[0].keys()
         writer = csv.DictWriter(f, fieldnames=fieldnames)
         writer.writeheader()
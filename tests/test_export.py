@@ -0,0 +1,258 @@
+"""Tests for exporting blocks"""
+import json
+
+import pytest
+import requests
+
+BAD_BLOCK = 1037
+
+
+def fake_block(block_number):
+    return {"number": str(block_number), "extrinsics": []}
+
+
+@pytest.fixture
+def range_sidecar(monkeypatch):
+    """Replaces the sidecar with one that fails every request touching `BAD_BLOCK`,
+    and records the requested ranges."""
+    from polkadotetl.export import sidecar
+
+    requested = []
+
+    def get_block(sidecar_url, block_number):
+        requested.append((block_number, block_number))
+        if block_number == BAD_BLOCK:
+            raise requests.HTTPError("500 Server Error")
+        return fake_block(block_number)
+
+    def get_blocks(sidecar_url, start_block, end_block):
+        requested.append((start_block, end_block))
+        if start_block <= BAD_BLOCK <= end_block:
+            raise requests.HTTPError("500 Server Error")
+        return [fake_block(n) for n in range(start_block, end_block + 1)]
+
+    monkeypatch.setattr(sidecar, "get_block", get_block)
+    monkeypatch.setattr(sidecar, "get_blocks", get_blocks)
+    monkeypatch.setattr(sidecar.PolkadotRequestor, "__init__", fast_requestor_init)
+    return requested
+
+
+def fast_requestor_init(self, retries=1, retry_max_delay=0):
+    self.retries = 1
+    self.retry_max_delay = 0
+
+
+def test_export_blocks_in_batches(range_sidecar, tmp_path):
+    from polkadotetl.export import internals
+
+    failed_blocks = internals.export_blocks_by_number(
+        tmp_path, "http://sidecar", 1000, 1299, batch_size=64
+    )
+    assert failed_blocks == [BAD_BLOCK]
+    exported = sorted(int(path.stem) for path in tmp_path.iterdir())
+    assert exported == [n for n in range(1000, 1300) if n != BAD_BLOCK]
+    with open(tmp_path / "1000.json") as file_buffer:
+        assert json.load(file_buffer) == fake_block(1000)
+    assert max(end - start + 1 for start, end in range_sidecar) == 64
+    # the failed batch is bisected instead of falling back to single blocks
+    assert len(range_sidecar) < 30
+
+
+@pytest.mark.parametrize("retries, range_retries", [(1, 1), (5, 2)])
+def test_export_blocks_in_batches_retries(range_sidecar, monkeypatch, tmp_path, retries, range_retries):
+    from polkadotetl.export import internals, sidecar
+
+    requestors = []
+
+    def recording_init(self, retries=1, retry_max_delay=0):
+        requestors.append(retries)
+        fast_requestor_init(self)
+
+    monkeypatch.setattr(sidecar.PolkadotRequestor, "__init__", recording_init)
+    internals.export_blocks_by_number(
+        tmp_path, "http://sidecar", 1000, 1099, retries=retries, batch_size=64
+    )
+    # single blocks are retried as asked, range queries at most SIDECAR_RANGE_RETRIES times
+    assert requestors == [retries, range_retries]
+
+
+def test_export_blocks_sharded(range_sidecar, tmp_path):
+    from polkadotetl.core.layout import Layout
+    from polkadotetl.export import internals
+
+    failed_blocks = internals.export_blocks_by_number(
+        tmp_path, "http://sidecar", 999_998, 1_000_001, layout=Layout.SHARDED
+    )
+    assert failed_blocks == []
+    assert sorted(str(path.relative_to(tmp_path)) for path in tmp_path.rglob("*")) == [
+        "0",
+        "0/999",
+        "0/999/999998.json",
+        "0/999/999999.json",
+        "1",
+        "1/1000",
+        "1/1000/1000000.json",
+        "1/1000/1000001.json",
+    ]
+
+
+@pytest.mark.filterwarnings("ignore::polkadotetl.warnings.NoTransactionsWarning")
+def test_transfers_projection():
+    """A block projected for transfers is much smaller and enriches to the same transactions."""
+    import copy
+
+    from polkadotetl.enrich import enrich_block
+    from polkadotetl.export.projection import Projection
+    from benchmarks.synthetic import MIXES, generate_block
+
+    for mix in MIXES:
+        block = generate_block(5000, mix=mix)
+        projected = Projection.transfers().project(copy.deepcopy(block))
+        assert enrich_block(projected) == enrich_block(block)
+        assert len(json.dumps(projected)) < len(json.dumps(block)) * (0.2 if mix == "para_inherent" else 0.6)
+        assert projected["extrinsics"][0]["method"]["pallet"] == "timestamp"
+        assert all(
+            extrinsic["method"]["pallet"] != "paraInherent" or extrinsic["args"] == {}
+            for extrinsic in projected["extrinsics"]
+        )
+
+
+def test_projection_allowlists():
+    from polkadotetl.export.projection import Projection
+    from benchmarks.synthetic import generate_block
+
+    block = generate_block(5000, extrinsics=30)
+    projection = Projection(events=["balances.Transfer", "treasury"], extrinsic_pallets=["balances"])
+    projected = projection.project(block)
+    assert {extrinsic["method"]["pallet"] for extrinsic in projected["extrinsics"]} == {"timestamp", "balances"}
+    events = {
+        (event["method"]["pallet"], event["method"]["method"])
+        for extrinsic in projected["extrinsics"][1:]
+        for event in extrinsic["events"]
+    }
+    assert events == {("balances", "Transfer"), ("treasury", "Deposit")}
+
+
+def test_projection_sidecar_url(range_sidecar, monkeypatch, tmp_path):
+    from polkadotetl.export import internals, sidecar
+    from polkadotetl.export.projection import Projection
+
+    projection = Projection(skip_docs_and_fees=True)
+    assert (
+        projection.sidecar_url("http://sidecar/?apikey=1&noFees=false")
+        == "http://sidecar/?apikey=1&noFees=false&eventDocs=false&extrinsicDocs=false"
+    )
+    assert Projection().sidecar_url("http://sidecar/") == "http://sidecar/"
+
+    urls = []
+    get_block = sidecar.get_block
+    monkeypatch.setattr(
+        sidecar,
+        "get_block",
+        lambda sidecar_url, block_number: urls.append(sidecar_url) or get_block(sidecar_url, block_number),
+    )
+    internals.export_blocks_by_number(tmp_path, "http://sidecar/", 10, 11, projection=projection)
+    assert urls == ["http://sidecar/?eventDocs=false&extrinsicDocs=false&noFees=true"] * 2
+
+
+@pytest.fixture
+def http_sidecar():
+    """Serves synthetic blocks over HTTP, gzip-encoding the responses of even blocks
+    and answering `BAD_BLOCK` with an error."""
+    import gzip
+    import threading
+    from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+    from benchmarks.synthetic import generate_block
+
+    class Handler(BaseHTTPRequestHandler):
+        def do_GET(self):
+            block_number = int(self.path.split("?")[0].rsplit("/", 1)[1])
+            if block_number == BAD_BLOCK:
+                content = json.dumps({"code": 500, "message": "error"}).encode()
+            else:
+                content = json.dumps(generate_block(block_number, extrinsics=2)).encode()
+            self.send_response(200)
+            if block_number % 2 == 0 and "gzip" in self.headers.get("Accept-Encoding", ""):
+                content = gzip.compress(content)
+                self.send_header("Content-Encoding", "gzip")
+            self.send_header("Content-Length", str(len(content)))
+            self.end_headers()
+            self.wfile.write(content)
+
+        def log_message(self, *args):
+            pass
+
+    server = ThreadingHTTPServer(("127.0.0.1", 0), Handler)
+    thread = threading.Thread(target=server.serve_forever, daemon=True)
+    thread.start()
+    yield f"http://127.0.0.1:{server.server_port}/"
+    server.shutdown()
+
+
+@pytest.mark.parametrize("compressed", [False, True])
+def test_export_blocks_passthrough(http_sidecar, monkeypatch, tmp_path, compressed):
+    from polkadotetl.core.sources import iter_blocks
+    from polkadotetl.export import internals, sidecar
+    from polkadotetl.export.verify import verify_blocks
+    from benchmarks.synthetic import generate_block
+
+    monkeypatch.setattr(sidecar.PolkadotRequestor, "__init__", fast_requestor_init)
+    failed_blocks = internals.export_blocks_by_number(
+        tmp_path, http_sidecar, 1034, 1039, passthrough=True, compressed=compressed
+    )
+    assert failed_blocks == [BAD_BLOCK]
+    suffix = ".json.gz" if compressed else ".json"
+    assert sorted(path.name for path in tmp_path.iterdir()) == [
+        f"{n}{suffix}" for n in range(1034, 1040) if n != BAD_BLOCK
+    ]
+    blocks = {int(block["number"]): block for _, block in iter_blocks(tmp_path)}
+    assert blocks[1036] == generate_block(1036, extrinsics=2)
+    assert blocks[1039] == generate_block(1039, extrinsics=2)
+    report = verify_blocks([tmp_path], 1034, 1039, sample_rate=1.0, max_workers=1)
+    assert report.missing == [(BAD_BLOCK, BAD_BLOCK)]
+    assert not any(report.problems.values())
+
+
+def test_export_blocks_passthrough_is_exclusive(tmp_path):
+    from polkadotetl.exceptions import InvalidInput
+    from polkadotetl.export import internals
+    from polkadotetl.export.projection import Projection
+
+    with pytest.raises(InvalidInput):
+        internals.export_blocks_by_number(
+            tmp_path, "http://sidecar", 1, 2, projection=Projection.transfers(), passthrough=True
+        )
+    with pytest.raises(InvalidInput):
+        internals.export_blocks_by_number(
+            tmp_path, "http://sidecar", 1, 2, batch_size=10, passthrough=True
+        )
+
+
+def test_scan_gzip():
+    import gzip
+    import zlib
+
+    from polkadotetl.export.sidecar import (
+        RAW_BLOCK_CHUNK_SIZE,
+        RAW_BLOCK_EXTRINSICS,
+        RAW_BLOCK_HEAD_SIZE,
+        RAW_BLOCK_TAIL_SIZE,
+        _scan_gzip,
+    )
+
+    # the field straddles the boundary between two decompressed chunks
+    padding = RAW_BLOCK_CHUNK_SIZE - len(b'{"number": "1", "x": "') - 5
+    content = b'{"number": "1", "x": "' + b"a" * padding + b'", ' + RAW_BLOCK_EXTRINSICS + b": []}"
+    compressed = gzip.compress(content)
+    assert _scan_gzip(compressed) == (
+        content[:RAW_BLOCK_HEAD_SIZE], content[-RAW_BLOCK_TAIL_SIZE:], True
+    )
+    assert _scan_gzip(gzip.compress(content.replace(RAW_BLOCK_EXTRINSICS, b'"other"')))[2] is False
+    with pytest.raises(EOFError):
+        _scan_gzip(compressed[:-8])
+    corrupt = bytearray(compressed)
+    # flip a bit of the CRC32 in the trailer
+    corrupt[-8] ^= 1
+    with pytest.raises(zlib.error):
+        _scan_gzip(bytes(corrupt))
@@ -0,0 +1,85 @@
+"""Tests for the address index"""
+import json
+
+import pytest
+from typer.testing import CliRunner
+
+
+@pytest.mark.filterwarnings("ignore::polkadotetl.warnings.NoTransactionsWarning")
+def test_enrich_index_and_lookup(tmp_path):
+    from polkadotetl.cli import app
+    from benchmarks.synthetic import write_blocks
+
+    write_blocks(tmp_path / "blocks", 100, 30)
+    runner = CliRunner()
+    index = tmp_path / "index.sqlite"
+    for start_block, end_block in ((100, 114), (110, 129)):
+        # enrich in two overlapping parts to update the index incrementally
+        result = runner.invoke(
+            app,
+            [
+                "enrich", str(tmp_path / "blocks"), str(tmp_path / "enriched.json"),
+                "--overwrite", "--batch-size", "7", "--index", str(index), "--index-hashes",
+                "--start-block", str(start_block), "--end-block", str(end_block),
+            ],
+        )
+        assert result.exit_code == 0, result.output
+
+    expected = {}
+    hashes = {}
+    from polkadotetl.enrich import enrich_block
+    from benchmarks.synthetic import generate_blocks
+
+    for block in generate_blocks(100, 30):
+        for txn in enrich_block(block):
+            for address in (txn["sender_address"], txn["receiver_address"]):
+                if address is not None:
+                    expected.setdefault(address, set()).add(int(txn["block"]))
+            hashes.setdefault(txn["transaction_hash"], set()).add(int(txn["block"]))
+    addresses = sorted(expected, key=lambda address: -len(expected[address]))[:3]
+
+    result = runner.invoke(app, ["lookup", str(index), *addresses])
+    assert result.exit_code == 0, result.output
+    assert json.loads(result.stdout) == {address: sorted(expected[address]) for address in addresses}
+
+    result = runner.invoke(app, ["lookup", str(index), addresses[0], "--start-block", "120"])
+    assert json.loads(result.stdout) == {addresses[0]: sorted(n for n in expected[addresses[0]] if n >= 120)}
+
+    transaction_hash = next(iter(hashes))
+    result = runner.invoke(app, ["lookup", str(index), "--transaction-hash", transaction_hash, "0xmissing"])
+    assert json.loads(result.stdout) == {transaction_hash: sorted(hashes[transaction_hash]), "0xmissing": []}
+
+    from polkadotetl.enrich.index import AddressIndex
+
+    with AddressIndex(index) as address_index:
+        assert address_index.stats() == dict(blocks=30, start_block=100, end_block=129)
+
+
+def test_read_only_index(tmp_path):
+    import sqlite3
+
+    from polkadotetl.enrich.index import AddressIndex
+    from polkadotetl.exceptions import InvalidInput
+
+    missing = tmp_path / "missing.sqlite"
+    with pytest.raises(InvalidInput):
+        AddressIndex(missing, read_only=True)
+    assert not missing.exists()
+
+    index = tmp_path / "index.sqlite"
+    transaction = dict(block="7", sender_address="a", receiver_address="b", transaction_hash="0x01")
+    with AddressIndex(index) as address_index:
+        # blocks without transactions are recorded too
+        address_index.add_transactions([transaction], block_numbers=[5, 6, 7])
+    connection = sqlite3.connect(index)
+    connection.execute("PRAGMA journal_mode=DELETE")
+    connection.close()
+
+    with AddressIndex(index, read_only=True) as address_index:
+        assert address_index.lookup_address("a") == [7]
+        assert address_index.stats() == dict(blocks=3, start_block=5, end_block=7)
+        with pytest.raises(sqlite3.OperationalError):
+            address_index.add_transactions([transaction])
+    connection = sqlite3.connect(index)
+    assert connection.execute("PRAGMA journal_mode").fetchone() == ("delete",)
+    connection.close()
@@ -0,0 +1,39 @@
+"""Tests for the layouts of raw block files"""
+
+
+def test_sharded_block_file_path(tmp_path):
+    from polkadotetl.core.layout import Layout, block_file_path
+
+    assert block_file_path(tmp_path, 18_234_567) == tmp_path / "18234567.json"
+    assert (
+        block_file_path(tmp_path, 18_234_567, Layout.SHARDED)
+        == tmp_path / "18" / "18234" / "18234567.json"
+    )
+
+
+def test_iter_block_files(tmp_path):
+    from polkadotetl.core.layout import (
+        Layout,
+        block_file_path,
+        iter_block_files,
+        write_block_file,
+    )
+
+    for block_number in (5, 999_999, 1_000_000, 1_001_234):
+        write_block_file(block_file_path(tmp_path, block_number, Layout.SHARDED), "{}")
+    write_block_file(block_file_path(tmp_path, 7), "{}")
+    # writes in progress and other files are ignored
+    (tmp_path / "0" / "0" / ".6.json.1.2.tmp").write_text("{")
+    (tmp_path / "notes.txt").write_text("")
+
+    block_files = sorted(iter_block_files(tmp_path))
+    assert block_files == sorted(
+        str(path)
+        for path in (
+            tmp_path / "0" / "0" / "5.json",
+            tmp_path / "0" / "999" / "999999.json",
+            tmp_path / "1" / "1000" / "1000000.json",
+            tmp_path / "1" / "1001" / "1001234.json",
+            tmp_path / "7.json",
+        )
+    )
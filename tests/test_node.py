@@ -0,0 +1,604 @@
+"""Tests for reading blocks from a node's JSON-RPC"""
+import hashlib
+import json
+
+import pytest
+
+ALICE = bytes.fromhex("d43593c715fdd31c61141abd04a99fd6822c8558854ccde39a5684e7a56da27d")
+ALICE_ADDRESS = "15oF4uVJwmo4TdGW7VfQxNLavjCXviqxT9S1MgbjMNHr6Sp5"
+BOB = bytes.fromhex("8eaf04151687736326c9fea17e25fc5287613693c912909cb226aa4794f26a48")
+HEAD_BLOCK = 1040
+FINALIZED_BLOCK = 1038
+SPEC_VERSION = 9430
+
+
+def to_hex(value) -> str:
+    return "0x" + (value if isinstance(value, bytes) else json.dumps(value).encode()).hex()
+
+
+def block_hash(block_number: int) -> str:
+    return f"0x{block_number:064x}"
+
+
+def babe_pre_digest(authority_index: int) -> str:
+    data = bytes([1]) + authority_index.to_bytes(4, "little") + (123).to_bytes(8, "little")
+    return to_hex(bytes([6]) + b"BABE" + bytes([len(data) << 2]) + data)
+
+
+def header(block_number: int) -> dict:
+    return {
+        "number": hex(block_number),
+        "parentHash": block_hash(block_number - 1),
+        "stateRoot": "0x" + "11" * 32,
+        "extrinsicsRoot": "0x" + "22" * 32,
+        "digest": {"logs": [babe_pre_digest(block_number % 2)]},
+    }
+
+
+def extrinsics(block_number: int) -> list:
+    """Extrinsics are json, hex encoded, for `JsonDecoder` to decode."""
+    return [
+        to_hex(dict(pallet="Timestamp", method="set", args={"now": block_number * 6000})),
+        to_hex(
+            dict(
+                pallet="Balances",
+                method="transfer_keep_alive",
+                args={"dest": {"Id": ALICE_ADDRESS}, "value": 10 ** 10},
+                signer=ALICE_ADDRESS,
+                signature="0x" + "33" * 64,
+                nonce=7,
+                tip=0,
+                era=[64, 12],
+            )
+        ),
+    ]
+
+
+def events(block_number: int) -> list:
+    dispatch_info = {"weight": 100, "class": "Normal", "pays_fee": "Yes"}
+    return [
+        dict(phase="initialization", extrinsic_index=None, pallet="ParaInclusion", method="CandidateIncluded", data=[]),
+        dict(phase="extrinsic", extrinsic_index=0, pallet="System", method="ExtrinsicSuccess", data=[{"weight": 1, "class": "Mandatory", "pays_fee": "No"}]),
+        dict(phase="extrinsic", extrinsic_index=1, pallet="Balances", method="Transfer", data=[ALICE_ADDRESS, ALICE_ADDRESS, 10 ** 10]),
+        dict(phase="extrinsic", extrinsic_index=1, pallet="System", method="ExtrinsicSuccess", data=[dispatch_info]),
+        dict(phase="finalization", extrinsic_index=None, pallet="Staking", method="EraPaid", data=[block_number]),
+    ]
+
+
+class JsonDecoder:
+    """Stands in for `ScaleDecoder`, decoding the hex encoded json of the test node."""
+
+    def __init__(self):
+        self.metadata = {}
+
+    def has_metadata(self, spec_version):
+        return spec_version in self.metadata
+
+    def load_metadata(self, spec_version, metadata_hex):
+        self.metadata[spec_version] = metadata_hex
+
+    def decode_extrinsic(self, spec_version, extrinsic_hex):
+        assert spec_version in self.metadata
+        return json.loads(bytes.fromhex(extrinsic_hex[2:]))
+
+    def decode_events(self, spec_version, events_hex):
+        assert spec_version in self.metadata
+        return json.loads(bytes.fromhex(events_hex[2:]))
+
+
+@pytest.fixture
+def rpc_node(monkeypatch):
+    """Serves a JSON-RPC node over HTTP, and records the batches it's sent."""
+    import threading
+    from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+    from polkadotetl.export import node
+    from polkadotetl.export.node import SESSION_VALIDATORS_KEY, SYSTEM_EVENTS_KEY, TIMESTAMP_NOW_KEY
+
+    batches = []
+    hashes = {block_hash(n): n for n in range(HEAD_BLOCK + 1)}
+    storage = {
+        SYSTEM_EVENTS_KEY: lambda n: to_hex(events(n)),
+        SESSION_VALIDATORS_KEY: lambda n: to_hex(bytes([2 << 2]) + ALICE + BOB),
+        TIMESTAMP_NOW_KEY: lambda n: to_hex((n * 6000).to_bytes(8, "little")),
+    }
+
+    def answer(method, params):
+        if method == "chain_getBlockHash":
+            return block_hash(params[0]) if params[0] <= HEAD_BLOCK else None
+        if method == "chain_getFinalizedHead":
+            return block_hash(FINALIZED_BLOCK)
+        if method == "chain_getHeader":
+            return header(hashes[params[0]] if params else HEAD_BLOCK)
+        if method == "chain_getBlock":
+            n = hashes[params[0]]
+            return {"block": {"header": header(n), "extrinsics": extrinsics(n)}, "justifications": None}
+        if method == "state_getStorage":
+            return storage[params[0]](hashes[params[1]])
+        if method == "state_getRuntimeVersion":
+            return {"specName": "polkadot", "specVersion": SPEC_VERSION}
+        if method == "state_getMetadata":
+            return "0x6d657461"
+        raise KeyError(method)
+
+    class Handler(BaseHTTPRequestHandler):
+        def do_POST(self):
+            batch = json.loads(self.rfile.read(int(self.headers["Content-Length"])))
+            batches.append([call["method"] for call in batch])
+            responses = []
+            for call in batch:
+                try:
+                    responses.append({"jsonrpc": "2.0", "id": call["id"], "result": answer(call["method"], call["params"])})
+                except KeyError:
+                    responses.append({"jsonrpc": "2.0", "id": call["id"], "error": {"code": -32601, "message": "Method not found"}})
+            content = json.dumps(responses).encode()
+            self.send_response(200)
+            self.send_header("Content-Length", str(len(content)))
+            self.end_headers()
+            self.wfile.write(content)
+
+        def log_message(self, *args):
+            pass
+
+    decoder = JsonDecoder()
+    monkeypatch.setattr(node, "get_decoder", lambda node_url: decoder)
+    server = ThreadingHTTPServer(("127.0.0.1", 0), Handler)
+    thread = threading.Thread(target=server.serve_forever, daemon=True)
+    thread.start()
+    yield f"rpc+http://127.0.0.1:{server.server_port}/", batches
+    server.shutdown()
+
+
+def test_is_node_url():
+    from polkadotetl.export.node import is_node_url
+
+    assert is_node_url("wss://rpc.polkadot.io")
+    assert is_node_url("rpc+https://rpc.polkadot.io")
+    assert not is_node_url("https://sidecar.example.com")
+    assert not is_node_url("http://localhost:8080")
+
+
+def test_ss58_encode():
+    from polkadotetl.export.node import ss58_encode
+
+    assert ss58_encode(ALICE) == ALICE_ADDRESS
+    assert ss58_encode(ALICE, 42) == "5GrwvaEF5zXb26Fz9rcQpDWS57CtERHpNehXCPcNoHGKutQY"
+
+
+def test_decode_digest_item_and_author():
+    from polkadotetl.export.node import decode_author, decode_digest_item, ss58_encode
+
+    digest = babe_pre_digest(1)
+    item = decode_digest_item(digest)
+    assert item["type"] == "PreRuntime"
+    assert item["index"] == "6"
+    assert item["value"][0] == "0x" + b"BABE".hex()
+    validators = to_hex(bytes([2 << 2]) + ALICE + BOB)
+    assert decode_author([digest], validators) == ss58_encode(BOB)
+    assert decode_author([babe_pre_digest(0)], validators) == ALICE_ADDRESS
+    assert decode_author([digest], None) is None
+
+
+def test_get_blocks(rpc_node):
+    from polkadotetl.enrich import enrich_block
+    from polkadotetl.export import node
+
+    node_url, batches = rpc_node
+    blocks = node.get_blocks(node_url, 1036, 1039)
+    # hashes, then every block's body, events and validators, then the metadata once
+    assert len(batches) == 3
+    assert batches[0] == ["chain_getBlockHash"] * 4 + ["chain_getFinalizedHead"]
+    assert batches[2] == ["state_getMetadata"]
+    assert [block["number"] for block in blocks] == ["1036", "1037", "1038", "1039"]
+    assert [block["finalized"] for block in blocks] == [True, True, True, False]
+
+    block = blocks[1]
+    assert block["hash"] == block_hash(1037)
+    assert block["parentHash"] == block_hash(1036)
+    assert block["authorId"] == node.ss58_encode(BOB)
+    assert block["onInitialize"]["events"][0]["method"] == {"pallet": "paraInclusion", "method": "CandidateIncluded"}
+    assert block["onFinalize"]["events"][0]["data"] == ["1037"]
+    timestamp, transfer = block["extrinsics"]
+    assert timestamp["method"] == {"pallet": "timestamp", "method": "set"}
+    assert timestamp["args"] == {"now": str(1037 * 6000)}
+    assert timestamp["signature"] is None
+    assert timestamp["paysFee"] is False
+    assert transfer["method"] == {"pallet": "balances", "method": "transferKeepAlive"}
+    assert transfer["signature"]["signer"] == {"id": ALICE_ADDRESS}
+    assert transfer["nonce"] == "7"
+    assert transfer["era"] == {"mortalEra": ["64", "12"]}
+    assert transfer["success"] is True
+    assert transfer["paysFee"] is True
+    assert transfer["events"][0]["data"] == [ALICE_ADDRESS, ALICE_ADDRESS, str(10 ** 10)]
+    assert transfer["events"][1]["data"][0]["paysFee"] == "Yes"
+    extrinsic_bytes = bytes.fromhex(extrinsics(1037)[1][2:])
+    assert transfer["hash"] == "0x" + hashlib.blake2b(extrinsic_bytes, digest_size=32).hexdigest()
+    assert enrich_block(block)
+
+    # the metadata of a runtime version is only fetched once
+    node.get_blocks(node_url, 1030, 1031)
+    assert len(batches) == 5
+
+
+def test_get_block_timestamp_and_head(rpc_node):
+    from polkadotetl.export import node
+
+    node_url, _ = rpc_node
+    assert node.get_head_block_number(node_url) == HEAD_BLOCK
+    assert node.get_block_timestamp(node_url, 1037) == 1037 * 6
+    assert node.get_block(node_url, "head")["number"] == str(HEAD_BLOCK)
+
+
+def test_missing_blocks_raise(rpc_node):
+    from polkadotetl.exceptions import PolkadotNodeError
+    from polkadotetl.export import node
+
+    node_url, _ = rpc_node
+    with pytest.raises(PolkadotNodeError):
+        node.get_blocks(node_url, HEAD_BLOCK, HEAD_BLOCK + 1)
+
+
+def test_export_blocks_from_node(rpc_node, tmp_path):
+    from polkadotetl.core.sources import iter_blocks
+    from polkadotetl.exceptions import InvalidInput
+    from polkadotetl.export import internals
+
+    node_url, batches = rpc_node
+    failed_blocks = internals.export_blocks_by_number(tmp_path, node_url, 1030, 1039, batch_size=5)
+    assert failed_blocks == []
+    assert len(batches) == 5
+    blocks = {int(block["number"]): block for _, block in iter_blocks(tmp_path)}
+    assert sorted(blocks) == list(range(1030, 1040))
+    with pytest.raises(InvalidInput):
+        internals.export_blocks_by_number(tmp_path, node_url, 1030, 1039, passthrough=True)
+
+
+def test_bench_node(rpc_node):
+    from polkadotetl.export.bench import bench_sidecar, recommend
+
+    node_url, batches = rpc_node
+    results = bench_sidecar(
+        node_url, 1000, 1030, concurrency_levels=(1, 2), batch_sizes=(1, 5), requests_per_trial=4
+    )
+    assert all(result.errors == 0 for result in results)
+    assert len(batches) >= 4 * len(results)
+    assert recommend(node_url, results).sidecar == node_url
+
+
+def compact(value: int) -> bytes:
+    if value < 1 << 6:
+        return bytes([value << 2])
+    if value < 1 << 14:
+        return (value << 2 | 1).to_bytes(2, "little")
+    if value < 1 << 30:
+        return (value << 2 | 2).to_bytes(4, "little")
+    data = value.to_bytes((value.bit_length() + 7) // 8, "little")
+    return bytes([(len(data) - 4) << 2 | 3]) + data
+
+
+def polkadot_metadata() -> str:
+    """A metadata v14 with the types, pallet indices and signed extensions of
+    Polkadot's System, Timestamp and Balances pallets, cut down to the calls
+    and events used here."""
+    from scalecodec.base import RuntimeConfigurationObject
+    from scalecodec.type_registry import load_type_registry_preset
+
+    types = []
+
+    def add(path, definition, params=()):
+        types.append(
+            {
+                "path": list(path),
+                "params": [{"name": name, "type": type_id} for name, type_id in params],
+                "def": definition,
+                "docs": [],
+            }
+        )
+        return len(types) - 1
+
+    def fields(*items):
+        return [{"name": name, "type": type_id, "typeName": type_name, "docs": []} for name, type_id, type_name in items]
+
+    def variant(*variants):
+        return {
+            "variant": {
+                "variants": [
+                    {"name": name, "fields": fields(*items), "index": index, "docs": []}
+                    for name, index, items in variants
+                ]
+            }
+        }
+
+    u8 = add((), {"primitive": "u8"})
+    u32 = add((), {"primitive": "u32"})
+    u64 = add((), {"primitive": "u64"})
+    u128 = add((), {"primitive": "u128"})
+    unit = add((), {"tuple": []})
+    bytes_ = add((), {"sequence": {"type": u8}})
+    bytes32 = add((), {"array": {"len": 32, "type": u8}})
+    bytes64 = add((), {"array": {"len": 64, "type": u8}})
+    compact_u32 = add((), {"compact": {"type": u32}})
+    compact_u64 = add((), {"compact": {"type": u64}})
+    compact_u128 = add((), {"compact": {"type": u128}})
+    account = add(("sp_core", "crypto", "AccountId32"), {"composite": {"fields": fields((None, bytes32, "[u8; 32]"))}})
+    h256 = add(("primitive_types", "H256"), {"composite": {"fields": fields((None, bytes32, "[u8; 32]"))}})
+    address = add(
+        ("sp_runtime", "multiaddress", "MultiAddress"),
+        variant(("Id", 0, [(None, account, "AccountId")]), ("Raw", 2, [(None, bytes_, "Vec<u8>")])),
+        [("AccountId", account), ("AccountIndex", unit)],
+    )
+    signature = add(
+        ("sp_runtime", "MultiSignature"),
+        variant(("Ed25519", 0, [(None, bytes64, "Signature")]), ("Sr25519", 1, [(None, bytes64, "Signature")])),
+    )
+    era = add(
+        ("sp_runtime", "generic", "era", "Era"),
+        variant(("Immortal", 0, []), *[(f"Mortal{index}", index, [(None, u8, None)]) for index in range(1, 256)]),
+    )
+    transfer_args = [("dest", address, "AccountIdLookupOf<T>"), ("value", compact_u128, "T::Balance")]
+    timestamp_call = add(("pallet_timestamp", "pallet", "Call"), variant(("set", 0, [("now", compact_u64, "T::Moment")])))
+    balances_call = add(
+        ("pallet_balances", "pallet", "Call"),
+        variant(("transfer", 0, transfer_args), ("transfer_keep_alive", 3, transfer_args)),
+    )
+    call = add(
+        ("polkadot_runtime", "RuntimeCall"),
+        variant(("Timestamp", 3, [(None, timestamp_call, None)]), ("Balances", 5, [(None, balances_call, None)])),
+    )
+    weight = add(
+        ("sp_weights", "weight_v2", "Weight"),
+        {"composite": {"fields": fields(("ref_time", compact_u64, "u64"), ("proof_size", compact_u64, "u64"))}},
+    )
+    dispatch_class = add(
+        ("frame_support", "dispatch", "DispatchClass"),
+        variant(("Normal", 0, []), ("Operational", 1, []), ("Mandatory", 2, [])),
+    )
+    pays = add(("frame_support", "dispatch", "Pays"), variant(("Yes", 0, []), ("No", 1, [])))
+    dispatch_info = add(
+        ("frame_support", "dispatch", "DispatchInfo"),
+        {"composite": {"fields": fields(("weight", weight, None), ("class", dispatch_class, None), ("pays_fee", pays, None))}},
+    )
+    system_event = add(
+        ("frame_system", "pallet", "Event"),
+        variant(("ExtrinsicSuccess", 0, [("dispatch_info", dispatch_info, "DispatchInfo")])),
+    )
+    balances_event = add(
+        ("pallet_balances", "pallet", "Event"),
+        variant(
+            ("Transfer", 2, [("from", account, None), ("to", account, None), ("amount", u128, None)]),
+            ("Deposit", 7, [("who", account, None), ("amount", u128, None)]),
+            ("Withdraw", 8, [("who", account, None), ("amount", u128, None)]),
+        ),
+    )
+    event = add(
+        ("polkadot_runtime", "RuntimeEvent"),
+        variant(("System", 0, [(None, system_event, None)]), ("Balances", 5, [(None, balances_event, None)])),
+    )
+    phase = add(
+        ("frame_system", "Phase"),
+        variant(("ApplyExtrinsic", 0, [(None, u32, "u32")]), ("Finalization", 1, []), ("Initialization", 2, [])),
+    )
+    topics = add((), {"sequence": {"type": h256}})
+    event_record = add(
+        ("frame_system", "EventRecord"),
+        {"composite": {"fields": fields(("phase", phase, None), ("event", event, None), ("topics", topics, None))}},
+        [("E", event), ("T", h256)],
+    )
+    event_records = add((), {"sequence": {"type": event_record}})
+    extrinsic = add(
+        ("sp_runtime", "generic", "unchecked_extrinsic", "UncheckedExtrinsic"),
+        {"composite": {"fields": fields((None, bytes_, None))}},
+        [("Address", address), ("Call", call), ("Signature", signature), ("Extra", unit)],
+    )
+    check_mortality = add(
+        ("frame_system", "extensions", "check_mortality", "CheckMortality"),
+        {"composite": {"fields": fields((None, era, "Era"))}},
+    )
+    check_nonce = add(
+        ("frame_system", "extensions", "check_nonce", "CheckNonce"),
+        {"composite": {"fields": fields((None, compact_u32, "T::Index"))}},
+    )
+    charge_transaction_payment = add(
+        ("pallet_transaction_payment", "ChargeTransactionPayment"),
+        {"composite": {"fields": fields((None, compact_u128, "BalanceOf<T>"))}},
+    )
+
+    def pallet(name, index, storage=None, calls=None, event=None):
+        return {
+            "name": name,
+            "storage": storage,
+            "calls": None if calls is None else {"ty": calls},
+            "event": None if event is None else {"ty": event},
+            "constants": [],
+            "error": None,
+            "index": index,
+        }
+
+    events_storage = {
+        "prefix": "System",
+        "entries": [
+            {"name": "Events", "modifier": "Default", "type": {"Plain": event_records}, "default": "0x00", "documentation": []}
+        ],
+    }
+    metadata = {
+        "types": {"types": [{"id": type_id, "type": type_} for type_id, type_ in enumerate(types)]},
+        "pallets": [
+            pallet("System", 0, storage=events_storage, event=system_event),
+            pallet("Timestamp", 3, calls=timestamp_call),
+            pallet("Balances", 5, calls=balances_call, event=balances_event),
+        ],
+        "extrinsic": {
+            "ty": extrinsic,
+            "version": 4,
+            "signed_extensions": [
+                {"identifier": "CheckSpecVersion", "ty": unit, "additional_signed": u32},
+                {"identifier": "CheckMortality", "ty": check_mortality, "additional_signed": h256},
+                {"identifier": "CheckNonce", "ty": check_nonce, "additional_signed": unit},
+                {"identifier": "ChargeTransactionPayment", "ty": charge_transaction_payment, "additional_signed": unit},
+            ],
+        },
+        "runtime_type": call,
+    }
+    runtime_configuration = RuntimeConfigurationObject()
+    runtime_configuration.update_type_registry(load_type_registry_preset("core"))
+    metadata_versioned = runtime_configuration.create_scale_object("MetadataVersioned")
+    return str(metadata_versioned.encode(["0x6d657461", {"V14": metadata}]))
+
+
+def test_scale_decoder():
+    pytest.importorskip("scalecodec")
+    from polkadotetl.cli.datasources.bigquery import bigquery_row
+    from polkadotetl.core.types import TransferTypes
+    from polkadotetl.enrich import enrich_block
+    from polkadotetl.export import node
+
+    # `Timestamp.set` and a signed `Balances.transfer_keep_alive` from Alice to
+    # Bob, mortal for 64 blocks from phase 12, with nonce 7
+    def extrinsic(body: bytes) -> str:
+        return to_hex(compact(len(body)) + body)
+
+    timestamp_hex = extrinsic(bytes([0x04, 3, 0]) + compact(1_700_000_000_000))
+    transfer_hex = extrinsic(
+        bytes([0x84, 0]) + ALICE + bytes([1]) + b"\x33" * 64 + bytes.fromhex("c500") + compact(7) + compact(0)
+        + bytes([5, 3, 0]) + BOB + compact(10 ** 10)
+    )
+
+    def record(phase: bytes, event: bytes) -> bytes:
+        # no topics
+        return phase + event + b"\x00"
+
+    def apply_extrinsic(index: int) -> bytes:
+        return b"\x00" + index.to_bytes(4, "little")
+
+    def success(dispatch_class: int, pays_fee: int) -> bytes:
+        return bytes([0, 0]) + compact(1000) + compact(0) + bytes([dispatch_class, pays_fee])
+
+    def u128(value: int) -> bytes:
+        return value.to_bytes(16, "little")
+
+    records = [
+        record(apply_extrinsic(0), success(2, 1)),
+        record(apply_extrinsic(1), bytes([5, 8]) + ALICE + u128(150)),
+        record(apply_extrinsic(1), bytes([5, 2]) + ALICE + BOB + u128(10 ** 10)),
+        record(apply_extrinsic(1), bytes([5, 7]) + BOB + u128(30)),
+        record(apply_extrinsic(1), success(0, 0)),
+        record(b"\x01", bytes([5, 7]) + BOB + u128(5)),
+    ]
+    events_hex = to_hex(compact(len(records)) + b"".join(records))
+
+    decoder = node.ScaleDecoder()
+    decoder.load_metadata(SPEC_VERSION, polkadot_metadata())
+    assert decoder.has_metadata(SPEC_VERSION)
+    block = node.build_block(
+        decoder,
+        block_hash(1037),
+        {"header": header(1037), "extrinsics": [timestamp_hex, transfer_hex]},
+        events_hex,
+        to_hex(bytes([2 << 2]) + ALICE + BOB),
+        SPEC_VERSION,
+        finalized=True,
+    )
+    bob_address = node.ss58_encode(BOB)
+    assert block["authorId"] == bob_address
+    timestamp, transfer = block["extrinsics"]
+    assert timestamp["method"] == {"pallet": "timestamp", "method": "set"}
+    assert timestamp["args"] == {"now": "1700000000000"}
+    assert timestamp["signature"] is None
+    assert timestamp["era"] == {"immortalEra": "0x00"}
+    assert timestamp["success"] is True
+    assert timestamp["paysFee"] is False
+    assert transfer["method"] == {"pallet": "balances", "method": "transferKeepAlive"}
+    assert transfer["args"] == {"dest": {"id": bob_address}, "value": str(10 ** 10)}
+    assert transfer["signature"] == {"signature": "0x" + "33" * 64, "signer": {"id": ALICE_ADDRESS}}
+    assert transfer["nonce"] == "7"
+    assert transfer["tip"] == "0"
+    assert transfer["era"] == {"mortalEra": ["64", "12"]}
+    assert transfer["hash"] == "0x" + hashlib.blake2b(bytes.fromhex(transfer_hex[2:]), digest_size=32).hexdigest()
+    assert [event["method"] for event in transfer["events"]] == [
+        {"pallet": "balances", "method": "Withdraw"},
+        {"pallet": "balances", "method": "Transfer"},
+        {"pallet": "balances", "method": "Deposit"},
+        {"pallet": "system", "method": "ExtrinsicSuccess"},
+    ]
+    assert transfer["events"][1]["data"] == [ALICE_ADDRESS, bob_address, str(10 ** 10)]
+    assert transfer["events"][3]["data"] == [
+        {"weight": {"refTime": "1000", "proofSize": "0"}, "class": "Normal", "paysFee": "Yes"}
+    ]
+    assert transfer["success"] is True
+    assert transfer["paysFee"] is True
+    assert block["onInitialize"]["events"] == []
+    assert block["onFinalize"]["events"] == [
+        {"method": {"pallet": "balances", "method": "Deposit"}, "data": [bob_address, "5"]}
+    ]
+
+    transactions = enrich_block(block)
+    assert [(txn["type"], txn["sender_address"], txn["receiver_address"]) for txn in transactions] == [
+        (TransferTypes.NORMAL.value, ALICE_ADDRESS, bob_address),
+        (TransferTypes.FEE.value, ALICE_ADDRESS, bob_address),
+    ]
+    assert all(txn["block_timestamp"] == 1_700_000_000 for txn in transactions)
+    row = bigquery_row(block)
+    assert json.loads(row["extrinsics"][1]["args"]) == transfer["args"]
+    assert all(isinstance(item, str) for event in row["extrinsics"][1]["events"] for item in event["data"])
+
+
+def test_transport_errors_are_retried(monkeypatch):
+    import socket
+    import threading
+    from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+    from polkadotetl.exceptions import PolkadotNodeError
+    from polkadotetl.export import node
+    from polkadotetl.export.sidecar import PolkadotRequestor
+
+    calls = []
+
+    class Handler(BaseHTTPRequestHandler):
+        def do_POST(self):
+            batch = json.loads(self.rfile.read(int(self.headers["Content-Length"])))
+            calls.append(batch)
+            content = json.dumps([{"jsonrpc": "2.0", "id": 0, "result": header(HEAD_BLOCK)}]).encode()
+            # the first response is cut short
+            if len(calls) == 1:
+                content = content[:10]
+            self.send_response(200)
+            self.send_header("Content-Length", str(len(content)))
+            self.end_headers()
+            self.wfile.write(content)
+
+        def log_message(self, *args):
+            pass
+
+    server = ThreadingHTTPServer(("127.0.0.1", 0), Handler)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    node_url = f"rpc+http://127.0.0.1:{server.server_port}/"
+    with pytest.raises(PolkadotNodeError):
+        node.get_head_block_number(node_url)
+    get_head_block_number = PolkadotRequestor(retries=2, retry_max_delay=1).build_requestor(node.get_head_block_number)
+    calls.clear()
+    assert get_head_block_number(node_url) == HEAD_BLOCK
+    assert len(calls) == 2
+    server.shutdown()
+
+    pytest.importorskip("websocket")
+    # a socket that is closed as soon as it's opened, and one that never answers
+    monkeypatch.setattr(node, "NODE_TIMEOUT_IN_SECONDS", 0.5)
+    for close in (True, False):
+        listener = socket.socket()
+        listener.bind(("127.0.0.1", 0))
+        listener.listen()
+        connections = []
+
+        def accept():
+            connection, _ = listener.accept()
+            if close:
+                connection.close()
+            else:
+                connections.append(connection)
+
+        threading.Thread(target=accept, daemon=True).start()
+        with pytest.raises(PolkadotNodeError):
+            node.call_batch(f"ws://127.0.0.1:{listener.getsockname()[1]}/", [("chain_getHeader", [])])
+        for connection in connections:
+            connection.close()
+        listener.close()
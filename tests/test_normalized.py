@@ -0,0 +1,91 @@
+"""Tests for the normalized BigQuery tables"""
+import json
+import os
+
+from typer.testing import CliRunner
+
+REPOSITORY = os.path.dirname(os.path.dirname(os.path.realpath(__file__)))
+
+
+def read_rows(path):
+    with open(path) as file_buffer:
+        return [json.loads(line) for line in file_buffer]
+
+
+def test_schema_files_are_generated():
+    from polkadotetl.cli.datasources.bigquery import NORMALIZED_SCHEMAS
+
+    for table, schema in NORMALIZED_SCHEMAS.items():
+        with open(os.path.join(REPOSITORY, f"schema_{table}.json")) as file_buffer:
+            assert json.load(file_buffer) == schema, f"Regenerate schema_{table}.json with write_normalized_schemas."
+
+
+def test_convert_to_normalized_tables(tmp_path):
+    from polkadotetl.cli import app
+    from polkadotetl.cli.datasources.bigquery import NORMALIZED_SCHEMAS, process
+    from benchmarks.synthetic import generate_blocks, write_blocks
+
+    write_blocks(tmp_path / "blocks", 100, 5, mix="era_payout")
+    result = CliRunner().invoke(
+        app,
+        ["convert-raw-blocks-to-bigquery-schema", str(tmp_path / "blocks"), str(tmp_path / "tables"), "--normalized"],
+    )
+    assert result.exit_code == 0, result.output
+    tables = {table: read_rows(tmp_path / "tables" / f"{table}.json") for table in NORMALIZED_SCHEMAS}
+    for table, rows in tables.items():
+        assert rows
+        fields = {field["name"] for field in NORMALIZED_SCHEMAS[table]}
+        assert all(set(row) == fields for row in rows)
+
+    # the normalized rows convert fields the same way as the nested rows
+    blocks = {int(block["number"]): block for block in generate_blocks(100, 5, mix="era_payout")}
+    for block in blocks.values():
+        process(block)
+    assert sorted(row["number"] for row in tables["blocks"]) == sorted(blocks)
+    for row in tables["blocks"]:
+        block = blocks[row["number"]]
+        assert row["extrinsic_count"] == len(block["extrinsics"])
+        assert row["event_count"] == sum(
+            1 for row in tables["events"] if row["block_number"] == int(block["number"])
+        )
+    for row in tables["extrinsics"]:
+        extrinsic = blocks[row["block_number"]]["extrinsics"][row["extrinsic_index"]]
+        assert (row["hash"], row["args"], row["signature"], row["success"]) == (
+            extrinsic["hash"], extrinsic["args"], extrinsic["signature"], extrinsic["success"]
+        )
+    for row in tables["events"]:
+        if row["phase"] == "applyExtrinsic":
+            extrinsic = blocks[row["block_number"]]["extrinsics"][row["extrinsic_index"]]
+            assert {"pallet": row["pallet"], "method": row["method"]} in [
+                event["method"] for event in extrinsic["events"]
+            ]
+    keys = [(row["block_number"], row["event_index"]) for row in tables["events"]]
+    assert len(keys) == len(set(keys))
+
+
+def test_normalize_projected_block():
+    import copy
+
+    from polkadotetl.cli.datasources.bigquery import normalize_block
+    from polkadotetl.export.projection import Projection
+    from benchmarks.synthetic import generate_block
+
+    block = generate_block(100, extrinsics=20, mix="era_payout")
+    _, extrinsic_rows, event_rows = normalize_block(block)
+    projected = Projection(events=["balances.Transfer", "staking"], drop_empty_extrinsics=True).project(
+        copy.deepcopy(block)
+    )
+    assert len(projected["extrinsics"]) < len(block["extrinsics"])
+    # projecting again keeps the original positions
+    projected = Projection(extrinsic_pallets=["staking"], drop_empty_extrinsics=True).project(projected)
+    _, projected_extrinsic_rows, projected_event_rows = normalize_block(projected)
+    assert projected_event_rows
+
+    # the rows of a projected block are the same as those of the full block, with the same indexes
+    extrinsics = {row["extrinsic_index"]: row for row in extrinsic_rows}
+    for row in projected_extrinsic_rows:
+        expected = dict(extrinsics[row["extrinsic_index"]], event_count=row["event_count"])
+        assert row == expected
+    events = {row["event_index"]: row for row in event_rows}
+    for row in projected_event_rows:
+        assert row == events[row["event_index"]]
@@ -0,0 +1,139 @@
+"""Tests for reading raw blocks from block sources"""
+import gzip
+import io
+import json
+import tarfile
+
+import pytest
+
+BLOCK_NUMBERS = range(100, 110)
+
+
+def blocks():
+    return [{"number": str(n), "extrinsics": []} for n in BLOCK_NUMBERS]
+
+
+def ndjson(blocks_):
+    return "".join(json.dumps(block) + "\n" for block in blocks_).encode()
+
+
+def read_numbers(source, **kwargs):
+    from polkadotetl.core.sources import iter_blocks
+
+    return sorted(int(block["number"]) for _, block in iter_blocks(source, **kwargs))
+
+
+def test_directory(tmp_path):
+    from polkadotetl.core.layout import Layout, block_file_path, write_block_file
+
+    for block in blocks():
+        write_block_file(
+            block_file_path(tmp_path, int(block["number"]), Layout.SHARDED),
+            json.dumps(block),
+        )
+    assert read_numbers(tmp_path) == list(BLOCK_NUMBERS)
+    assert read_numbers(tmp_path, start_block=103, end_block=105) == [103, 104, 105]
+
+
+@pytest.mark.parametrize("compression", ["none", "gzip", "zstd"])
+def test_ndjson(tmp_path, compression):
+    content = ndjson(blocks()) + b"{not json\n\n"
+    if compression == "gzip":
+        content = gzip.compress(content)
+    elif compression == "zstd":
+        zstandard = pytest.importorskip("zstandard")
+        content = zstandard.ZstdCompressor().compress(content)
+    source = tmp_path / "blocks.ndjson"
+    source.write_bytes(content)
+    assert read_numbers(source) == list(BLOCK_NUMBERS)
+    assert read_numbers(source, start_block=108) == [108, 109]
+
+
+def test_tar(tmp_path):
+    source = tmp_path / "blocks.tar.gz"
+    with tarfile.open(source, "w:gz") as archive:
+        for block in blocks()[:5]:
+            content = json.dumps(block).encode()
+            member = tarfile.TarInfo(f"export/{block['number']}.json")
+            member.size = len(content)
+            archive.addfile(member, io.BytesIO(content))
+        content = gzip.compress(ndjson(blocks()[5:]))
+        member = tarfile.TarInfo("export/rest.ndjson")
+        member.size = len(content)
+        archive.addfile(member, io.BytesIO(content))
+    assert read_numbers(source) == list(BLOCK_NUMBERS)
+    assert read_numbers(source, end_block=101) == [100, 101]
+
+
+def test_stdin(monkeypatch):
+    import sys
+
+    monkeypatch.setattr(sys, "stdin", io.TextIOWrapper(io.BytesIO(ndjson(blocks()))))
+    assert read_numbers("-") == list(BLOCK_NUMBERS)
+
+
+def test_missing_source(tmp_path):
+    from polkadotetl.exceptions import InvalidInput
+
+    with pytest.raises(InvalidInput):
+        read_numbers(tmp_path / "missing")
+
+
+class ShortReads(io.RawIOBase):
+    """A pipe-like stream that returns at most a few bytes per read."""
+
+    def __init__(self, content: bytes, size: int = 7):
+        self.content = io.BytesIO(content)
+        self.size = size
+
+    def readable(self):
+        return True
+
+    def readinto(self, buffer):
+        data = self.content.read(min(len(buffer), self.size))
+        buffer[: len(data)] = data
+        return len(data)
+
+
+@pytest.mark.parametrize("compression", ["none", "gzip"])
+def test_tar_from_short_reads(monkeypatch, compression):
+    import sys
+
+    archive_buffer = io.BytesIO()
+    with tarfile.open(fileobj=archive_buffer, mode="w") as archive:
+        for block in blocks():
+            content = json.dumps(block).encode()
+            member = tarfile.TarInfo(f"{block['number']}.json")
+            member.size = len(content)
+            archive.addfile(member, io.BytesIO(content))
+    content = archive_buffer.getvalue()
+    if compression == "gzip":
+        content = gzip.compress(content)
+    stdin = io.TextIOWrapper(io.BufferedReader(ShortReads(content), buffer_size=8))
+    monkeypatch.setattr(sys, "stdin", stdin)
+    assert read_numbers("-") == list(BLOCK_NUMBERS)
+
+
+def test_missing_source_is_checked_before_reading(tmp_path):
+    from polkadotetl.core.sources import iter_blocks
+    from polkadotetl.exceptions import InvalidInput
+
+    # the source is checked when iter_blocks is called, not on the first block
+    with pytest.raises(InvalidInput):
+        iter_blocks(tmp_path / "missing")
+
+
+@pytest.mark.parametrize("command", ["enrich", "convert-and-enrich"])
+def test_missing_source_leaves_output(tmp_path, command):
+    from typer.testing import CliRunner
+
+    from polkadotetl.cli import app
+
+    output_file = tmp_path / "enriched.json"
+    output_file.write_text("previous\n")
+    arguments = [str(tmp_path / "missing")]
+    if command == "convert-and-enrich":
+        arguments.append(str(tmp_path / "converted"))
+    result = CliRunner().invoke(app, [command, *arguments, str(output_file), "--overwrite"])
+    assert result.exit_code == 1
+    assert output_file.read_text() == "previous\n"
@@ -0,0 +1,37 @@
+"""Tests for the synthetic block generator"""
+import copy
+
+import pytest
+
+from benchmarks.synthetic import MIXES, generate_block, generate_blocks
+
+
+def test_generate_block_is_deterministic():
+    assert generate_block(7, mix="era_payout") == generate_block(7, mix="era_payout")
+    assert generate_block(7) != generate_block(8)
+    assert generate_block(7, seed=1) != generate_block(7)
+
+
+def test_generate_block_counts():
+    block = generate_block(7, extrinsics=12, para_inherent_size=3)
+    assert len(block["extrinsics"]) == 14
+    assert block["extrinsics"][0]["method"] == {"pallet": "timestamp", "method": "set"}
+    para_inherent = block["extrinsics"][1]
+    assert para_inherent["method"] == {"pallet": "paraInherent", "method": "enter"}
+    assert len(para_inherent["args"]["data"]["backedCandidates"]) == 3
+
+
+@pytest.mark.filterwarnings("ignore::polkadotetl.warnings.NoTransactionsWarning")
+@pytest.mark.parametrize("mix", MIXES)
+def test_synthetic_blocks_are_processed(mix):
+    """The generated blocks pass through enrichment and the BigQuery conversion."""
+    from polkadotetl.cli.datasources.bigquery import process
+    from polkadotetl.enrich import enrich_block
+    from polkadotetl.enrich.columnar import enrich_blocks
+
+    blocks = list(generate_blocks(1000, 10, mix=mix))
+    transactions = [txn for block in blocks for txn in enrich_block(block)]
+    assert transactions
+    assert enrich_blocks(blocks) == transactions
+    for block in copy.deepcopy(blocks):
+        process(block)
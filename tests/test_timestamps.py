@@ -0,0 +1,185 @@
+"""Tests for resolving blocks from timestamps"""
+import datetime
+
+import pytest
+
+GENESIS_TIMESTAMP = datetime.datetime(2022, 1, 1, 0, 0, 3, tzinfo=datetime.timezone.utc)
+HEAD_BLOCK = 60_000
+
+
+def block_time(block_number):
+    """Mostly 6 second blocks, with a slower stretch to keep the search honest."""
+    seconds = block_number * 6 + max(0, block_number - 20_000) * 6
+    return GENESIS_TIMESTAMP + datetime.timedelta(seconds=seconds)
+
+
+@pytest.fixture
+def fake_sidecar(monkeypatch):
+    """Replaces the sidecar with a synthetic chain and records every timestamp probe."""
+    from polkadotetl.export import sidecar
+
+    probed = []
+
+    def get_block(sidecar_url, block_number):
+        if block_number == "head":
+            block_number = HEAD_BLOCK
+        now = int(block_time(block_number).timestamp() * 1000)
+        return {
+            "number": str(block_number),
+            "extrinsics": [{"args": {"now": str(now)}}],
+        }
+
+    def get_block_timestamp(sidecar_url, block_number):
+        assert 1 <= block_number <= HEAD_BLOCK
+        probed.append(block_number)
+        return int(block_time(block_number).timestamp() * 1000) / 1000
+
+    monkeypatch.setattr(sidecar, "get_block", get_block)
+    monkeypatch.setattr(sidecar, "get_block_timestamp", get_block_timestamp)
+    monkeypatch.setattr(sidecar, "get_head_block_number", lambda sidecar_url: HEAD_BLOCK)
+    return probed
+
+
+def first_block_on_or_after(timestamp):
+    low, high = 1, HEAD_BLOCK + 1
+    while low < high:
+        mid = (low + high) // 2
+        if block_time(mid) >= timestamp:
+            high = mid
+        else:
+            low = mid + 1
+    return low
+
+
+def test_get_blocks_for_timestamps(fake_sidecar):
+    from polkadotetl.export import internals
+
+    timestamps = [
+        GENESIS_TIMESTAMP + datetime.timedelta(hours=hours, seconds=1)
+        for hours in range(0, 130, 3)
+    ]
+    blocks = internals.get_blocks_for_timestamps("http://sidecar", timestamps)
+    assert blocks == [first_block_on_or_after(timestamp) for timestamp in timestamps]
+    assert len(fake_sidecar) < len(timestamps) * 6
+
+
+def test_get_block_for_timestamp(fake_sidecar, monkeypatch):
+    import concurrent.futures
+
+    from polkadotetl.export import internals
+
+    rounds = []
+
+    class RoundCounter(concurrent.futures.ThreadPoolExecutor):
+        """Every round of the search probes its blocks with one `map`."""
+
+        def map(self, *args, **kwargs):
+            rounds.append(None)
+            return super().map(*args, **kwargs)
+
+    monkeypatch.setattr(concurrent.futures, "ThreadPoolExecutor", RoundCounter)
+    timestamp = GENESIS_TIMESTAMP + datetime.timedelta(hours=50, seconds=1)
+    block = first_block_on_or_after(timestamp)
+    rounds_by_parallel_probes = {}
+    for parallel_probes in (1, 4):
+        rounds.clear()
+        fake_sidecar.clear()
+        assert internals.get_blocks_for_timestamps(
+            "http://sidecar", [timestamp], parallel_probes=parallel_probes
+        ) == [block]
+        rounds_by_parallel_probes[parallel_probes] = len(rounds)
+        # the head, then at most the estimate, the block before it and the spare probes
+        assert len(fake_sidecar) <= 1 + len(rounds) * (parallel_probes + 2)
+    assert rounds_by_parallel_probes[4] < rounds_by_parallel_probes[1]
+    assert internals.get_block_for_timestamp("http://sidecar", timestamp) == block
+    assert internals.get_block_for_timestamp(
+        "http://sidecar", timestamp, search_for_next_block=False
+    ) == block - 1
+    assert internals.get_block_for_timestamp(
+        "http://sidecar", block_time(block), search_for_next_block=False
+    ) == block
+
+
+def test_get_blocks_for_timestamps_after_head(fake_sidecar):
+    from polkadotetl.export import internals
+
+    timestamp = block_time(HEAD_BLOCK) + datetime.timedelta(minutes=1)
+    assert internals.get_blocks_for_timestamps("http://sidecar", [timestamp]) == [
+        HEAD_BLOCK + 1
+    ]
+
+
+def test_get_blocks_for_timestamps_unsorted(fake_sidecar):
+    from polkadotetl.exceptions import InvalidInput
+    from polkadotetl.export import internals
+
+    with pytest.raises(InvalidInput):
+        internals.get_blocks_for_timestamps(
+            "http://sidecar",
+            [GENESIS_TIMESTAMP + datetime.timedelta(hours=1), GENESIS_TIMESTAMP],
+        )
+
+
+def test_get_block_ranges_for_dates(fake_sidecar):
+    from polkadotetl.export import internals
+
+    block_ranges = internals.get_block_ranges_for_dates(
+        "http://sidecar", datetime.date(2022, 1, 1), datetime.date(2022, 1, 10)
+    )
+    days = sorted(block_ranges)
+    assert days[0] == datetime.date(2022, 1, 1)
+    for day in days:
+        start_block, end_block = block_ranges[day]
+        assert block_time(start_block).date() == day
+        assert block_time(end_block).date() == day
+        assert end_block == HEAD_BLOCK or block_time(end_block + 1).date() > day
+    # the chain ends before the last requested day
+    assert block_ranges[days[-1]][1] == HEAD_BLOCK
+    assert datetime.date(2022, 1, 10) not in block_ranges
+
+
+def test_export_blocks_by_partition(fake_sidecar, tmp_path):
+    from polkadotetl.export import internals
+
+    incomplete_partitions = internals.export_blocks_by_partition(
+        tmp_path,
+        "http://sidecar",
+        datetime.datetime(2022, 1, 1, 1, 30),
+        datetime.datetime(2022, 1, 1, 2, 30),
+        internals.Partition.HOUR,
+        max_workers=2,
+    )
+    assert incomplete_partitions == []
+    assert sorted(path.name for path in tmp_path.iterdir()) == [
+        "2022-01-01T01",
+        "2022-01-01T02",
+    ]
+    for partition_directory in tmp_path.iterdir():
+        hour = int(partition_directory.name[-2:])
+        for block_file in partition_directory.iterdir():
+            assert block_time(int(block_file.stem)).hour == hour
+        assert len(list(partition_directory.iterdir())) == 600
+
+
+def test_export_blocks_by_partition_with_failures(fake_sidecar, tmp_path, monkeypatch):
+    import requests
+    from polkadotetl.export import internals, sidecar
+
+    get_block = sidecar.get_block
+
+    def flaky_get_block(sidecar_url, block_number):
+        if block_number == 1000:
+            raise requests.ConnectionError("Connection reset")
+        return get_block(sidecar_url, block_number)
+
+    monkeypatch.setattr(sidecar, "get_block", flaky_get_block)
+    incomplete_partitions = internals.export_blocks_by_partition(
+        tmp_path,
+        "http://sidecar",
+        datetime.datetime(2022, 1, 1, 1, 0),
+        datetime.datetime(2022, 1, 1, 1, 59),
+        internals.Partition.HOUR,
+        retries=1,
+    )
+    assert incomplete_partitions == ["2022-01-01T01"]
+    assert [path.name for path in tmp_path.iterdir()] == [".2022-01-01T01.partial"]
@@ -0,0 +1,105 @@
+"""Tests for verifying exported blocks"""
+import json
+
+
+def block(block_number, finalized=True, success=True):
+    return {
+        "number": str(block_number),
+        "extrinsics": [{"success": success, "events": []}],
+        "finalized": finalized,
+    }
+
+
+def test_verify_blocks(tmp_path):
+    from polkadotetl.core.layout import Layout, block_file_path, write_block_file
+    from polkadotetl.export.verify import format_ranges, verify_blocks
+
+    shards = [tmp_path / "shard-0", tmp_path / "shard-1"]
+    for block_number in range(1000, 1100):
+        if block_number in (1010, 1011, 1012, 1050):
+            continue
+        if block_number == 1020:
+            content = block(block_number, finalized=False)
+        elif block_number == 1030:
+            content = block(
+                block_number,
+                success="Unable to fetch Events, cannot confirm extrinsic status. Check pruning settings on the node.",
+            )
+        else:
+            content = block(block_number)
+        write_block_file(
+            block_file_path(shards[block_number % 2], block_number, Layout.SHARDED),
+            json.dumps(content),
+        )
+    block_file_path(shards[0], 1040, Layout.SHARDED).write_text('{"number": "1040", "extri')
+    block_file_path(shards[0], 1042, Layout.SHARDED).write_text("")
+    # a sampled file that passes the cheap checks but isn't the block it's named after
+    block_file_path(shards[0], 1060, Layout.SHARDED).write_text(json.dumps(block(1061)))
+
+    report = verify_blocks(shards, 1000, 1104, sample_rate=1.0, max_workers=2)
+    assert not report.ok
+    assert report.files == 96
+    assert report.sampled == 94
+    assert format_ranges(report.missing) == "1010-1012,1050,1100-1104"
+    assert report.problems == {
+        "empty": [1042],
+        "truncated": [1040],
+        "corrupt": [1060],
+        "not_finalized": [1020],
+        "pruned": [1030],
+    }
+
+    report = verify_blocks(shards, 1051, 1099, sample_rate=0.0, max_workers=2)
+    assert report.ok
+    assert report.sampled == 0
+
+
+def test_verify_compressed_blocks(tmp_path):
+    import gzip
+
+    from polkadotetl.core.layout import block_file_path
+    from polkadotetl.export.verify import verify_blocks
+
+    for block_number in range(10, 15):
+        block_file_path(tmp_path, block_number, compressed=True).write_bytes(
+            gzip.compress(json.dumps(block(block_number, finalized=block_number != 11)).encode())
+        )
+    path = block_file_path(tmp_path, 12, compressed=True)
+    path.write_bytes(path.read_bytes()[:-10])
+    block_file_path(tmp_path, 13, compressed=True).write_bytes(b"\x1f\x8bnot gzip")
+
+    report = verify_blocks([tmp_path], sample_rate=1.0, max_workers=1)
+    assert report.files == 5
+    assert report.problems["not_finalized"] == [11]
+    assert report.problems["truncated"] == [12]
+    assert report.problems["corrupt"] == [13]
+
+
+def test_verify_blocks_rejects_inverted_range(tmp_path):
+    import pytest
+
+    from polkadotetl.exceptions import InvalidInput
+    from polkadotetl.export.verify import verify_blocks
+
+    with pytest.raises(InvalidInput):
+        verify_blocks([tmp_path], 110, 100, max_workers=1)
+
+
+def test_verify_without_block_files(tmp_path):
+    from typer.testing import CliRunner
+
+    from polkadotetl.cli import app
+    from polkadotetl.export.verify import verify_blocks
+
+    report = verify_blocks([tmp_path], max_workers=1)
+    assert not report.ok
+    assert report.files == 0
+    assert report.missing == []
+    report = verify_blocks([tmp_path], start_block=5, max_workers=1)
+    assert not report.ok
+    assert report.missing == [(5, 5)]
+    assert verify_blocks([tmp_path], end_block=7, max_workers=1).missing == [(7, 7)]
+    assert verify_blocks([tmp_path], 5, 7, max_workers=1).missing == [(5, 7)]
+
+    result = CliRunner().invoke(app, ["verify", str(tmp_path), "--max-workers", "1"])
+    assert result.exit_code == 1